@@ -1,59 +1,149 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
-import gym
-import CannonEnv  # Make sure to import your CannonEnv class
 
-def train_cem(env, n_iterations=100, batch_size=50, elite_frac=0.2, initial_std=10.0):
+from gym_CannonBall.envs.physics import shot_distance, shot_reward
+
+MIN_SPEED = 0.0
+MAX_SPEED = 100.0
+
+
+def n_params(policy, hidden_width=16):
     """
-    Train an agent using the cross-entropy method.
+    Number of parameters of a policy.
 
     Parameters:
-    - env: The environment to train on.
-    - n_iterations: Number of training iterations.
-    - batch_size: Number of samples per iteration.
-    - elite_frac: Fraction of samples to use as elite set.
-    - initial_std: Initial standard deviation of the action distribution.
+    - policy: 'constant' (one global speed), 'linear' or 'mlp' (state-conditioned speed).
+    - hidden_width: Hidden layer width of the 'mlp' policy.
     """
-    n_elite = int(batch_size * elite_frac)
+    if policy == 'constant':
+        return 1
+    if policy == 'linear':
+        return 3
+    if policy == 'mlp':
+        return 4 * hidden_width + 1  # w1 (h, 2), b1 (h,), w2 (h,), b2
+    raise ValueError("Unknown policy '{}', expected 'constant', 'linear' or 'mlp'".format(policy))
 
-    # Initialize mean and standard deviation of the action distribution
-    mean = np.zeros(env.action_space.shape)
-    std = np.full(env.action_space.shape, initial_std)
 
-    for iteration in range(n_iterations):
-        # Sample actions
-        actions = np.random.normal(mean, std, size=(batch_size, env.action_space.shape[0]))
+def policy_actions(params, angle, distance, policy='constant', hidden_width=16):
+    """
+    Speeds chosen by a whole population of policies for a batch of states.
 
-        # Evaluate actions
-        rewards = np.array([evaluate_action(env, action) for action in actions])
+    Parameters:
+    - params: Array of shape (population, n_params(policy)).
+    - angle, distance: Arrays of shape (n_states,) describing the observations.
+    - policy: 'constant', 'linear' or 'mlp'.
+    - hidden_width: Hidden layer width of the 'mlp' policy.
 
-        # Select elite samples
-        elite_idxs = rewards.argsort()[-n_elite:]
-        elite_actions = actions[elite_idxs]
+    Returns:
+    - speeds: Array of shape (population, n_states), clipped to the action bounds.
+    """
+    params = np.atleast_2d(params)
+    # Scale both features to [0, 1]
+    features = np.stack([angle / (np.pi / 2), distance / 1000], axis=1)
+    if policy == 'constant':
+        speeds = np.broadcast_to(params[:, :1], (params.shape[0], features.shape[0]))
+    elif policy == 'linear':
+        speeds = params[:, :2] @ features.T + params[:, 2:3]
+    elif policy == 'mlp':
+        h = hidden_width
+        w1 = params[:, :2 * h].reshape(-1, h, 2)
+        b1 = params[:, 2 * h:3 * h]
+        w2 = params[:, 3 * h:4 * h]
+        b2 = params[:, 4 * h:4 * h + 1]
+        hidden = np.tanh(np.einsum('phf,mf->pmh', w1, features) + b1[:, None, :])
+        speeds = np.einsum('pmh,ph->pm', hidden, w2) + b2
+    else:
+        raise ValueError("Unknown policy '{}', expected 'constant', 'linear' or 'mlp'".format(policy))
+    return np.clip(speeds, MIN_SPEED, MAX_SPEED)
 
-        # Update distribution parameters
-        mean = elite_actions.mean(axis=0)
-        std = elite_actions.std(axis=0)
 
-        print(f"Iteration {iteration + 1}/{n_iterations}: mean reward = {rewards.mean()}")
+def evaluate_population(params, angle, target_distance, policy='constant', hidden_width=16):
+    """
+    Score a population of policies on the same batch of states with one batched physics call.
 
-    return mean
+    Parameters:
+    - params: Array of shape (population, n_params(policy)).
+    - angle, target_distance: Arrays of shape (n_states,) with the start states.
+    - policy: 'constant', 'linear' or 'mlp'.
+    - hidden_width: Hidden layer width of the 'mlp' policy.
+
+    Returns:
+    - rewards: Mean reward of every member over the states, shape (population,).
+    """
+    speeds = policy_actions(params, angle, target_distance, policy, hidden_width)
+    landing = shot_distance(speeds, angle)
+    return shot_reward(speeds, target_distance, landing).mean(axis=1)
 
-def evaluate_action(env, action):
+
+def train_cem(n_iterations=100, batch_size=50, elite_frac=0.2, initial_std=10.0, policy='constant',
+              n_states=256, hidden_width=16, n_workers=1, seed=None, verbose=True):
     """
-    Evaluate a single action in the environment.
+    Train an agent using the cross-entropy method.
 
     Parameters:
-    - env: The environment to evaluate the action in.
-    - action: The action to evaluate.
+    - n_iterations: Number of training iterations.
+    - batch_size: Number of samples (population size) per iteration.
+    - elite_frac: Fraction of samples to use as elite set.
+    - initial_std: Initial standard deviation of the parameter distribution.
+    - policy: 'constant' optimizes one global speed, 'linear' and 'mlp' a speed conditioned on angle and distance.
+    - n_states: Start states every member is scored on per iteration (shared by the whole population).
+    - hidden_width: Hidden layer width of the 'mlp' policy.
+    - n_workers: Processes the population is split across, 1 scores it in the calling process.
+    - seed: Seed of the sampling generator.
+    - verbose: Print the reward and throughput of every iteration.
 
     Returns:
-    - reward: The reward obtained from the action.
+    - mean: Mean of the final parameter distribution.
     """
-    observation, info = env.reset()
-    observation, reward, done, _, info = env.step(action)
-    return reward
+    rng = np.random.default_rng(seed)
+    n_elite = max(1, int(batch_size * elite_frac))
+    dim = n_params(policy, hidden_width)
+
+    # Initialize mean and standard deviation of the parameter distribution
+    mean = np.zeros(dim)
+    std = np.full(dim, initial_std)
+
+    pool = ProcessPoolExecutor(max_workers=n_workers) if n_workers > 1 else None
+    try:
+        for iteration in range(n_iterations):
+            start = time.perf_counter()
+            # Sample parameters and the states they are all scored on
+            params = rng.normal(mean, std, size=(batch_size, dim))
+            angle = rng.uniform(low=0, high=np.pi/2, size=n_states)
+            target_distance = rng.uniform(low=10, high=1000, size=n_states)
+
+            # Evaluate the whole population
+            if pool is None:
+                rewards = evaluate_population(params, angle, target_distance, policy, hidden_width)
+            else:
+                chunks = np.array_split(params, n_workers)
+                futures = [pool.submit(evaluate_population, chunk, angle, target_distance, policy, hidden_width)
+                           for chunk in chunks]
+                rewards = np.concatenate([f.result() for f in futures])
+
+            # Select elite samples
+            elite_idxs = rewards.argsort()[-n_elite:]
+            elite_params = params[elite_idxs]
+
+            # Update distribution parameters
+            mean = elite_params.mean(axis=0)
+            std = elite_params.std(axis=0)
+
+            if verbose:
+                samples_per_s = batch_size * n_states / (time.perf_counter() - start)
+                print(f"Iteration {iteration + 1}/{n_iterations}: mean reward = {rewards.mean():.2f}, "
+                      f"elite reward = {rewards[elite_idxs].mean():.2f}, samples/s = {samples_per_s:.0f}")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return mean
+
 
 if __name__ == "__main__":
-    env = CannonEnv()  # Initialize your environment
-    optimal_action = train_cem(env)
+    optimal_action = train_cem(initial_std=50.0)
     print(f"Optimal initial speed found: {optimal_action}")
+    policy_params = train_cem(n_iterations=200, batch_size=1000, initial_std=5.0, policy='mlp')
+    print(f"State-conditioned MLP policy found: {policy_params}")
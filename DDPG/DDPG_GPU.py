@@ -5,7 +5,18 @@ import torch.nn.functional as F
 import numpy as np
 import copy
 import gym_CannonBall
-from torch.utils.tensorboard import SummaryWriter
+from gym_CannonBall.oracle import regret
+from gym_CannonBall.seeding import BlockSampler, make_rng, spawn_seeds
+from DDPG.checkpoint import Checkpointer
+from DDPG.dataset import ShardLoader
+from DDPG.device_learner import DeviceDDPG
+from DDPG.evaluator import BatchEvaluator
+from DDPG.flat_learner import FlatUpdate
+from DDPG.metrics import MetricsWriter
+from DDPG.normalization import Normalizer, NormalizedReplay
+from DDPG.pretrain import behaviour_cloning
+from DDPG.profiling import PhaseTimer, ProfileWindow
+from DDPG.replay_buffer import ReplayBuffer, CompactReplayBuffer, DeviceReplayBuffer, PrioritizedReplayBuffer, MemmapReplayBuffer
 
 
 class Actor(nn.Module):
@@ -37,132 +48,136 @@ class Critic(nn.Module):
         return q
 
 
-class ReplayBuffer(object):
-    def __init__(self, state_dim, action_dim):
-        self.max_size = int(1e6)
-        self.count = 0
-        self.size = 0
-        self.s = np.zeros((self.max_size, state_dim))
-        self.a = np.zeros((self.max_size, action_dim))
-        self.r = np.zeros((self.max_size, 1))
-        self.s_ = np.zeros((self.max_size, state_dim))
-        self.dw = np.zeros((self.max_size, 1))
-
-    def store(self, s, a, r, s_, dw):
-        self.s[self.count] = s
-        self.a[self.count] = a
-        self.r[self.count] = r
-        self.s_[self.count] = s_
-        self.dw[self.count] = dw
-        self.count = (self.count + 1) % self.max_size  
-        self.size = min(self.size + 1, self.max_size)  
-
-    def sample(self, batch_size):
-        index = np.random.choice(self.size, size=batch_size) 
-        batch_s = torch.tensor(self.s[index], dtype=torch.float)
-        batch_a = torch.tensor(self.a[index], dtype=torch.float)
-        batch_r = torch.tensor(self.r[index], dtype=torch.float)
-        batch_s_ = torch.tensor(self.s_[index], dtype=torch.float)
-        batch_dw = torch.tensor(self.dw[index], dtype=torch.float)
-
-        return batch_s, batch_a, batch_r, batch_s_, batch_dw
+def make_adam(params, lr):
+    # The fused kernel removes most of the per-step optimizer overhead on these small networks,
+    # older torch versions only have it on CUDA and fall back to the multi-tensor implementation
+    params = list(params)
+    try:
+        return torch.optim.Adam(params, lr=lr, fused=True)
+    except (RuntimeError, TypeError):
+        return torch.optim.Adam(params, lr=lr, foreach=True)
 
 
 class DDPG(object):
-    def __init__(self, state_dim, action_dim, max_action):
+    def __init__(self, state_dim, action_dim, max_action, hidden_width=32, batch_size=32,
+                 gamma=0.99, tau=0.005, lr=1e-4):
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.hidden_width = 32  # The number of neurons in hidden layers of the neural network
-        self.batch_size = 32  # batch size
-        self.GAMMA = 0.99  # discount factor
-        self.TAU = 0.005  # Softly update the target network
-        self.lr = 1e-4  # learning rate
+        self.hidden_width = hidden_width  # The number of neurons in hidden layers of the neural network
+        self.batch_size = batch_size  # batch size
+        self.GAMMA = gamma  # discount factor
+        self.TAU = tau  # Softly update the target network
+        self.lr = lr  # learning rate
 
         self.actor = Actor(state_dim, action_dim, self.hidden_width, max_action).to(self.device)
         self.actor_target = copy.deepcopy(self.actor).to(self.device)
         self.critic = Critic(state_dim, action_dim, self.hidden_width).to(self.device)
         self.critic_target = copy.deepcopy(self.critic).to(self.device)
 
-        self.actor_optimizer = torch.optim.Adam(self.actor.parameters(), lr=self.lr)
-        self.critic_optimizer = torch.optim.Adam(self.critic.parameters(), lr=self.lr)
+        self.actor_optimizer = make_adam(self.actor.parameters(), lr=self.lr)
+        self.critic_optimizer = make_adam(self.critic.parameters(), lr=self.lr)
 
         self.MseLoss = nn.MSELoss()
 
+        # Flat parameter lists for the multi-tensor soft update
+        self.actor_params = list(self.actor.parameters())
+        self.critic_params = list(self.critic.parameters())
+        self.actor_target_params = list(self.actor_target.parameters())
+        self.critic_target_params = list(self.critic_target.parameters())
+        # learn_many() runs on flat views of these, without autograd
+        try:
+            self.flat = FlatUpdate(self)
+        except ValueError:  # Layers or optimizer settings the hand-written update does not cover
+            self.flat = None
+
+        # Hot-path timing of learn(), the training script swaps in an enabled timer
+        self.timer = PhaseTimer(enabled=False)
+
     def choose_action(self, s):
         s = torch.unsqueeze(torch.tensor(s, dtype=torch.float), 0).to(self.device)
         a = self.actor(s).data.cpu().numpy().flatten()
         return a
 
     def learn(self, relay_buffer):
-        batch_s, batch_a, batch_r, batch_s_, batch_dw = relay_buffer.sample(self.batch_size)  # Sample a batch
-
-        batch_s = batch_s.to(self.device)
-        batch_a = batch_a.to(self.device)
-        batch_r = batch_r.to(self.device)
-        batch_s_ = batch_s_.to(self.device)
-        batch_dw = batch_dw.to(self.device)
-
-        # Compute the target Q
-        with torch.no_grad():  # target_Q has no gradient
-            Q_ = self.critic_target(batch_s_, self.actor_target(batch_s_))
-            target_Q = batch_r + self.GAMMA * (1 - batch_dw) * Q_
-
-        # Compute the current Q and the critic loss
-        current_Q = self.critic(batch_s, batch_a)
-        critic_loss = self.MseLoss(target_Q, current_Q)
-        # Optimize the critic
-        self.critic_optimizer.zero_grad()
-        critic_loss.backward()
-        self.critic_optimizer.step()
-
-        # Freeze critic networks so you don't waste computational effort
-        for params in self.critic.parameters():
-            params.requires_grad = False
-
-        # Compute the actor loss
-        actor_loss = -self.critic(batch_s, self.actor(batch_s)).mean()
-        # Optimize the actor
-        self.actor_optimizer.zero_grad()
-        actor_loss.backward()
-        self.actor_optimizer.step()
-
-        # Unfreeze critic networks
-        for params in self.critic.parameters():
-            params.requires_grad = True
+        with self.timer.phase('sample'):
+            prioritized = getattr(relay_buffer, 'prioritized', False)
+            if prioritized:  # Prioritized buffers also return importance weights and the sampled indices
+                batch_s, batch_a, batch_r, batch_s_, batch_dw, batch_w, index = relay_buffer.sample(self.batch_size)
+                batch_w = batch_w.to(self.device)
+            else:
+                batch_s, batch_a, batch_r, batch_s_, batch_dw = relay_buffer.sample(self.batch_size)  # Sample a batch
+
+            batch_s = batch_s.to(self.device)
+            batch_a = batch_a.to(self.device)
+            batch_r = batch_r.to(self.device)
+            batch_s_ = batch_s_.to(self.device)
+            batch_dw = batch_dw.to(self.device)
+
+        with self.timer.phase('critic'):
+            # Compute the target Q
+            with torch.no_grad():  # target_Q has no gradient
+                Q_ = self.critic_target(batch_s_, self.actor_target(batch_s_))
+                target_Q = batch_r + self.GAMMA * (1 - batch_dw) * Q_
+
+            # Compute the current Q and the critic loss
+            current_Q = self.critic(batch_s, batch_a)
+            if prioritized:
+                td_error = target_Q - current_Q
+                critic_loss = (batch_w * td_error.pow(2)).mean()
+                relay_buffer.update_priorities(index, td_error.detach().cpu().numpy())
+            else:
+                critic_loss = self.MseLoss(target_Q, current_Q)
+            # Optimize the critic
+            self.critic_optimizer.zero_grad()
+            critic_loss.backward()
+            self.critic_optimizer.step()
+
+        with self.timer.phase('actor'):
+            # Freeze critic networks so you don't waste computational effort
+            for params in self.critic.parameters():
+                params.requires_grad = False
+
+            # Compute the actor loss
+            actor_loss = -self.critic(batch_s, self.actor(batch_s)).mean()
+            # Optimize the actor
+            self.actor_optimizer.zero_grad()
+            actor_loss.backward()
+            self.actor_optimizer.step()
+
+            # Unfreeze critic networks
+            for params in self.critic.parameters():
+                params.requires_grad = True
 
         # Softly update the target networks
-        for param, target_param in zip(self.critic.parameters(), self.critic_target.parameters()):
-            target_param.data.copy_(self.TAU * param.data + (1 - self.TAU) * target_param.data)
-
-        for param, target_param in zip(self.actor.parameters(), self.actor_target.parameters()):
-            target_param.data.copy_(self.TAU * param.data + (1 - self.TAU) * target_param.data)
+        with self.timer.phase('soft_update'):
+            self.soft_update()
+
+    def learn_many(self, relay_buffer, n_updates):
+        # Run n_updates learner steps on batches that are all sampled with a single call
+        # Priorities change after every update, and FlatUpdate only reproduces plain Adam
+        if getattr(relay_buffer, 'prioritized', False) or self.flat is None or not self.flat.supported():
+            for _ in range(n_updates):
+                self.learn(relay_buffer)
+            return
+
+        with self.timer.phase('sample'):
+            # Uniform sampling with replacement, so one big batch splits into n independent ones
+            batches = relay_buffer.sample(self.batch_size * n_updates)
+            batches = [b.to(self.device) for b in batches]
+            batches = [b.reshape(n_updates, self.batch_size, -1) for b in batches]
+        self.flat.update_many(batches, self.timer)
+
+    def soft_update(self):
+        # target = (1 - TAU) * target + TAU * param, over all tensors at once
+        with torch.no_grad():
+            torch._foreach_mul_(self.critic_target_params, 1 - self.TAU)
+            torch._foreach_add_(self.critic_target_params, self.critic_params, alpha=self.TAU)
+            torch._foreach_mul_(self.actor_target_params, 1 - self.TAU)
+            torch._foreach_add_(self.actor_target_params, self.actor_params, alpha=self.TAU)
 
 def reward_adapter(r):
     r = (r + 8) / 8
     return r
 
-def evaluate_policy(env, agent):
-    times = 3  # Perform three evaluations and calculate the average
-    evaluate_reward = 0
-    for _ in range(times):
-        s,_ = env.reset()
-        old_s = s
-        done = False
-        episode_reward = 0
-        while not done:
-            a = agent.choose_action(s)  # We do not add noise when evaluating
-            s_, r, done, _ = env.step(a)
-            episode_reward += r
-            s = s_
-        evaluate_reward += episode_reward
-        print('------'*10)
-        print('State:', np.round(old_s[0],5), old_s[1].astype(int))
-        print('Action:', a)
-        print('Next_observation:', np.round(s_[0],5), s_[1].astype(int))
-        print('Reward:', r)
-        print('------'*10)
-
-    return int(evaluate_reward / times)
-
 # def wandb_init(config: dict) -> None:
 #     wandb.init(
 #         project=config["project"],
@@ -182,41 +197,93 @@ if __name__ == '__main__':
     env_name = ['gym_CannonBall/CannonEnv-v0']
     env_index = 0
     env = gym.make(env_name[env_index])
-    env_evaluate = gym.make(env_name[env_index])  # When evaluating the policy, we need to rebuild an environment
     number = 1
-    # Set random seed
+    # Set random seed, the envs and the exploration noise draw from independent streams spawned from it
     seed = 0
-    env.seed(seed)
+    env_seed, noise_seed = spawn_seeds(seed, 2)
+    env.reset(seed=env_seed)
     env.action_space.seed(seed)
-    env_evaluate.seed(seed)
-    env_evaluate.action_space.seed(seed)
-    #np.random.seed(seed)
-    torch.manual_seed(seed)
+    np.random.seed(seed)  # Prioritized and memmap replay sampling
+    torch.manual_seed(seed)  # Network init, compact and device replay sampling
 
     state_dim = env.observation_space.shape[0]
     action_dim = env.action_space.shape[0]
     max_action = float(env.action_space.high[0])
-    max_episode_steps = 1  # Maximum number of steps per episode
+    max_episode_steps = env.unwrapped._max_episode_steps  # Maximum number of steps (shots) per episode
     print("env={}".format(env_name[env_index]))
     print("state_dim={}".format(state_dim))
     print("action_dim={}".format(action_dim))
     print("max_action={}".format(max_action))
     print("max_episode_steps={}".format(max_episode_steps))
 
-    agent = DDPG(state_dim, action_dim, max_action)
-    replay_buffer = ReplayBuffer(state_dim, action_dim)
-    # Build a tensorboard
-    num = int(np.random.random()*100)
-    writer = SummaryWriter(log_dir='runs/DDPG/DDPG_env_{}_number_{}'.format(env_name[env_index], num, seed))
+    device_learner = False  # Replay sampling on the training device and a torch.compile'd update step (DeviceDDPG)
+    if device_learner:
+        agent = DeviceDDPG(state_dim, action_dim, max_action)
+    else:
+        agent = DDPG(state_dim, action_dim, max_action)
+    pretrain_steps = 0  # Behaviour-cloning steps on the oracle lookup grid before RL training, 0 disables it
+    if pretrain_steps > 0:
+        behaviour_cloning(agent.actor, n_steps=pretrain_steps)
+        agent.actor_target.load_state_dict(agent.actor.state_dict())
+    prioritized_replay = False  # Sample transitions in proportion to their TD error instead of uniformly
+    replay_dir = None  # Keep the replay buffer in memory-mapped files here, e.g. 'replay/DDPG_seed_0'
+    if replay_dir is not None:  # Capacity is bounded by disk, re-running resumes the existing buffer
+        replay_buffer = MemmapReplayBuffer(state_dim, action_dim, replay_dir, max_size=int(1e7))
+    elif device_learner:  # DeviceDDPG samples uniformly
+        replay_buffer = DeviceReplayBuffer(state_dim, action_dim, device=agent.device)
+    elif prioritized_replay:
+        replay_buffer = PrioritizedReplayBuffer(state_dim, action_dim, pin_memory=torch.cuda.is_available())
+    else:
+        replay_buffer = CompactReplayBuffer(state_dim, action_dim, pin_memory=torch.cuda.is_available())
+    # Build a tensorboard, written from a background thread so logging never stalls training
+    num = int(np.random.default_rng().integers(100))  # Unseeded, so every run logs to a directory of its own
+    log_dir = 'runs/DDPG/DDPG_env_{}_number_{}'.format(env_name[env_index], num, seed)
+    metrics_jsonl = False  # Also stream every scalar to <log_dir>/metrics.jsonl
+    writer = MetricsWriter(log_dir=log_dir, jsonl_path=log_dir + '/metrics.jsonl' if metrics_jsonl else None)
 
     noise_std = 0.1 * max_action  # the std of Gaussian noise for exploration
+    noise = BlockSampler(make_rng(noise_seed), lambda rng, n: rng.normal(0, noise_std, size=(n, action_dim)))
     max_train_steps = 3e6  # Maximum number of training steps
     random_steps = 25e3  # Take the random actions in the beginning for the better exploration
     update_freq = 50  # Take 50 steps,then update the networks 50 times
     evaluate_freq = 1e3  # Evaluate the policy every 'evaluate_freq' steps
     evaluate_num = 0  # Record the number of evaluations
     evaluate_rewards = []  # Record the rewards during the evaluating
+    evaluator = BatchEvaluator.from_env(env, num_states=10000, seed=seed)  # Fixed evaluation states, scored in one batch
     total_steps = 0  # Record the total steps during the training
+    train_regret = 0  # Reward lost against the analytic oracle since the last evaluation
+    # The closed-form oracle only holds for vacuum physics and single-shot episodes, as in BatchEvaluator
+    track_regret = env.unwrapped.physics is None and max_episode_steps == 1
+    checkpoint_freq = 5e4  # Save the full trainer state every 'checkpoint_freq' steps
+    normalize = False  # Running observation/return normalization in place of reward_adapter
+    normalizer = Normalizer(state_dim, gamma=agent.GAMMA) if normalize else None
+    # The buffer keeps raw transitions, the learner samples them normalized with the current statistics
+    learn_buffer = replay_buffer if normalizer is None else NormalizedReplay(replay_buffer, normalizer)
+    # One directory per script and learner, a run only ever resumes its own state
+    checkpointer = Checkpointer('checkpoints/DDPG_GPU/{}_number_{}_seed_{}'.format(type(agent).__name__, number, seed))
+    generators = {'action_space': env.action_space.np_random, 'env': env.unwrapped.start_states, 'noise': noise}
+    counters = checkpointer.load(agent, replay_buffer, generators=generators, normalizer=normalizer)  # Resume where the last run stopped
+    if counters is not None:
+        total_steps = counters['total_steps']
+        evaluate_num = counters['evaluate_num']
+        evaluate_rewards = counters['evaluate_rewards']
+        print("resumed from {} at total_steps={}".format(checkpointer.directory, total_steps))
+    warmup_dataset = None  # e.g. 'data/random_1M' from `python -m DDPG.dataset`, replaces the random warm-up
+    if warmup_dataset is not None:
+        if counters is None and normalizer is not None:  # Statistics of the whole dataset before storing any of it
+            normalizer.fit(ShardLoader(warmup_dataset))
+            ShardLoader(warmup_dataset).fill(replay_buffer)
+        elif counters is None:  # A resumed run has its replay buffer back already
+            ShardLoader(warmup_dataset).fill(replay_buffer, reward_fn=lambda r: reward_adapter(r))
+        random_steps = 0
+    profile = False  # Time the hot-path phases and write their histograms to tensorboard every 'profile_freq' steps
+    profile_freq = 1e4
+    profile_window = None  # e.g. ('torch', 30000, 200) or ('cprofile', 30000, 200): profile 200 steps from step 30000
+    timer = PhaseTimer(enabled=profile, sync=torch.cuda.synchronize if agent.device.type == 'cuda' else None)
+    agent.timer = timer
+    profiler = None
+    if profile_window is not None:
+        profiler = ProfileWindow(*profile_window, out_dir='runs/profile/DDPG_number_{}_seed_{}'.format(number, seed))
 
     while total_steps < max_train_steps:
         s, _ = env.reset()
@@ -228,29 +295,44 @@ if __name__ == '__main__':
                 a = env.action_space.sample()
             else:
                 # Add Gaussian noise to actions for exploration
-                a = agent.choose_action(s)
-                a = (a + np.random.normal(0, noise_std, size=action_dim)).clip(-max_action, max_action)
-            s_, r, done, _ = env.step(a)
-            r = reward_adapter(r)
+                with timer.phase('choose_action'):
+                    a = agent.choose_action(s if normalizer is None else normalizer.normalize_obs(s))
+                a = (a + noise()).clip(-max_action, max_action)
+            with timer.phase('env_step'):
+                s_, r, done, _ = env.step(a)
+            if track_regret:
+                train_regret += float(regret(s[0], s[1], a[0]))
             if done and episode_steps != max_episode_steps:
                 dw = True
             else:
                 dw = False
-            replay_buffer.store(s, a, r, s_, dw)  # Store the transition
+            with timer.phase('store'):
+                if normalizer is not None:  # Running statistics in place of reward_adapter
+                    normalizer.update(s, r, done)
+                else:
+                    r = reward_adapter(r)
+                replay_buffer.store(s, a, r, s_, dw)  # Store the transition
             s = s_
 
             # Take 50 steps,then update the networks 50 times
             if total_steps >= random_steps and total_steps % update_freq == 0:
-                for _ in range(update_freq):
-                    agent.learn(replay_buffer)
+                agent.learn_many(learn_buffer, update_freq)
 
             # Evaluate the policy every 'evaluate_freq' steps
             if (total_steps + 1) % evaluate_freq == 0:
                 evaluate_num += 1
-                evaluate_reward = evaluate_policy(env_evaluate, agent)
+                with timer.phase('evaluate'):
+                    evaluate_stats = evaluator(agent if normalizer is None else normalizer.fold(agent.actor))
+                evaluate_reward = evaluate_stats['mean']
                 evaluate_rewards.append(evaluate_reward)
-                print("evaluate_num:{} \t evaluate_reward:{}".format(evaluate_num, evaluate_reward))
-                writer.add_scalar('Reward for episode_{}'.format(env_name[env_index]), evaluate_reward, global_step=total_steps)
+                print("evaluate_num:{} \t evaluate_reward:{:.1f} \t hit_rate:{:.3f}".format(evaluate_num, evaluate_reward, evaluate_stats['hit_rate']))
+                with timer.phase('tensorboard'):
+                    writer.add_scalar('Reward for episode_{}'.format(env_name[env_index]), evaluate_reward, global_step=total_steps)
+                    for key, value in evaluate_stats.items():
+                        writer.add_scalar('Evaluate/{}'.format(key), value, global_step=total_steps)
+                    if track_regret:
+                        writer.add_scalar('Train/regret', train_regret / evaluate_freq, global_step=total_steps)
+                train_regret = 0
                 # writer.add_scalar('Reward for episode 3 episodes', evaluate_reward/3,global_step=total_steps)
                 # Save the rewards
                 # if evaluate_num % 10 == 0:
@@ -264,3 +346,24 @@ if __name__ == '__main__':
                     # print("REWARDS:", np.array(evaluate_rewards))
 
             total_steps += 1
+            if profile and total_steps % profile_freq == 0:
+                with timer.phase('tensorboard'):
+                    timer.write(writer, total_steps)
+            if profiler is not None:
+                profiler.step(total_steps)
+            if total_steps % checkpoint_freq == 0:
+                counters = {'total_steps': total_steps, 'evaluate_num': evaluate_num, 'evaluate_rewards': evaluate_rewards}
+                checkpointer.save(agent, replay_buffer, counters=counters, generators=generators, normalizer=normalizer)
+
+    counters = {'total_steps': total_steps, 'evaluate_num': evaluate_num, 'evaluate_rewards': evaluate_rewards}
+    checkpointer.save(agent, replay_buffer, counters=counters, generators=generators, normalizer=normalizer)
+    checkpointer.wait()
+    if profile:
+        print(timer.report())
+    writer.close()
+    # save model
+    # the observation statistics are folded into the saved actor and critic, so both take raw observations
+    torch.save(agent.actor.state_dict() if normalizer is None else normalizer.fold(agent.actor.state_dict()),
+               'saved_models/actor')
+    torch.save(agent.critic.state_dict() if normalizer is None else normalizer.fold(agent.critic.state_dict()),
+               'saved_models/critic')
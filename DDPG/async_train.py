@@ -0,0 +1,265 @@
+"""
+Asynchronous actor-learner DDPG training.
+
+N collector processes step their own CannonEnv with a copy of the current Actor
+and write transitions into per-collector shared-memory rings. The learner, in the
+main process, drains the rings into the replay buffer and runs DDPG updates at the
+same time. Actor weights are broadcast back through one shared flat tensor every
+`sync_interval` learner updates.
+
+The replay ratio, learner updates per collected env step after the random
+warm-up, is held at `replay_ratio` (1, as in DDPG/DDPG.py, by default) whichever
+side is faster: the learner waits for env steps it has no budget for yet, and
+every collector waits once it is more than its share of `max_lag` env steps
+ahead of the learner's updates. `--replay_ratio 0` runs both sides unthrottled.
+
+    python -m DDPG.async_train --num_collectors 4 --sync_interval 50 --replay_ratio 1
+"""
+import argparse
+import time
+
+import gym
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from torch.nn.utils import parameters_to_vector, vector_to_parameters
+
+import gym_CannonBall
+from gym_CannonBall.seeding import BlockSampler, int_seed, make_rng, spawn_seeds
+from DDPG.DDPG import DDPG, Actor, reward_adapter
+from DDPG.evaluator import BatchEvaluator
+from DDPG.metrics import MetricsWriter
+from DDPG.replay_buffer import CompactReplayBuffer
+
+ctx = mp.get_context('spawn')
+
+
+class SharedWeights(object):
+    # Actor parameters in one shared flat tensor, guarded by a sequence counter.
+    # The counter is odd while the learner is writing, readers keep their old weights if it moved while they copied.
+
+    def __init__(self, actor):
+        self.flat = parameters_to_vector(actor.parameters()).detach().clone().share_memory_()
+        self.version = ctx.RawValue('q', 0)
+
+    def publish(self, actor):
+        self.version.value += 1
+        self.flat.copy_(parameters_to_vector(actor.parameters()).detach())
+        self.version.value += 1
+
+    def pull(self, actor, known_version):
+        # Returns the version now loaded into `actor`
+        version = self.version.value
+        if version == known_version or version % 2:
+            return known_version
+        flat = self.flat.clone()
+        if self.version.value != version:  # Overwritten while copying, try again next time
+            return known_version
+        with torch.no_grad():
+            vector_to_parameters(flat, actor.parameters())
+        return version
+
+
+class TransitionRing(object):
+    # Single-producer single-consumer ring of [s | a | r | s_ | dw] rows in shared memory.
+    # `head` counts rows ever written by the collector and `tail` rows ever read by the learner.
+
+    def __init__(self, capacity, width):
+        self.capacity = capacity
+        self.rows = torch.zeros((capacity, width), dtype=torch.float).share_memory_()
+        self.head = ctx.RawValue('q', 0)
+        self.tail = ctx.RawValue('q', 0)
+
+    def put(self, rows, stop_event):
+        n = rows.shape[0]
+        while self.head.value - self.tail.value + n > self.capacity:  # Learner is behind, wait for room
+            if stop_event.is_set():
+                return False
+            time.sleep(0.001)
+        position = torch.from_numpy((self.head.value + np.arange(n)) % self.capacity)
+        self.rows[position] = torch.from_numpy(rows)
+        self.head.value += n  # Publish only after the rows are written
+        return True
+
+    def get(self):
+        head, tail = self.head.value, self.tail.value
+        if head == tail:
+            return None
+        position = torch.from_numpy(np.arange(tail, head) % self.capacity)
+        rows = self.rows[position].numpy()
+        self.tail.value = head
+        return rows
+
+
+def wait_for_learner(args, steps, updates, stop_event):
+    # Block while this collector's `steps` are past its share of the steps the learner's updates allow
+    random_steps = args.random_steps // args.num_collectors
+    while steps > random_steps + (updates.value / args.replay_ratio + args.max_lag) / args.num_collectors:
+        if stop_event.is_set():
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def collector(rank, args, weights, ring, updates, stop_event):
+    torch.set_num_threads(1)
+    collector_seed = spawn_seeds(args.seed, args.num_collectors)[rank]  # Same stream for the same rank on every run
+    env_seed, noise_seed = spawn_seeds(collector_seed, 2)
+    torch.manual_seed(int_seed(collector_seed))
+
+    env = gym.make(args.env_name)
+    env.reset(seed=env_seed)
+    env.action_space.seed(int_seed(collector_seed))
+    state_dim = env.observation_space.shape[0]
+    action_dim = env.action_space.shape[0]
+    max_action = float(env.action_space.high[0])
+    noise_std = 0.1 * max_action
+    noise = BlockSampler(make_rng(noise_seed), lambda rng, n: rng.normal(0, noise_std, size=(n, action_dim)))
+    random_steps = args.random_steps // args.num_collectors  # Random warm-up is split between collectors
+
+    actor = Actor(state_dim, action_dim, args.hidden_width, max_action)
+    version = weights.pull(actor, -1)
+
+    chunk = np.zeros((args.chunk_size, 2 * state_dim + action_dim + 2), dtype=np.float32)
+    n = 0
+    steps = 0
+    while not stop_event.is_set():
+        s, _ = env.reset()
+        done = False
+        episode_steps = 0
+        while not done:
+            episode_steps += 1
+            if steps < random_steps:
+                a = env.action_space.sample()
+            else:
+                with torch.no_grad():
+                    a = actor(torch.tensor(s, dtype=torch.float).unsqueeze(0)).numpy().flatten()
+                a = (a + noise()).clip(-max_action, max_action)
+            s_, r, done, _ = env.step(a)
+            r = reward_adapter(r, 0)
+            dw = done and episode_steps != env.unwrapped._max_episode_steps
+            chunk[n] = np.concatenate([s, a, [r], s_, [dw]])
+            n += 1
+            steps += 1
+            s = s_
+
+            if n == args.chunk_size:
+                if args.replay_ratio > 0 and not wait_for_learner(args, steps, updates, stop_event):
+                    return
+                if not ring.put(chunk, stop_event):
+                    return
+                n = 0
+                version = weights.pull(actor, version)
+
+
+def main(args):
+    torch.manual_seed(args.seed)
+    np.random.seed(args.seed)
+
+    env = gym.make(args.env_name)
+    state_dim = env.observation_space.shape[0]
+    action_dim = env.action_space.shape[0]
+    max_action = float(env.action_space.high[0])
+
+    agent = DDPG(state_dim, action_dim, max_action, load=False)
+    replay_buffer = CompactReplayBuffer(state_dim, action_dim)
+    evaluator = BatchEvaluator.from_env(env, num_states=10000, seed=args.seed)
+    writer = MetricsWriter(log_dir='runs/DDPG/DDPG_async_env_{}_collectors_{}_seed_{}'.format(
+        args.env_name, args.num_collectors, args.seed))
+
+    args.hidden_width = agent.hidden_width  # Collectors build an Actor of the same shape
+    if args.replay_ratio > 0:  # Collectors stop up to a chunk short of their share, leave room for a full learn_many
+        args.max_lag = max(args.max_lag, args.update_freq / args.replay_ratio
+                           + args.num_collectors * (args.chunk_size + 1))
+    width = 2 * state_dim + action_dim + 2
+    splits = np.cumsum([state_dim, action_dim, 1, state_dim])
+    weights = SharedWeights(agent.actor)
+    rings = [TransitionRing(args.ring_size, width) for _ in range(args.num_collectors)]
+    updates = ctx.RawValue('q', 0)  # Learner updates so far, the collectors' throttle
+    stop_event = ctx.Event()
+    processes = [ctx.Process(target=collector, args=(rank, args, weights, rings[rank], updates, stop_event),
+                             daemon=True)
+                 for rank in range(args.num_collectors)]
+    for p in processes:
+        p.start()
+
+    total_steps = 0  # Env steps received from all collectors
+    total_updates = 0
+    next_evaluate = args.evaluate_freq
+    start = last_report = time.perf_counter()
+    last_steps = last_updates = 0
+    try:
+        while total_steps < args.max_train_steps:
+            received = 0
+            for ring in rings:
+                rows = ring.get()
+                if rows is not None:
+                    s, a, r, s_, dw = np.split(rows, splits, axis=1)
+                    replay_buffer.store(s, a, r, s_, dw)
+                    received += rows.shape[0]
+            total_steps += received
+
+            # Updates the collected steps pay for, no limit with replay_ratio 0
+            budget = args.replay_ratio * (total_steps - args.random_steps) if args.replay_ratio > 0 else np.inf
+            if replay_buffer.size >= args.random_steps and total_updates + args.update_freq <= budget:
+                agent.learn_many(replay_buffer, args.update_freq)
+                total_updates += args.update_freq
+                updates.value = total_updates
+                if total_updates % args.sync_interval < args.update_freq:
+                    weights.publish(agent.actor)
+            elif received == 0:
+                time.sleep(0.001)
+
+            if total_steps >= next_evaluate:
+                next_evaluate += args.evaluate_freq
+                evaluate_stats = evaluator(agent)
+                writer.add_scalar('Reward for episode_{}'.format(args.env_name), evaluate_stats['mean'], global_step=total_steps)
+                for key, value in evaluate_stats.items():
+                    writer.add_scalar('Evaluate/{}'.format(key), value, global_step=total_steps)
+
+            now = time.perf_counter()
+            if now - last_report >= args.report_interval:
+                env_sps = (total_steps - last_steps) / (now - last_report)
+                learn_ups = (total_updates - last_updates) / (now - last_report)
+                replay_ratio = total_updates / max(total_steps - args.random_steps, 1)
+                print('steps:{} \t env steps/s:{:.0f} \t updates/s:{:.0f} \t updates/step:{:.2f}'.format(
+                    total_steps, env_sps, learn_ups, replay_ratio))
+                writer.add_scalar('Throughput/env_steps_per_s', env_sps, global_step=total_steps)
+                writer.add_scalar('Throughput/updates_per_s', learn_ups, global_step=total_steps)
+                writer.add_scalar('Throughput/replay_ratio', replay_ratio, global_step=total_steps)
+                last_report, last_steps, last_updates = now, total_steps, total_updates
+    finally:
+        stop_event.set()
+        for p in processes:
+            p.join(timeout=5)
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    print('collectors:{} \t env steps/s:{:.0f} \t updates/s:{:.0f} \t updates/step:{:.2f}'.format(
+        args.num_collectors, total_steps / elapsed, total_updates / elapsed,
+        total_updates / max(total_steps - args.random_steps, 1)))
+    return agent
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Asynchronous actor-learner DDPG on CannonEnv')
+    parser.add_argument('--env_name', type=str, default='gym_CannonBall/CannonEnv-v0')
+    parser.add_argument('--num_collectors', type=int, default=4, help='Number of collector processes')
+    parser.add_argument('--sync_interval', type=int, default=50, help='Learner updates between actor broadcasts')
+    parser.add_argument('--max_train_steps', type=int, default=int(3e6))
+    parser.add_argument('--random_steps', type=int, default=int(25e3))
+    parser.add_argument('--update_freq', type=int, default=50, help='Learner updates per learn_many call')
+    parser.add_argument('--replay_ratio', type=float, default=1.0,
+                        help='Learner updates per collected env step after the warm-up, 0 disables the bound')
+    parser.add_argument('--max_lag', type=int, default=int(1e4),
+                        help='Env steps the collectors may run ahead of replay_ratio')
+    parser.add_argument('--evaluate_freq', type=int, default=int(1e4))
+    parser.add_argument('--chunk_size', type=int, default=64, help='Transitions a collector writes at once')
+    parser.add_argument('--ring_size', type=int, default=int(1e5), help='Rows in each collector ring')
+    parser.add_argument('--report_interval', type=float, default=10.0, help='Seconds between throughput reports')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser
+
+
+if __name__ == '__main__':
+    main(get_parser().parse_args())
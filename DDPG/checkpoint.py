@@ -0,0 +1,232 @@
+import copy
+import glob
+import os
+import random
+import threading
+
+import numpy as np
+import torch
+
+from gym_CannonBall.seeding import BlockSampler
+from DDPG.replay_buffer import (CompactReplayBuffer, DeviceReplayBuffer, PrioritizedReplayBuffer, MemmapReplayBuffer,
+                                SharedReplayBuffer)
+
+
+def get_generator_state(generator):
+    # Works for np.random.Generator, np.random.RandomState (older gym spaces) and seeding.BlockSampler
+    if isinstance(generator, np.random.RandomState):
+        return generator.get_state()
+    if isinstance(generator, BlockSampler):
+        return generator.state_dict()
+    return generator.bit_generator.state
+
+
+def set_generator_state(generator, state):
+    if isinstance(generator, np.random.RandomState):
+        generator.set_state(state)
+    elif isinstance(generator, BlockSampler):
+        generator.load_state_dict(state)
+    else:
+        generator.bit_generator.state = state
+
+
+class Checkpointer(object):
+    """
+    Atomic, incremental and non-blocking checkpoints of the whole DDPG trainer.
+
+    Every save writes trainer.pt with the actor, critic, both targets, both Adam
+    states, all RNG states, the caller's counters and the running normalization
+    statistics when a Normalizer is passed, plus one replay chunk holding
+    only the transitions stored since the previous save. The state is copied on the
+    calling thread and written by a background thread through temporary files and
+    os.replace, so a crash never leaves a half-written checkpoint behind. Chunks
+    newer than trainer.pt, left by a save that crashed before trainer.pt was
+    replaced, are deleted on load and before the next save, chunks that have been
+    overwritten in the ring are deleted after every save.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.replay_dir = os.path.join(directory, 'replay')
+        os.makedirs(self.replay_dir, exist_ok=True)
+        self.saved_total = 0  # replay_buffer.total at the last save
+        self._thread = None
+        self._error = None
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, 'trainer.pt')
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def save(self, agent, replay_buffer, counters=None, generators=None, normalizer=None):
+        """
+        Snapshot the trainer and write it in the background.
+
+        counters: dict of picklable loop state (step counters, reward history).
+        generators: dict of extra NumPy generators or seeding.BlockSamplers to restore, e.g. env.action_space.np_random.
+        normalizer: normalization.Normalizer whose running statistics are saved too.
+        """
+        self.wait()  # One write in flight at a time
+        # A chunk past the last save would be loaded in place of the one this save writes
+        self._remove_chunks_after(self.saved_total)
+        if isinstance(replay_buffer, DeviceReplayBuffer):  # Staged rows only count once they are on the device
+            replay_buffer.flush()
+        state = {
+            'actor': copy.deepcopy(agent.actor.state_dict()),
+            'critic': copy.deepcopy(agent.critic.state_dict()),
+            'actor_target': copy.deepcopy(agent.actor_target.state_dict()),
+            'critic_target': copy.deepcopy(agent.critic_target.state_dict()),
+            'actor_optimizer': copy.deepcopy(agent.actor_optimizer.state_dict()),
+            'critic_optimizer': copy.deepcopy(agent.critic_optimizer.state_dict()),
+            'rng': {
+                'python': random.getstate(),
+                'numpy': np.random.get_state(),
+                'torch': torch.get_rng_state(),
+                'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+                'generators': {k: get_generator_state(g) for k, g in (generators or {}).items()},
+            },
+            'counters': copy.deepcopy(counters or {}),
+            'normalizer': normalizer.state_dict() if normalizer is not None else None,
+            'replay': self._replay_meta(replay_buffer),
+        }
+        rows, start = self._new_rows(replay_buffer)
+        self.saved_total = state['replay']['total']
+
+        self._thread = threading.Thread(target=self._write, args=(state, rows, start), daemon=True)
+        self._thread.start()
+
+    def wait(self):
+        # Block until the background write is done, re-raising its error if it failed
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def load(self, agent, replay_buffer, generators=None, normalizer=None):
+        """
+        Restore a trainer saved with save(). Returns the saved counters, or None when
+        the directory holds no checkpoint.
+        """
+        if not self.exists():
+            return None
+        state = torch.load(self.path, map_location='cpu', weights_only=False)
+        self._remove_chunks_after(state['replay']['total'])  # Not part of this checkpoint
+        agent.actor.load_state_dict(state['actor'])
+        agent.critic.load_state_dict(state['critic'])
+        agent.actor_target.load_state_dict(state['actor_target'])
+        agent.critic_target.load_state_dict(state['critic_target'])
+        agent.actor_optimizer.load_state_dict(state['actor_optimizer'])
+        agent.critic_optimizer.load_state_dict(state['critic_optimizer'])
+        if normalizer is not None and state.get('normalizer') is not None:
+            normalizer.load_state_dict(state['normalizer'])
+
+        rng = state['rng']
+        random.setstate(rng['python'])
+        np.random.set_state(rng['numpy'])
+        torch.set_rng_state(rng['torch'])
+        if rng['cuda'] is not None and torch.cuda.is_available():
+            torch.cuda.set_rng_state_all(rng['cuda'])
+        for key, generator in (generators or {}).items():
+            if key in rng['generators']:  # Streams added after the checkpoint was written keep their seed
+                set_generator_state(generator, rng['generators'][key])
+
+        self._load_replay(replay_buffer, state['replay'])
+        self.saved_total = state['replay']['total']
+        return state['counters']
+
+    def _write(self, state, rows, start):
+        try:
+            if rows is not None:
+                chunk = os.path.join(self.replay_dir, 'chunk_{:012d}_{:012d}.npy'.format(start, start + rows.shape[0]))
+                with open(chunk + '.tmp', 'wb') as f:
+                    np.save(f, rows)
+                os.replace(chunk + '.tmp', chunk)
+            # trainer.pt goes last, it decides which chunks are part of the checkpoint
+            torch.save(state, self.path + '.tmp')
+            os.replace(self.path + '.tmp', self.path)
+
+            oldest = state['replay']['total'] - state['replay']['max_size']
+            for _, end, chunk in self._chunks():
+                if end <= oldest:
+                    os.remove(chunk)
+        except Exception as error:
+            self._error = error
+
+    def _remove_chunks_after(self, total):
+        for _, end, chunk in self._chunks():
+            if end > total:
+                os.remove(chunk)
+
+    def _chunks(self):
+        chunks = []
+        for chunk in glob.glob(os.path.join(self.replay_dir, 'chunk_*.npy')):
+            start, end = os.path.basename(chunk)[len('chunk_'):-len('.npy')].split('_')
+            chunks.append((int(start), int(end), chunk))
+        return sorted(chunks)
+
+    @staticmethod
+    def _replay_meta(replay_buffer):
+        if isinstance(replay_buffer, MemmapReplayBuffer):
+            return {'total': replay_buffer.size, 'max_size': replay_buffer.max_size}
+        meta = {'total': replay_buffer.total, 'max_size': replay_buffer.max_size}
+        if isinstance(replay_buffer, PrioritizedReplayBuffer):  # Priorities of old rows change too
+            meta['priorities'] = replay_buffer.tree.sum_tree[replay_buffer.tree.capacity:][:replay_buffer.size].copy()
+            meta['max_priority'] = replay_buffer.max_priority
+            meta['beta'] = replay_buffer.beta
+        return meta
+
+    def _new_rows(self, replay_buffer):
+        # Rows stored since the last save, oldest first, as one float32 array
+        if isinstance(replay_buffer, MemmapReplayBuffer):  # Already durable on disk
+            replay_buffer.flush()
+            return None, 0
+        end = replay_buffer.total
+        start = max(self.saved_total, end - replay_buffer.max_size)
+        if end == start:
+            return None, start
+        position = np.arange(start, end) % replay_buffer.max_size
+        if isinstance(replay_buffer, CompactReplayBuffer):
+            storage = replay_buffer.storage
+            rows = storage[torch.from_numpy(position).to(storage.device)].cpu().numpy()
+        elif isinstance(replay_buffer, SharedReplayBuffer):
+            rows = replay_buffer.rows[position]
+        else:
+            fields = (replay_buffer.s, replay_buffer.a, replay_buffer.r, replay_buffer.s_, replay_buffer.dw)
+            rows = np.concatenate([f[position] for f in fields], axis=1).astype(np.float32)
+        return rows, start
+
+    def _load_replay(self, replay_buffer, meta):
+        if isinstance(replay_buffer, MemmapReplayBuffer):
+            return
+        total, max_size = meta['total'], replay_buffer.max_size
+        for start, end, chunk in self._chunks():
+            rows = np.load(chunk)
+            oldest = max(start, total - max_size)  # Skip rows the ring has overwritten since
+            rows = rows[oldest - start:]
+            if rows.shape[0] == 0:
+                continue
+            position = np.arange(oldest, oldest + rows.shape[0]) % max_size
+            if isinstance(replay_buffer, CompactReplayBuffer):
+                storage = replay_buffer.storage
+                storage[torch.from_numpy(position).to(storage.device)] = torch.from_numpy(rows).to(storage.device)
+            elif isinstance(replay_buffer, SharedReplayBuffer):
+                replay_buffer.rows[position] = rows
+            else:
+                fields = (replay_buffer.s, replay_buffer.a, replay_buffer.r, replay_buffer.s_, replay_buffer.dw)
+                splits = np.cumsum([f.shape[1] for f in fields])[:-1]
+                for f, column in zip(fields, np.split(rows, splits, axis=1)):
+                    f[position] = column
+        replay_buffer.total = total
+        if not isinstance(replay_buffer, SharedReplayBuffer):  # Derives count and size from total
+            replay_buffer.count = total % max_size
+            replay_buffer.size = min(total, max_size)
+
+        if 'priorities' in meta:
+            size = replay_buffer.size
+            replay_buffer.tree.update(np.arange(size), meta['priorities'][:size])
+            replay_buffer.max_priority = meta['max_priority']
+            replay_buffer.beta = meta['beta']
@@ -0,0 +1,292 @@
+"""
+Offline transition datasets for CannonEnv.
+
+generate() steps a CannonVecEnv with thousands of cannons per call and writes the
+transitions to `out_dir` as shards of `shard_size` rows, next to a meta.json that
+records the dimensions, the shard list and how the data was made. Actions come
+from one of three policies:
+
+    random  uniform speeds over the action space, what the random_steps warm-up does
+    oracle  the analytic optimal speed, plus `noise_std` Gaussian noise
+    actor   a NumPy policy exported with DDPG.numpy_policy, plus `noise_std` noise
+
+Shards are either .npy float32 row blocks in the [s | a | r | s_ | dw] layout of
+CompactReplayBuffer (the default, they can be memory-mapped) or .npz files with
+one array per field. Rewards are the raw env rewards, reward_fn adapts them on load.
+
+ShardLoader reads the shards back in a background thread, `prefetch` shards
+ahead of the consumer, and hands them to a replay buffer or a pretraining loop:
+
+    python -m DDPG.dataset data/random_1M --n 1000000 --policy random
+
+    loader = ShardLoader('data/random_1M')
+    loader.fill(replay_buffer, reward_fn=lambda r: reward_adapter(r, 0))
+    for s, a, r, s_, dw in ShardLoader('data/oracle_1M', shuffle=True).batches(256):
+        ...
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from gym_CannonBall.envs.CannonBall_vec_env import CannonVecEnv
+from gym_CannonBall.oracle import optimal_speed
+from gym_CannonBall.seeding import make_rng, spawn_seeds
+
+FIELDS = ('s', 'a', 'r', 's_', 'dw')
+POLICIES = ('random', 'oracle', 'actor')
+
+
+def field_dims(state_dim, action_dim):
+    return state_dim, action_dim, 1, state_dim, 1
+
+
+def _save(path, rows, dims):
+    # Write under a temporary name first so a reader never sees a partial shard
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        if path.endswith('.npz'):
+            np.savez(f, **dict(zip(FIELDS, np.split(rows, np.cumsum(dims)[:-1], axis=1))))
+        else:
+            np.save(f, rows)
+    os.replace(tmp, path)
+
+
+def generate(out_dir, n_transitions, policy='random', noise_std=0.0, actor=None, shard_size=int(1e5),
+             num_envs=4096, fmt='npy', physics=None, physics_kwargs=None, max_shots=1, hit_radius=1.0, seed=0):
+    """
+    Write n_transitions transitions of `policy` to `out_dir` and return the meta dict.
+
+    actor: path of a .npz written by numpy_policy.export_actor, for policy='actor'.
+    physics, physics_kwargs, max_shots, hit_radius: passed to CannonVecEnv.
+    """
+    if policy not in POLICIES:
+        raise ValueError("Unknown policy '{}', expected one of {}".format(policy, ', '.join(POLICIES)))
+    if fmt not in ('npy', 'npz'):
+        raise ValueError("Unknown shard format '{}', expected 'npy' or 'npz'".format(fmt))
+    if policy == 'actor':
+        if actor is None:
+            raise ValueError("policy='actor' needs the path of an exported actor")
+        from DDPG.numpy_policy import ActorPolicy
+        actor_policy = ActorPolicy.load(actor)
+
+    env_seed, action_seed = spawn_seeds(seed, 2)
+    rng = make_rng(action_seed)
+    env = CannonVecEnv(num_envs=num_envs, physics=physics, physics_kwargs=physics_kwargs,
+                       max_shots=max_shots, hit_radius=hit_radius)
+    state_dim = env.single_observation_space.shape[0]
+    action_dim = env.single_action_space.shape[0]
+    max_action = float(env.single_action_space.high[0])
+    dims = field_dims(state_dim, action_dim)
+    edges = np.cumsum((0,) + dims)
+
+    os.makedirs(out_dir, exist_ok=True)
+    shard = np.empty((shard_size, edges[-1]), dtype=np.float32)
+    filled = 0
+    shards = []
+    written = 0
+    start = time.perf_counter()
+    s, _ = env.reset(seed=env_seed)
+    while written + filled < n_transitions:
+        if policy == 'random':
+            a = rng.uniform(0, max_action, size=(num_envs, action_dim))
+        else:
+            if policy == 'oracle':
+                a = optimal_speed(s[:, 0], s[:, 1]).reshape(num_envs, action_dim)
+            else:
+                a = np.asarray(actor_policy(s), dtype=np.float64).reshape(num_envs, action_dim)
+            if noise_std > 0:
+                a = (a + rng.normal(0, noise_std, size=a.shape)).clip(-max_action, max_action)
+        shots = env.episode_length + 1  # Shot number of this step, the env resets finished cannons inside step()
+        s_, r, done, info = env.step(a)
+        next_s = np.where(done[:, None], info['final_observation'], s_)
+        dw = done & (shots != max_shots)  # Same rule as the training loop: running out of shots is not terminal
+
+        # Copy the step into the shard, writing the shard out whenever it fills up
+        n = min(num_envs, n_transitions - written - filled)
+        columns = (s, a, r[:, None], next_s, dw[:, None])
+        offset = 0
+        while offset < n:
+            take = min(n - offset, shard_size - filled)
+            for column, lo, hi in zip(columns, edges[:-1], edges[1:]):
+                shard[filled:filled + take, lo:hi] = column[offset:offset + take]
+            filled += take
+            offset += take
+            if filled == shard_size:
+                name = 'shard_{:05d}.{}'.format(len(shards), fmt)
+                _save(os.path.join(out_dir, name), shard, dims)
+                shards.append({'file': name, 'rows': filled})
+                written += filled
+                filled = 0
+        s = s_
+    if filled:
+        name = 'shard_{:05d}.{}'.format(len(shards), fmt)
+        _save(os.path.join(out_dir, name), shard[:filled], dims)
+        shards.append({'file': name, 'rows': filled})
+        written += filled
+
+    meta = {'state_dim': state_dim, 'action_dim': action_dim, 'fields': list(FIELDS), 'dims': list(dims),
+            'transitions': written, 'shards': shards, 'format': fmt, 'policy': policy, 'noise_std': noise_std,
+            'actor': actor, 'physics': physics, 'physics_kwargs': physics_kwargs, 'max_shots': max_shots,
+            'hit_radius': hit_radius, 'seed': seed, 'seconds': round(time.perf_counter() - start, 2)}
+    with open(os.path.join(out_dir, 'meta.json.tmp'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(os.path.join(out_dir, 'meta.json.tmp'), os.path.join(out_dir, 'meta.json'))
+    return meta
+
+
+class ShardLoader(object):
+    """
+    Streams the shards of a generated dataset, reading ahead in a background thread.
+
+    Iterating yields one (s, a, r, s_, dw) tuple of float32 arrays per shard, at most
+    `prefetch` shards are held in memory ahead of the consumer. shuffle=True visits
+    the shards in a random order and shuffles the rows inside each of them.
+    """
+
+    def __init__(self, path, prefetch=2, shuffle=False, seed=0, mmap=False):
+        self.path = path
+        self.prefetch = prefetch
+        self.shuffle = shuffle
+        self.mmap = mmap  # Memory-map .npy shards instead of reading them, only without shuffle
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.state_dim = self.meta['state_dim']
+        self.action_dim = self.meta['action_dim']
+        self._edges = np.cumsum([0] + self.meta['dims'])
+        self._rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return self.meta['transitions']
+
+    def __iter__(self):
+        order = np.arange(len(self.meta['shards']))
+        if self.shuffle:
+            order = self._rng.permutation(order)
+        files = [os.path.join(self.path, self.meta['shards'][i]['file']) for i in order]
+        seeds = self._rng.integers(2**63, size=len(files))
+
+        shards = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._read, args=(files, seeds, shards, stop), name='ShardLoader', daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = shards.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:  # Also runs when the consumer stops early
+            stop.set()
+            while thread.is_alive():
+                try:
+                    shards.get_nowait()
+                except queue.Empty:
+                    thread.join(0.01)
+
+    def _read(self, files, seeds, shards, stop):
+        try:
+            for file, seed in zip(files, seeds):
+                if stop.is_set():
+                    return
+                fields = self._load(file)
+                if self.shuffle:
+                    permutation = np.random.default_rng(seed).permutation(fields[0].shape[0])
+                    fields = tuple(f[permutation] for f in fields)
+                shards.put(fields)
+            shards.put(None)
+        except Exception as error:
+            shards.put(error)
+
+    def _load(self, file):
+        if file.endswith('.npz'):
+            with np.load(file) as data:
+                return tuple(data[name] for name in FIELDS)
+        rows = np.load(file, mmap_mode='r' if self.mmap and not self.shuffle else None)
+        return tuple(rows[:, lo:hi] for lo, hi in zip(self._edges[:-1], self._edges[1:]))
+
+    def batches(self, batch_size, drop_last=True):
+        # Mini-batches of (s, a, r, s_, dw) over one pass of the dataset, carried across shard borders
+        rest = None
+        for fields in self:
+            if rest is not None:
+                fields = tuple(np.concatenate([x, y]) for x, y in zip(rest, fields))
+            n = fields[0].shape[0]
+            end = n - n % batch_size
+            for start in range(0, end, batch_size):
+                yield tuple(f[start:start + batch_size] for f in fields)
+            rest = tuple(f[end:] for f in fields) if end < n else None
+        if rest is not None and not drop_last:
+            yield rest
+
+    def fill(self, replay_buffer, max_transitions=None, reward_fn=None):
+        """
+        Store the dataset in `replay_buffer` shard by shard, returns the number of transitions stored.
+
+        Works with ReplayBuffer and every buffer whose store() takes a batch.
+        reward_fn: applied to the raw reward column, e.g. the training script's reward_adapter.
+        """
+        stored = 0
+        for s, a, r, s_, dw in self:
+            if max_transitions is not None:
+                n = min(s.shape[0], max_transitions - stored)
+                s, a, r, s_, dw = s[:n], a[:n], r[:n], s_[:n], dw[:n]
+            if reward_fn is not None:
+                r = reward_fn(r)
+            store_batch(replay_buffer, s, a, r, s_, dw)
+            stored += s.shape[0]
+            if max_transitions is not None and stored >= max_transitions:
+                break
+        return stored
+
+
+def store_batch(replay_buffer, s, a, r, s_, dw):
+    # ReplayBuffer.store takes one transition, its field arrays are written directly instead
+    from DDPG.replay_buffer import ReplayBuffer
+    if not isinstance(replay_buffer, ReplayBuffer):
+        replay_buffer.store(s, a, r, s_, dw)
+        return
+    n = s.shape[0]
+    max_size = replay_buffer.max_size
+    columns = [np.asarray(x).reshape(n, -1)[-max_size:] for x in (s, a, r, s_, dw)]
+    replay_buffer.total += n
+    if n > max_size:  # Only the most recent max_size rows can survive
+        replay_buffer.count = (replay_buffer.count + n - max_size) % max_size
+        n = max_size
+    position = (replay_buffer.count + np.arange(n)) % max_size
+    fields = (replay_buffer.s, replay_buffer.a, replay_buffer.r, replay_buffer.s_, replay_buffer.dw)
+    for f, column in zip(fields, columns):
+        f[position] = column
+    replay_buffer.count = (replay_buffer.count + n) % max_size
+    replay_buffer.size = min(replay_buffer.size + n, max_size)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Generate a sharded CannonEnv transition dataset')
+    parser.add_argument('out', type=str, help='Output directory')
+    parser.add_argument('--n', type=int, default=int(1e6), help='Number of transitions')
+    parser.add_argument('--policy', type=str, default='random', choices=POLICIES)
+    parser.add_argument('--noise_std', type=float, default=0.0, help='Gaussian action noise of oracle/actor')
+    parser.add_argument('--actor', type=str, default=None, help='.npz from DDPG.numpy_policy, for --policy actor')
+    parser.add_argument('--shard_size', type=int, default=int(1e5))
+    parser.add_argument('--num_envs', type=int, default=4096, help='Cannons stepped per call')
+    parser.add_argument('--format', type=str, default='npy', choices=('npy', 'npz'))
+    parser.add_argument('--physics', type=str, default=None, help="Physics backend, e.g. 'drag'")
+    parser.add_argument('--max_shots', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_parser().parse_args()
+    meta = generate(args.out, args.n, policy=args.policy, noise_std=args.noise_std, actor=args.actor,
+                    shard_size=args.shard_size, num_envs=args.num_envs, fmt=args.format, physics=args.physics,
+                    max_shots=args.max_shots, seed=args.seed)
+    print('{} transitions in {} shards written to {} in {}s'.format(
+        meta['transitions'], len(meta['shards']), args.out, meta['seconds']))
@@ -0,0 +1,148 @@
+"""
+Device-resident DDPG learner with a compilable update step.
+
+DeviceDDPG trains the same Actor/Critic as DDPG/DDPG_GPU.py, but one update is a
+single function of a (batch_size, width) block of replay rows: the losses go
+through torch.func.functional_call and torch.func.grad, Adam and the soft
+update are in-place tensor ops, and the Adam step counters are tensors. Nothing
+in it depends on Python state that changes between updates, so it compiles into
+one graph with torch.compile(fullgraph=True) and is never recompiled. Paired
+with a DeviceReplayBuffer the batches are sampled on the device as well:
+
+    agent = DeviceDDPG(state_dim, action_dim, max_action)
+    replay_buffer = DeviceReplayBuffer(state_dim, action_dim, device=agent.device)
+    agent.learn_many(replay_buffer, 50)
+
+The module/optimizer attributes match DDPG_GPU.DDPG, so BatchEvaluator, the
+Checkpointer and the saved actor/critic files work unchanged. Any other
+CompactReplayBuffer works too, its batch is copied to the device in one transfer.
+"""
+import copy
+
+import torch
+import torch.nn.functional as F
+from torch.func import functional_call, grad
+
+from DDPG.DDPG import Actor, Critic
+from DDPG.profiling import PhaseTimer
+
+
+def make_adam_state(params, lr):
+    # An Adam that only holds the state, the update step applies it. The state is created
+    # up front, with the step counters as device tensors the way capturable Adam keeps them
+    params = list(params)
+    optimizer = torch.optim.Adam(params, lr=lr, capturable=True)
+    for p in params:
+        optimizer.state[p] = {'step': torch.zeros((), dtype=torch.float, device=p.device),
+                              'exp_avg': torch.zeros_like(p, memory_format=torch.preserve_format),
+                              'exp_avg_sq': torch.zeros_like(p, memory_format=torch.preserve_format)}
+    return optimizer
+
+
+class DeviceDDPG(object):
+    def __init__(self, state_dim, action_dim, max_action, device=None, hidden_width=32, batch_size=32,
+                 gamma=0.99, tau=0.005, lr=1e-4, compile=True, compile_mode=None):
+        self.device = torch.device(device or ('cuda' if torch.cuda.is_available() else 'cpu'))
+        self.hidden_width = hidden_width  # The number of neurons in hidden layers of the neural network
+        self.batch_size = batch_size  # batch size
+        self.GAMMA = gamma  # discount factor
+        self.TAU = tau  # Softly update the target network
+        self.lr = lr  # learning rate
+        self.state_dim = state_dim
+        self.action_dim = action_dim
+
+        self.actor = Actor(state_dim, action_dim, self.hidden_width, max_action).to(self.device)
+        self.actor_target = copy.deepcopy(self.actor)
+        self.critic = Critic(state_dim, action_dim, self.hidden_width).to(self.device)
+        self.critic_target = copy.deepcopy(self.critic)
+
+        self.actor_optimizer = make_adam_state(self.actor.parameters(), lr=self.lr)
+        self.critic_optimizer = make_adam_state(self.critic.parameters(), lr=self.lr)
+
+        # name -> parameter, updated in place so the modules always hold the current weights
+        self.actor_params = dict(self.actor.named_parameters())
+        self.critic_params = dict(self.critic.named_parameters())
+        self.actor_target_params = dict(self.actor_target.named_parameters())
+        self.critic_target_params = dict(self.critic_target.named_parameters())
+
+        # The update step, compiled on the first call (slow) and reused for every update after it
+        self.compiled = compile and hasattr(torch, 'compile')
+        self._step = torch.compile(self._update, fullgraph=True, mode=compile_mode) if self.compiled else self._update
+
+        # Hot-path timing of learn(), the training script swaps in an enabled timer
+        self.timer = PhaseTimer(enabled=False)
+
+    def choose_action(self, s):
+        s = torch.unsqueeze(torch.tensor(s, dtype=torch.float), 0).to(self.device)
+        a = self.actor(s).data.cpu().numpy().flatten()
+        return a
+
+    def learn(self, relay_buffer):
+        self.learn_many(relay_buffer, 1)
+
+    def learn_many(self, relay_buffer, n_updates):
+        # n_updates steps on one (n_updates * batch_size, width) sample, every step sees the same shapes
+        if getattr(relay_buffer, 'prioritized', False):
+            raise ValueError('DeviceDDPG samples uniformly, use a DeviceReplayBuffer or CompactReplayBuffer')
+        with self.timer.phase('sample'):
+            rows = relay_buffer.sample_rows(self.batch_size * n_updates).to(self.device, non_blocking=True)
+            rows = rows.reshape(n_updates, self.batch_size, -1)
+        with self.timer.phase('update'):
+            actor_state = self._optimizer_state(self.actor_optimizer, self.actor_params)
+            critic_state = self._optimizer_state(self.critic_optimizer, self.critic_params)
+            for i in range(n_updates):
+                self._step(rows[i], actor_state, critic_state)
+
+    @staticmethod
+    def _optimizer_state(optimizer, params):
+        # Looked up on every call, Checkpointer.load replaces the state tensors
+        state = optimizer.state
+        return {name: (state[p]['step'], state[p]['exp_avg'], state[p]['exp_avg_sq']) for name, p in params.items()}
+
+    def _update(self, rows, actor_state, critic_state):
+        s, a, r, s_, dw = torch.split(rows, [self.state_dim, self.action_dim, 1, self.state_dim, 1], dim=1)
+        with torch.no_grad():  # target_Q has no gradient
+            a_ = functional_call(self.actor_target, self.actor_target_params, (s_,))
+            Q_ = functional_call(self.critic_target, self.critic_target_params, (s_, a_))
+            target_Q = r + self.GAMMA * (1 - dw) * Q_
+
+        critic_grads = grad(self._critic_loss)(self.critic_params, s, a, target_Q)
+        adam_update(self.critic_params, critic_grads, critic_state, self.lr)
+        # Gradients only flow into the actor parameters, the critic is a constant here
+        actor_grads = grad(self._actor_loss)(self.actor_params, self.critic_params, s)
+        adam_update(self.actor_params, actor_grads, actor_state, self.lr)
+
+        # Softly update the target networks: target += TAU * (param - target)
+        with torch.no_grad():
+            for name, target in self.critic_target_params.items():
+                target.lerp_(self.critic_params[name], self.TAU)
+            for name, target in self.actor_target_params.items():
+                target.lerp_(self.actor_params[name], self.TAU)
+
+    def _critic_loss(self, critic_params, s, a, target_Q):
+        return F.mse_loss(functional_call(self.critic, critic_params, (s, a)), target_Q)
+
+    def _actor_loss(self, actor_params, critic_params, s):
+        a = functional_call(self.actor, actor_params, (s,))
+        return -functional_call(self.critic, critic_params, (s, a)).mean()
+
+
+def adam_update(params, grads, state, lr, betas=(0.9, 0.999), eps=1e-8):
+    """
+    torch.optim.Adam with bias correction as in-place tensor ops, for compiled update steps.
+
+    state: name -> (step, exp_avg, exp_avg_sq) of every parameter, step is a tensor.
+    lr: a float, or a tensor that broadcasts against the parameters (one rate per ensemble member).
+    """
+    beta1, beta2 = betas
+    with torch.no_grad():
+        for name, p in params.items():
+            step, exp_avg, exp_avg_sq = state[name]
+            g = grads[name]
+            step.add_(1)
+            exp_avg.lerp_(g, 1 - beta1)
+            exp_avg_sq.mul_(beta2).addcmul_(g, g, value=1 - beta2)
+            bias_correction1 = 1 - beta1 ** step
+            bias_correction2 = 1 - beta2 ** step
+            denom = (exp_avg_sq.sqrt() / bias_correction2.sqrt()).add_(eps)
+            p.sub_(lr / bias_correction1 * exp_avg / denom)
@@ -0,0 +1,117 @@
+import copy
+
+import numpy as np
+
+from gym_CannonBall.envs.physics import MIN_REWARD, MAX_REWARD, shot_distance, make_physics
+from gym_CannonBall.oracle import optimal_reward
+from gym_CannonBall.seeding import make_rng, spawn_seeds
+
+
+class BatchEvaluator(object):
+    """
+    Scores a policy on a fixed, seeded set of CannonEnv start states in one pass.
+
+    The states are drawn once from the same distribution as CannonEnv.reset and
+    every episode is played in lockstep with the others: the Actor is run on all
+    remaining states in a single forward pass per shot and the landing points
+    come from the vectorized shot physics, so nothing is simulated one episode at
+    a time. physics, max_shots and hit_radius are those of the env, from_env()
+    copies them from a training env. Noisy physics get a stream of their own that
+    restarts on every call, so the same policy always gets the same score.
+    Calling the evaluator returns a dict of statistics and prints nothing.
+    NumPy policies such as numpy_policy.ActorPolicy are scored without torch.
+    """
+
+    def __init__(self, num_states=10000, seed=0, hit_radius=1.0, percentiles=(5, 25, 50, 75, 95),
+                 physics=None, physics_kwargs=None, max_shots=1):
+        rng = np.random.default_rng(seed)
+        self.angle = rng.uniform(low=0, high=np.pi/2, size=num_states)
+        self.target_distance = rng.uniform(low=10, high=1000, size=num_states)
+        self.states = np.stack([self.angle, self.target_distance], axis=1).astype(np.float32)
+        self.hit_radius = hit_radius  # A shot landing closer than this to the target counts as a hit
+        self.percentiles = percentiles
+        # A copy, so evaluating never draws from the training env's physics noise
+        self.physics = copy.deepcopy(make_physics(physics, **(physics_kwargs or {})))
+        self.physics_seed = spawn_seeds(seed, 1)[0]
+        self.max_shots = max_shots
+        # The analytic oracle only knows the best single shot in a vacuum
+        self.optimal_reward = optimal_reward(self.angle, self.target_distance) \
+            if self.physics is None and max_shots == 1 else None
+        self._states_tensor = {}
+
+    @classmethod
+    def from_env(cls, env, **kwargs):
+        # Evaluator with the physics, shot budget and hit radius of a CannonEnv or CannonVecEnv, wrapped or not
+        env = getattr(env, 'unwrapped', env)
+        return cls(hit_radius=env.hit_radius, physics=env.physics, max_shots=env._max_episode_steps, **kwargs)
+
+    def actions(self, actor, states=None):
+        # Deterministic actions of `actor` (an Actor or anything with one) for `states`, the evaluation states by default
+        actor = getattr(actor, 'actor', actor)
+        if not hasattr(actor, 'parameters'):  # A NumPy policy, batched (N, 2) -> (N, 1)
+            return np.asarray(actor(self.states if states is None else states))
+        import torch
+        device = next(actor.parameters()).device
+        if states is not None:
+            states = torch.from_numpy(states).to(device)
+        else:
+            if device not in self._states_tensor:
+                self._states_tensor[device] = torch.from_numpy(self.states).to(device)
+            states = self._states_tensor[device]
+        with torch.inference_mode():
+            a = actor(states)
+        return a.cpu().numpy()
+
+    def __call__(self, actor):
+        return self.rollout(lambda states: self.actions(actor, states))
+
+    def score(self, actions):
+        # Statistics of precomputed (N, 1) actions, one per evaluation state, for single-shot evaluators
+        if self.max_shots != 1:
+            raise ValueError('score() takes one shot per state, call the evaluator with the policy when max_shots > 1')
+        return self.rollout(lambda states: actions)
+
+    def rollout(self, policy):
+        """
+        Play every evaluation episode to the end and return the statistics of their returns.
+
+        policy: maps the observations of the episodes still running, None for the
+        first shot of all of them, to their (n, 1) actions.
+        """
+        if hasattr(self.physics, 'rng'):
+            self.physics.rng = make_rng(self.physics_seed)
+        remaining = self.target_distance.copy()  # distance_to_target of CannonEnv
+        returns = np.zeros_like(remaining)
+        hit = np.zeros(remaining.shape, dtype=bool)
+        active = np.arange(remaining.shape[0])
+        states = None
+        for _ in range(self.max_shots):
+            speed = np.asarray(policy(states))[:, 0].astype(np.float64)
+            angle = self.angle[active]
+            if self.physics is None:
+                landing = shot_distance(speed, angle)
+            else:
+                landing = self.physics.landing_distance(speed, angle)
+            # Same update and reward as CannonEnv.step
+            left = remaining[active] - np.copysign(landing, remaining[active])
+            remaining[active] = left
+            returns[active] += np.where(speed <= 0.0, MIN_REWARD, np.maximum(MIN_REWARD, MAX_REWARD - np.abs(left)))
+            done = np.abs(left) <= self.hit_radius
+            hit[active] = done & (speed > 0)
+            active = active[~done]
+            if active.size == 0:
+                break
+            states = np.stack([self.angle[active], np.abs(remaining[active])], axis=1).astype(np.float32)
+
+        miss = np.abs(remaining)
+        stats = {
+            'mean': float(returns.mean()),
+            'std': float(returns.std()),
+            'hit_rate': float(hit.mean()),
+            'mean_miss': float(miss.mean()),
+        }
+        if self.optimal_reward is not None:
+            stats['regret'] = float((self.optimal_reward - returns).mean())
+        for q, value in zip(self.percentiles, np.percentile(returns, self.percentiles)):
+            stats['p{}'.format(q)] = float(value)
+        return stats
@@ -0,0 +1,223 @@
+"""
+Autograd-free DDPG update on flat parameter buffers.
+
+With hidden_width=32 and batch_size=32 an eager update is almost all dispatch
+overhead: autograd builds and walks a graph for two backward passes, Adam runs
+its per-parameter kernels over six tensors per network and the soft update
+touches twelve more. FlatUpdate re-points the actor, critic and both targets at
+views of flat buffers laid out as [actor | critic], so
+
+    - the gradients of the three Linear layers are written straight into a flat
+      gradient buffer by a hand-written backward pass (no autograd graph),
+    - Adam is a handful of in-place ops over one flat tensor per network,
+    - the soft update of both targets is a single lerp_.
+
+The modules keep their Parameter objects, only their storage moves, so
+state_dict(), load_state_dict(), BatchEvaluator and the Checkpointer work
+unchanged. The Adam moments live in the optimizers' own state as views of the
+flat moment buffers, so learn() and learn_many() can be mixed and the
+optimizer state_dicts stay those of torch.optim.Adam:
+
+    agent.flat = FlatUpdate(agent)  # After the modules and optimizers are built
+    if agent.flat.supported():      # Plain Adam, checked again before every call
+        agent.flat.update_many(batches, agent.timer)
+
+The backward pass is written for the l1/l2/l3 Linear layout of Actor and Critic
+and adam() for single-group Adam without weight_decay, amsgrad or maximize.
+FlatUpdate(agent) raises ValueError for any other layout or optimizer, the agents
+then keep learning through learn().
+"""
+import math
+
+import torch
+
+LAYERS = ('l1', 'l2', 'l3')
+
+
+class FlatUpdate(object):
+    def __init__(self, agent):
+        for module in (agent.actor, agent.critic):
+            check_layout(module)
+        self.agent = agent
+        if not self.supported():
+            raise ValueError('FlatUpdate only reproduces single-group torch.optim.Adam '
+                             'without weight_decay, amsgrad or maximize')
+        self.networks = (agent.actor_params, agent.critic_params)
+        params = agent.actor_params + agent.critic_params
+        self.na = sum(p.numel() for p in agent.actor_params)  # Actor first, then the critic
+        self.params = self._flatten(params)
+        self.targets = self._flatten(agent.actor_target_params + agent.critic_target_params)
+        self.grads = torch.zeros_like(self.params)
+        self.exp_avg = torch.zeros_like(self.params)
+        self.exp_avg_sq = torch.zeros_like(self.params)
+
+        # Per-parameter views of every flat buffer, in the order of the parameter lists
+        self.grad_views = self._views(self.grads, params)
+        self.exp_avg_views = self._views(self.exp_avg, params)
+        self.exp_avg_sq_views = self._views(self.exp_avg_sq, params)
+        self._dq = None
+
+    def supported(self):
+        # Settings can change after construction, e.g. through optimizer.load_state_dict
+        return all(plain_adam(optimizer) for optimizer in (self.agent.actor_optimizer, self.agent.critic_optimizer))
+
+    @staticmethod
+    def _flatten(params):
+        flat = torch.cat([p.detach().reshape(-1) for p in params])
+        for p, view in zip(params, FlatUpdate._views(flat, params)):
+            p.data = view
+        return flat
+
+    @staticmethod
+    def _views(flat, params):
+        views, start = [], 0
+        for p in params:
+            views.append(flat[start:start + p.numel()].view_as(p))
+            start += p.numel()
+        return views
+
+    def _split(self, flat):
+        return flat[:self.na], flat[self.na:]
+
+    def _attach(self, optimizer, params, exp_avg_views, exp_avg_sq_views):
+        """
+        Make the optimizer's Adam moments views of the flat buffers and return the step count.
+        Looked up on every call, a fresh optimizer has no state yet and load_state_dict replaces it.
+        """
+        state = optimizer.state
+        fused = optimizer.defaults.get('fused')
+        for p, m, v in zip(params, exp_avg_views, exp_avg_sq_views):
+            entry = state[p]
+            if not entry:  # Same layout as Adam creates on its first step
+                entry['step'] = torch.zeros((), dtype=torch.float, device=p.device if fused else 'cpu')
+                m.zero_()
+                v.zero_()
+            else:
+                if entry['exp_avg'] is not m:
+                    m.copy_(entry['exp_avg'])
+                if entry['exp_avg_sq'] is not v:
+                    v.copy_(entry['exp_avg_sq'])
+            entry['exp_avg'] = m
+            entry['exp_avg_sq'] = v
+        return int(state[params[0]]['step'])
+
+    def update_many(self, batches, timer):
+        """Run one update per (s, a, r, s_, dw) batch in `batches`, timing the phases on `timer`."""
+        agent = self.agent
+        n = len(batches[0])
+        offsets = (0, len(self.networks[0]))
+        steps = [self._attach(optimizer, params, self.exp_avg_views[k:k + len(params)],
+                              self.exp_avg_sq_views[k:k + len(params)])
+                 for optimizer, params, k in zip((agent.actor_optimizer, agent.critic_optimizer), self.networks, offsets)]
+        params, grads = self._split(self.params), self._split(self.grads)
+        exp_avg, exp_avg_sq = self._split(self.exp_avg), self._split(self.exp_avg_sq)
+        groups = (agent.actor_optimizer.param_groups[0], agent.critic_optimizer.param_groups[0])
+        actor_grads = self.grad_views[:offsets[1]]
+        critic_grads = self.grad_views[offsets[1]:]
+
+        with torch.no_grad():
+            for i, (s, a, r, s_, dw) in enumerate(zip(*batches)):
+                with timer.phase('critic'):
+                    self._critic_grads(s, a, r, s_, dw, critic_grads)
+                    adam(params[1], grads[1], exp_avg[1], exp_avg_sq[1], steps[1] + i + 1, groups[1])
+                with timer.phase('actor'):
+                    self._actor_grads(s, actor_grads)
+                    adam(params[0], grads[0], exp_avg[0], exp_avg_sq[0], steps[0] + i + 1, groups[0])
+                with timer.phase('soft_update'):
+                    self.targets.lerp_(self.params, agent.TAU)
+
+        for optimizer, params in zip((agent.actor_optimizer, agent.critic_optimizer), self.networks):
+            for p in params:
+                optimizer.state[p]['step'].add_(n)
+
+    def _critic_grads(self, s, a, r, s_, dw, out):
+        agent = self.agent
+        # target_Q = r + GAMMA * (1 - dw) * Q'(s_, pi'(s_))
+        a_ = actor_forward(agent.actor_target_params, s_, agent.actor.max_action)[0]
+        Q_ = critic_forward(agent.critic_target_params, torch.cat([s_, a_], 1))[0]
+        target_Q = torch.addcmul(r, 1 - dw, Q_, value=agent.GAMMA)
+
+        # MSE loss: dL/dQ = 2 (Q - target_Q) / batch_size
+        x = torch.cat([s, a], 1)
+        Q, h1, h2 = critic_forward(agent.critic_params, x)
+        dq = Q.sub_(target_Q).mul_(2.0 / s.shape[0])
+        linear_backward(agent.critic_params, out, (x, h1, h2), dq)
+
+    def _actor_grads(self, s, out):
+        agent = self.agent
+        max_action = agent.actor.max_action
+        a, z1, z2, t = actor_forward(agent.actor_params, s, max_action)
+        # Actor loss -mean(Q(s, pi(s))): dL/dQ = -1 / batch_size, carried back to the action columns of l1
+        if self._dq is None or self._dq.shape[0] != s.shape[0]:
+            self._dq = torch.full((s.shape[0], 1), -1.0 / s.shape[0], device=s.device)
+        x = torch.cat([s, a], 1)
+        _, h1, h2 = critic_forward(agent.critic_params, x)
+        W1, _, W2, _, W3, _ = agent.critic_params
+        d2 = (self._dq @ W3).mul_(h2 > 0)
+        d1 = (d2 @ W2).mul_(h1 > 0)
+        da = d1 @ W1[:, s.shape[1]:]
+        # a = max_action * tanh(l3)
+        dz3 = da.mul_(1 - t * t).mul_(max_action)
+        linear_backward(agent.actor_params, out, (s, z1, z2), dz3)
+
+
+def check_layout(module):
+    # The hand-written backward pass needs exactly Linear l1, l2, l3 and their weights and biases, in that order
+    layers = [getattr(module, name, None) for name in LAYERS]
+    if [name for name, _ in module.named_children()] != list(LAYERS) \
+            or not all(isinstance(layer, torch.nn.Linear) and layer.bias is not None for layer in layers):
+        raise ValueError('{} is not a three-layer Linear MLP with l1, l2 and l3'.format(type(module).__name__))
+    params = list(module.parameters())
+    expected = [p for layer in layers for p in (layer.weight, layer.bias)]
+    if len(params) != len(expected) or any(p is not q for p, q in zip(params, expected)):
+        raise ValueError('{} has parameters outside l1, l2 and l3'.format(type(module).__name__))
+
+
+def plain_adam(optimizer):
+    # One param group of torch.optim.Adam with the settings adam() implements
+    if type(optimizer) is not torch.optim.Adam or len(optimizer.param_groups) != 1:
+        return False
+    group = optimizer.param_groups[0]
+    return group['weight_decay'] == 0 and not group['amsgrad'] and not group['maximize']
+
+
+def actor_forward(params, s, max_action):
+    # Actor.forward, also returning the hidden activations and tanh output for the backward pass
+    W1, b1, W2, b2, W3, b3 = params
+    z1 = torch.addmm(b1, s, W1.t()).relu_()
+    z2 = torch.addmm(b2, z1, W2.t()).relu_()
+    t = torch.addmm(b3, z2, W3.t()).tanh_()
+    return t * max_action, z1, z2, t
+
+
+def critic_forward(params, x):
+    # Critic.forward on x = cat([s, a], 1), also returning the hidden activations
+    W1, b1, W2, b2, W3, b3 = params
+    h1 = torch.addmm(b1, x, W1.t()).relu_()
+    h2 = torch.addmm(b2, h1, W2.t()).relu_()
+    return torch.addmm(b3, h2, W3.t()), h1, h2
+
+
+def linear_backward(params, out, inputs, d3):
+    # Gradients of Linear-ReLU-Linear-ReLU-Linear given dL/d(l3 output), written into `out`
+    _, _, W2, _, W3, _ = params
+    gW1, gb1, gW2, gb2, gW3, gb3 = out
+    x, h1, h2 = inputs
+    torch.mm(d3.t(), h2, out=gW3)
+    torch.sum(d3, 0, out=gb3)
+    d2 = (d3 @ W3).mul_(h2 > 0)
+    torch.mm(d2.t(), h1, out=gW2)
+    torch.sum(d2, 0, out=gb2)
+    d1 = (d2 @ W2).mul_(h1 > 0)
+    torch.mm(d1.t(), x, out=gW1)
+    torch.sum(d1, 0, out=gb1)
+
+
+def adam(param, grad, exp_avg, exp_avg_sq, step, group):
+    # torch.optim.Adam without weight decay or amsgrad, on one flat tensor
+    beta1, beta2 = group['betas']
+    exp_avg.lerp_(grad, 1 - beta1)
+    exp_avg_sq.mul_(beta2).addcmul_(grad, grad, value=1 - beta2)
+    bias_correction1 = 1 - beta1 ** step
+    denom = exp_avg_sq.sqrt().div_(math.sqrt(1 - beta2 ** step)).add_(group['eps'])
+    param.addcdiv_(exp_avg, denom, value=-group['lr'] / bias_correction1)
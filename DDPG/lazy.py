@@ -0,0 +1,25 @@
+"""
+Deferred import of heavy dependencies.
+
+lazy_import('torch') returns a module object whose real import runs on first
+attribute access, so a module that uses torch all over its methods can still be
+imported for free by tools that never call them. Modules that need a dependency
+in one place import it inside that function instead.
+"""
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    module = sys.modules.get(name)
+    if module is not None:  # Already imported, nothing to defer
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError("No module named '{}'".format(name), name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
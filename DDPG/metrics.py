@@ -0,0 +1,184 @@
+"""
+Background metrics writer.
+
+MetricsWriter has the add_scalar/add_histogram interface of SummaryWriter, but the
+training thread only puts records on a bounded queue. A daemon thread takes them
+off in batches and writes the TensorBoard event file and the optional CSV and
+JSONL streams, so file I/O and flushes never stall the learner. When the queue is
+full, scalars are folded into a per-tag "latest value" table that the thread
+writes once it catches up, and histograms are dropped; `dropped` counts both.
+If the thread dies, flush() and close() re-raise its error on the calling thread.
+"""
+import csv
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+_FLUSH = object()
+_CLOSE = object()
+_POLL_SECS = 0.1  # How often a blocked flush()/close() checks that the thread is still alive
+
+
+def _open(path, **kwargs):
+    # Append to path, creating its directory, None passes through
+    if path is None:
+        return None
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return open(path, 'a', **kwargs)
+
+
+class MetricsWriter(object):
+    def __init__(self, log_dir=None, csv_path=None, jsonl_path=None, tensorboard=True,
+                 max_queue=10000, batch_size=512, flush_secs=10.0):
+        self.log_dir = log_dir
+        self.batch_size = batch_size
+        self.flush_secs = flush_secs
+        self.dropped = 0  # Records that did not fit in the queue
+
+        self._writer = None
+        if tensorboard:
+            from torch.utils.tensorboard import SummaryWriter  # Only import tensorboard when it is written to
+            self._writer = SummaryWriter(log_dir=log_dir)
+        self._csv_file = _open(csv_path, newline='')
+        self._csv = csv.writer(self._csv_file) if self._csv_file is not None else None
+        self._jsonl_file = _open(jsonl_path)
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._overflow = {}  # tag -> latest (value, step, walltime) that did not fit in the queue
+        self._overflow_lock = threading.Lock()
+        self._error = None  # Exception that ended the thread
+        self._thread = threading.Thread(target=self._run, name='MetricsWriter', daemon=True)
+        self._thread.start()
+
+    def add_scalar(self, tag, value, global_step=None, walltime=None):
+        record = ('scalar', tag, float(value), global_step, walltime or time.time())
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._overflow_lock:
+                self._overflow[tag] = record
+                self.dropped += 1
+
+    def add_histogram(self, tag, values, global_step=None, walltime=None):
+        # values are copied, the caller may reuse its buffer right away
+        record = ('histogram', tag, np.array(values, dtype=np.float64), global_step, walltime or time.time())
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._overflow_lock:
+                self.dropped += 1
+
+    def flush(self, timeout=None):
+        # Wait until everything queued so far is written and flushed to disk, False on timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        done = threading.Event()
+        if not self._put((_FLUSH, done), deadline):
+            return False
+        while not done.is_set():
+            self._check_thread()
+            wait = _POLL_SECS if deadline is None else min(_POLL_SECS, deadline - time.monotonic())
+            if wait <= 0:
+                return False
+            done.wait(wait)
+        return True
+
+    def close(self):
+        if self._thread.is_alive() and self._put((_CLOSE, None), None):
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def _put(self, item, deadline):
+        # Queue a control item without blocking forever on a full queue nobody drains
+        while True:
+            self._check_thread()
+            wait = _POLL_SECS if deadline is None else min(_POLL_SECS, deadline - time.monotonic())
+            if wait <= 0:
+                return False
+            try:
+                self._queue.put(item, timeout=wait)
+                return True
+            except queue.Full:
+                pass
+
+    def _check_thread(self):
+        if not self._thread.is_alive():
+            if self._error is not None:
+                raise self._error
+            raise RuntimeError('MetricsWriter is closed')
+
+    def _run(self):
+        try:
+            self._loop()
+        except BaseException as error:  # Re-raised by flush() and close() on the training thread
+            self._error = error
+
+    def _loop(self):
+        last_flush = time.monotonic()
+        running = True
+        while running:
+            try:
+                batch = [self._queue.get(timeout=self.flush_secs)]
+            except queue.Empty:
+                batch = []
+            while batch and len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            events = []
+            records = []
+            for item in batch:
+                if item[0] is _FLUSH:
+                    events.append(item[1])
+                elif item[0] is _CLOSE:
+                    running = False
+                else:
+                    records.append(item)
+            with self._overflow_lock:
+                if self._overflow:
+                    records.extend(self._overflow.values())
+                    self._overflow = {}
+            self._write(records)
+
+            if events or not running or time.monotonic() - last_flush >= self.flush_secs:
+                self._flush_files()
+                last_flush = time.monotonic()
+            for event in events:
+                event.set()
+        self._close_files()
+
+    def _write(self, records):
+        for kind, tag, value, step, walltime in records:
+            if self._writer is not None:
+                if kind == 'scalar':
+                    self._writer.add_scalar(tag, value, global_step=step, walltime=walltime)
+                else:
+                    self._writer.add_histogram(tag, value, global_step=step, walltime=walltime)
+            if kind != 'scalar':
+                continue
+            if self._csv is not None:
+                self._csv.writerow([walltime, step, tag, value])
+            if self._jsonl_file is not None:
+                self._jsonl_file.write(json.dumps({'time': walltime, 'step': step, 'tag': tag, 'value': value}) + '\n')
+
+    def _flush_files(self):
+        if self._writer is not None:
+            self._writer.flush()
+        for f in (self._csv_file, self._jsonl_file):
+            if f is not None:
+                f.flush()
+
+    def _close_files(self):
+        if self._writer is not None:
+            self._writer.close()
+        for f in (self._csv_file, self._jsonl_file):
+            if f is not None:
+                f.close()
@@ -0,0 +1,183 @@
+"""
+Running observation and return normalization between CannonEnv and the agent.
+
+RunningMeanStd keeps a mean and variance per feature and merges whole batches
+into them with the parallel form of Welford's algorithm (Chan et al.), so one
+update costs a few NumPy reductions regardless of the batch size. Normalizer
+puts two of them together:
+
+    observations  (s - mean) / std, clipped to +-clip_obs
+    rewards       r / std(discounted return), clipped to +-clip_reward, replacing reward_adapter
+
+Statistics only change in update() and fit(), and not at all while `frozen` is set.
+The replay buffer keeps raw transitions: NormalizedReplay applies the current
+statistics to every sampled batch, so old transitions are never stuck with the
+statistics of the step they were stored at. fold() writes the observation
+statistics into the first layer of an Actor or Critic, so evaluation, the saved
+models, numpy_policy exports and serving run on raw observations; the folded
+network equals net(normalize_obs(s), ...) wherever the clip is not active.
+"""
+import copy
+
+import numpy as np
+
+
+class RunningMeanStd(object):
+    def __init__(self, shape=(), epsilon=1e-4):
+        self.shape = tuple(shape)
+        self.mean = np.zeros(self.shape)
+        self.var = np.ones(self.shape)
+        self.count = epsilon  # Weight of the initial (0, 1) estimate, keeps the first update well defined
+
+    def update(self, x):
+        # Merge a batch of samples, shape (N,) + shape, into the running moments
+        x = np.asarray(x, dtype=np.float64).reshape((-1,) + self.shape)
+        n = x.shape[0]
+        if n == 0:
+            return
+        batch_mean = x.mean(axis=0)
+        batch_var = x.var(axis=0)
+        delta = batch_mean - self.mean
+        total = self.count + n
+        self.mean = self.mean + delta * (n / total)
+        m2 = self.var * self.count + batch_var * n + delta ** 2 * (self.count * n / total)
+        self.var = m2 / total
+        self.count = total
+
+    def state_dict(self):
+        return {'mean': self.mean.copy(), 'var': self.var.copy(), 'count': self.count}
+
+    def load_state_dict(self, state):
+        self.mean = np.array(state['mean'], dtype=np.float64).reshape(self.shape)
+        self.var = np.array(state['var'], dtype=np.float64).reshape(self.shape)
+        self.count = float(state['count'])
+
+
+class Normalizer(object):
+    """
+    Observation and return statistics of one env or a batch of `num_envs` envs.
+
+        normalizer.update(s, r, done)            # every env step, the raw transition goes to the buffer
+        replay_buffer.store(s, a, r, s_, dw)
+        agent.learn_many(NormalizedReplay(replay_buffer, normalizer), n)  # normalized batches
+        evaluator(normalizer.fold(agent.actor))  # raw-observation Actor, statistics frozen in
+    """
+
+    def __init__(self, state_dim, num_envs=1, gamma=0.99, clip_obs=10.0, clip_reward=10.0, epsilon=1e-8):
+        self.state_dim = state_dim
+        self.gamma = gamma  # Discount of the returns whose std scales the rewards
+        self.clip_obs = clip_obs
+        self.clip_reward = clip_reward
+        self.epsilon = epsilon
+        self.obs_rms = RunningMeanStd(shape=(state_dim,))
+        self.ret_rms = RunningMeanStd(shape=())
+        self.returns = np.zeros(num_envs)  # Discounted return of the running episode of every env
+        self.frozen = False
+
+    def update(self, s, r, done):
+        # One env step, s: (num_envs, state_dim) or (state_dim,), r and done: (num_envs,) or scalars
+        if self.frozen:
+            return
+        self.obs_rms.update(np.asarray(s).reshape(-1, self.state_dim))
+        self.returns = self.returns * self.gamma + np.asarray(r, dtype=np.float64).reshape(-1)
+        self.ret_rms.update(self.returns)
+        self.returns[np.asarray(done, dtype=bool).reshape(-1)] = 0
+
+    def fit(self, batches):
+        # Update from (s, a, r, s_, dw) batches of independent transitions, e.g. a ShardLoader;
+        # every reward counts as a one-step return
+        if self.frozen:
+            return
+        for s, _, r, _, _ in batches:
+            self.obs_rms.update(np.asarray(s).reshape(-1, self.state_dim))
+            self.ret_rms.update(r)
+
+    @property
+    def obs_std(self):
+        return np.sqrt(self.obs_rms.var + self.epsilon)
+
+    def normalize_obs(self, s):
+        z = (np.asarray(s, dtype=np.float64) - self.obs_rms.mean) / self.obs_std
+        return np.clip(z, -self.clip_obs, self.clip_obs).astype(np.float32)
+
+    def normalize_reward(self, r):
+        r = np.asarray(r, dtype=np.float64) / np.sqrt(self.ret_rms.var + self.epsilon)
+        return np.clip(r, -self.clip_reward, self.clip_reward)
+
+    def fold(self, model):
+        """
+        Copy of an Actor or Critic that takes raw observations: the observation columns of l1
+        become W / std and the bias b - W @ (mean / std), a Critic's action columns are kept.
+        Works on the module or its state_dict, returns the same kind.
+        """
+        import torch  # Only folding into a torch network needs torch
+
+        module = model if isinstance(model, torch.nn.Module) else None
+        state = copy.deepcopy(module.state_dict() if module is not None else model)
+        weight, bias = fold_linear(state['l1.weight'].cpu().numpy(), state['l1.bias'].cpu().numpy(),
+                                   self.obs_rms.mean, self.obs_std)
+        state['l1.weight'] = torch.from_numpy(weight).to(state['l1.weight'])
+        state['l1.bias'] = torch.from_numpy(bias).to(state['l1.bias'])
+        if module is None:
+            return state
+        folded = copy.deepcopy(module)
+        folded.load_state_dict(state)
+        return folded
+
+    def state_dict(self):
+        return {'obs_rms': self.obs_rms.state_dict(), 'ret_rms': self.ret_rms.state_dict(),
+                'returns': self.returns.copy()}
+
+    def load_state_dict(self, state):
+        self.obs_rms.load_state_dict(state['obs_rms'])
+        self.ret_rms.load_state_dict(state['ret_rms'])
+        self.returns = np.array(state['returns'], dtype=np.float64)
+
+
+class NormalizedReplay(object):
+    """
+    A replay buffer of raw transitions as the learner sees it: sample() and
+    sample_rows() return the buffer's batch with s and s_ normalized and r scaled
+    by the normalizer's current statistics. Everything else (store, size,
+    prioritized, update_priorities, ...) is the buffer's own.
+    """
+
+    def __init__(self, replay_buffer, normalizer):
+        self.replay_buffer = replay_buffer
+        self.normalizer = normalizer
+
+    def __getattr__(self, name):
+        return getattr(self.replay_buffer, name)
+
+    def sample(self, batch_size):
+        # Prioritized buffers append importance weights and indices, they pass through
+        batch = self.replay_buffer.sample(batch_size)
+        s, a, r, s_, dw = batch[:5]
+        return (self._obs(s), a, self._reward(r), self._obs(s_), dw) + tuple(batch[5:])
+
+    def sample_rows(self, batch_size):
+        # CompactReplayBuffer rows [s | a | r | s_ | dw], normalized in a copy
+        rows = self.replay_buffer.sample_rows(batch_size).clone()
+        s, _, r, s_, _ = self.replay_buffer._slices
+        rows[:, s] = self._obs(rows[:, s])
+        rows[:, r] = self._reward(rows[:, r])
+        rows[:, s_] = self._obs(rows[:, s_])
+        return rows
+
+    def _obs(self, s):
+        n = self.normalizer
+        return ((s - s.new_tensor(n.obs_rms.mean)) / s.new_tensor(n.obs_std)).clamp_(-n.clip_obs, n.clip_obs)
+
+    def _reward(self, r):
+        n = self.normalizer
+        return (r / float(np.sqrt(n.ret_rms.var + n.epsilon))).clamp_(-n.clip_reward, n.clip_reward)
+
+
+def fold_linear(weight, bias, mean, std):
+    # nn.Linear (out, in) weights applied to (x - mean) / std, rewritten as a layer on x;
+    # only the first len(mean) inputs are normalized, a Critic's action columns follow them
+    weight = np.array(weight, dtype=np.float64)
+    k = len(mean)
+    weight[:, :k] /= std
+    bias = np.asarray(bias, dtype=np.float64) - weight[:, :k] @ mean
+    return weight.astype(np.float32), bias.astype(np.float32)
@@ -0,0 +1,113 @@
+"""
+Torch-free inference for a trained Actor.
+
+export_actor() writes the three linear layers of an Actor to a compact .npz and
+ActorPolicy runs the same relu/relu/tanh forward pass with NumPy only, so scoring
+workers never import torch:
+
+    python -m DDPG.numpy_policy saved_models/actor saved_models/actor.npz
+
+    from DDPG.numpy_policy import ActorPolicy
+    policy = ActorPolicy.load('saved_models/actor.npz')
+    speeds = policy(observations)  # observations: (N, 2) array of [angle, distance]
+"""
+import sys
+
+import numpy as np
+
+LAYERS = ('l1', 'l2', 'l3')
+
+
+class ActorPolicy(object):
+    def __init__(self, weights, max_action):
+        # weights: {'l1.weight': (out, in) array, 'l1.bias': (out,) array, ...} as in Actor.state_dict()
+        # Weights are stored transposed so the forward pass is x @ W + b on row-major batches
+        self.layers = [(np.ascontiguousarray(np.asarray(weights[name + '.weight'], dtype=np.float32).T),
+                        np.asarray(weights[name + '.bias'], dtype=np.float32)) for name in LAYERS]
+        self.max_action = np.float32(max_action)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            weights = {key: data[key] for key in data.files if key != 'max_action'}
+            return cls(weights, float(data['max_action']))
+
+    def __call__(self, obs):
+        # Batched forward pass, (N, state_dim) -> (N, action_dim); a single observation gives (action_dim,)
+        obs = np.asarray(obs, dtype=np.float32)
+        x = obs.reshape(-1, obs.shape[-1])
+        (w1, b1), (w2, b2), (w3, b3) = self.layers
+        x = np.maximum(x @ w1 + b1, 0)
+        x = np.maximum(x @ w2 + b2, 0)
+        a = self.max_action * np.tanh(x @ w3 + b3)
+        return a[0] if obs.ndim == 1 else a
+
+
+def export_actor(actor, path, max_action=None, check=True, rtol=1e-5, normalizer=None):
+    """
+    Write Actor weights to `path` (.npz) and return the matching ActorPolicy.
+
+    actor: an Actor, its state_dict, or a file saved with torch.save of either.
+    max_action: required when only a state_dict is given, it is not part of it.
+    check: run both models on random observations and raise if they disagree by more than rtol * max_action.
+    normalizer: the normalization.Normalizer the actor was trained behind, folded into the first
+    layer so the exported policy takes raw observations.
+    """
+    import torch  # Only exporting needs torch
+
+    if isinstance(actor, str):
+        actor = torch.load(actor, map_location='cpu', weights_only=False)
+    if normalizer is not None:
+        actor = normalizer.fold(actor)
+    module = actor if isinstance(actor, torch.nn.Module) else None
+    state_dict = module.state_dict() if module is not None else actor
+    if max_action is None:
+        if module is None:
+            raise ValueError('max_action is required when exporting a state_dict')
+        max_action = module.max_action
+
+    weights = {key: value.detach().cpu().numpy().astype(np.float32) for key, value in state_dict.items()}
+    np.savez(path, max_action=np.float32(max_action), **weights)
+    policy = ActorPolicy.load(path)
+
+    if check:
+        max_error = parity_error(policy, state_dict, max_action)
+        if max_error > rtol * max_action:
+            raise RuntimeError('NumPy policy differs from the torch Actor by {:.3g}'.format(max_error))
+    return policy
+
+
+def parity_error(policy, state_dict, max_action, n=10000, seed=0):
+    # Largest absolute difference between ActorPolicy and the torch Actor over random observations
+    import torch
+    from DDPG.DDPG import Actor
+
+    state_dim = state_dict['l1.weight'].shape[1]
+    action_dim = state_dict['l3.weight'].shape[0]
+    hidden_width = state_dict['l1.weight'].shape[0]
+    actor = Actor(state_dim, action_dim, hidden_width, max_action)
+    actor.load_state_dict(state_dict)
+
+    rng = np.random.default_rng(seed)
+    obs = np.stack([rng.uniform(0, np.pi/2, n), rng.uniform(0, 1000, n)], axis=1).astype(np.float32)
+    with torch.no_grad():
+        expected = actor(torch.from_numpy(obs)).numpy()
+    return float(np.abs(policy(obs) - expected).max())
+
+
+if __name__ == '__main__':
+    import torch
+
+    source = sys.argv[1] if len(sys.argv) > 1 else 'saved_models/actor'
+    target = sys.argv[2] if len(sys.argv) > 2 else 'saved_models/actor.npz'
+
+    actor = torch.load(source, map_location='cpu', weights_only=False)
+    if len(sys.argv) > 3:
+        max_action = float(sys.argv[3])
+    elif isinstance(actor, torch.nn.Module):
+        max_action = actor.max_action
+    else:  # Bare state_dict, use the CannonEnv action bound
+        max_action = 100.0
+    policy = export_actor(actor, target, max_action=max_action)
+    print('Exported {} to {}, max parity error {:.3g}'.format(
+        source, target, parity_error(policy, actor if isinstance(actor, dict) else actor.state_dict(), max_action)))
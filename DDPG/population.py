@@ -0,0 +1,360 @@
+"""
+Population-based training of a batched DDPG ensemble on CannonEnv.
+
+EnsembleDDPG holds P DDPG learners with their weights stacked along a leading
+population axis, weight (P, in, out) and bias (P, 1, out) per layer, so the
+forward and backward passes of all members are single baddbmm calls instead of
+P small matmuls. Every member samples its own batch from its own ring of an
+EnsembleReplayBuffer and has its own lr, tau and gamma, held as (P, 1, 1)
+tensors. One update of the whole population is a single step, eager or
+compiled with torch.compile like DeviceDDPG.
+
+The training loop gives every member one cannon of a CannonVecEnv and an
+exploration noise level. Every --exploit_freq evaluations it runs PBT
+(Jaderberg et al., 2017) truncation selection. The bottom --frac of the
+population copies the weights and optimizer state of a random member of the
+top --frac and perturbs its hyperparameters by 0.8x or 1.2x.
+
+    python -m DDPG.population --population 16 --max_train_steps 200000
+"""
+import argparse
+import copy
+import json
+import math
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.func import functional_call, grad
+
+from gym_CannonBall.envs.CannonBall_vec_env import CannonVecEnv
+from gym_CannonBall.seeding import make_rng, spawn_seeds
+from DDPG.DDPG import Actor, reward_adapter
+from DDPG.device_learner import adam_update
+from DDPG.evaluator import BatchEvaluator
+from DDPG.metrics import MetricsWriter
+from DDPG.profiling import PhaseTimer
+from DDPG.replay_buffer import EnsembleReplayBuffer
+
+# Hyperparameters that PBT explores, with the bounds perturbations are clipped to
+BOUNDS = {'lr': (1e-6, 1e-2), 'tau': (1e-4, 0.1), 'gamma': (0.5, 0.999), 'noise_std': (0.1, 50.0)}
+
+
+class EnsembleLinear(nn.Module):
+    # P independent nn.Linear layers applied with one batched matmul, (P, B, in) -> (P, B, out)
+    def __init__(self, population, in_features, out_features):
+        super(EnsembleLinear, self).__init__()
+        bound = 1 / math.sqrt(in_features)  # The default initialization of nn.Linear
+        self.weight = nn.Parameter(torch.empty(population, in_features, out_features).uniform_(-bound, bound))
+        self.bias = nn.Parameter(torch.empty(population, 1, out_features).uniform_(-bound, bound))
+
+    def forward(self, x):
+        return torch.baddbmm(self.bias, x, self.weight)
+
+
+class EnsembleActor(nn.Module):
+    def __init__(self, population, state_dim, action_dim, hidden_width, max_action):
+        super(EnsembleActor, self).__init__()
+        self.max_action = max_action
+        self.l1 = EnsembleLinear(population, state_dim, hidden_width)
+        self.l2 = EnsembleLinear(population, hidden_width, hidden_width)
+        self.l3 = EnsembleLinear(population, hidden_width, action_dim)
+
+    def forward(self, s):
+        s = F.relu(self.l1(s))
+        s = F.relu(self.l2(s))
+        a = self.max_action * torch.tanh(self.l3(s))
+        return a
+
+
+class EnsembleCritic(nn.Module):
+    def __init__(self, population, state_dim, action_dim, hidden_width):
+        super(EnsembleCritic, self).__init__()
+        self.l1 = EnsembleLinear(population, state_dim + action_dim, hidden_width)
+        self.l2 = EnsembleLinear(population, hidden_width, hidden_width)
+        self.l3 = EnsembleLinear(population, hidden_width, 1)
+
+    def forward(self, s, a):
+        q = F.relu(self.l1(torch.cat([s, a], 2)))
+        q = F.relu(self.l2(q))
+        q = self.l3(q)
+        return q
+
+
+def member_state_dict(module, i):
+    # state_dict of member i in the nn.Linear layout of Actor/Critic
+    state = {}
+    for name, layer in module.named_children():
+        state[name + '.weight'] = layer.weight[i].detach().t().clone()
+        state[name + '.bias'] = layer.bias[i, 0].detach().clone()
+    return state
+
+
+class EnsembleDDPG(object):
+    def __init__(self, population, state_dim, action_dim, max_action, hidden_width=32, batch_size=32,
+                 gamma=0.99, tau=0.005, lr=3e-4, device=None, compile=True):
+        self.device = torch.device(device or ('cuda' if torch.cuda.is_available() else 'cpu'))
+        self.population = population
+        self.state_dim = state_dim
+        self.action_dim = action_dim
+        self.max_action = max_action
+        self.hidden_width = hidden_width
+        self.batch_size = batch_size  # Per member
+        self.dims = [state_dim, action_dim, 1, state_dim, 1]
+
+        self.actor = EnsembleActor(population, state_dim, action_dim, hidden_width, max_action).to(self.device)
+        self.actor_target = copy.deepcopy(self.actor)
+        self.critic = EnsembleCritic(population, state_dim, action_dim, hidden_width).to(self.device)
+        self.critic_target = copy.deepcopy(self.critic)
+
+        self.actor_params = dict(self.actor.named_parameters())
+        self.critic_params = dict(self.critic.named_parameters())
+        self.actor_target_params = dict(self.actor_target.named_parameters())
+        self.critic_target_params = dict(self.critic_target.named_parameters())
+        # Adam state, name -> (step, exp_avg, exp_avg_sq) with one step counter per member
+        self.actor_state = self._adam_state(self.actor_params)
+        self.critic_state = self._adam_state(self.critic_params)
+
+        # Per-member hyperparameters, (P, 1, 1) so they broadcast against the stacked weights
+        self.lr = torch.zeros((population, 1, 1), device=self.device)
+        self.tau = torch.zeros((population, 1, 1), device=self.device)
+        self.gamma = torch.zeros((population, 1, 1), device=self.device)
+        self.set_hyperparameters(lr=lr, tau=tau, gamma=gamma)
+
+        self.compiled = compile and hasattr(torch, 'compile')
+        self._step = torch.compile(self._update, fullgraph=True) if self.compiled else self._update
+
+        # Hot-path timing of learn_many(), the training loop swaps in an enabled timer
+        self.timer = PhaseTimer(enabled=False)
+
+    def _adam_state(self, params):
+        return {name: (torch.zeros((self.population, 1, 1), device=self.device), torch.zeros_like(p),
+                       torch.zeros_like(p)) for name, p in params.items()}
+
+    def set_hyperparameters(self, **values):
+        # A scalar sets every member, a sequence of length P sets them one by one
+        for name, value in values.items():
+            value = torch.as_tensor(np.asarray(value, dtype=np.float32), device=self.device)
+            getattr(self, name).copy_(value.expand(self.population).reshape(-1, 1, 1))
+
+    def hyperparameters(self):
+        return {name: getattr(self, name).reshape(-1).cpu().numpy() for name in ('lr', 'tau', 'gamma')}
+
+    def choose_action(self, s):
+        # One observation per member, (P, state_dim) -> (P, action_dim)
+        s = torch.as_tensor(np.asarray(s, dtype=np.float32), device=self.device).reshape(self.population, 1, -1)
+        with torch.no_grad():
+            a = self.actor(s)
+        return a.reshape(self.population, -1).cpu().numpy()
+
+    def learn_many(self, replay_buffer, n_updates):
+        # n_updates population steps, every member on its own n_updates * batch_size sample
+        with self.timer.phase('sample'):
+            rows = replay_buffer.sample_rows(self.batch_size * n_updates)
+            rows = rows.reshape(self.population, n_updates, self.batch_size, -1)
+        with self.timer.phase('update'):
+            for i in range(n_updates):
+                self._step(rows[:, i])
+
+    def _update(self, rows):
+        s, a, r, s_, dw = torch.split(rows, self.dims, dim=2)
+        with torch.no_grad():
+            a_ = functional_call(self.actor_target, self.actor_target_params, (s_,))
+            Q_ = functional_call(self.critic_target, self.critic_target_params, (s_, a_))
+            target_Q = r + self.gamma * (1 - dw) * Q_
+
+        critic_grads = grad(self._critic_loss)(self.critic_params, s, a, target_Q)
+        adam_update(self.critic_params, critic_grads, self.critic_state, self.lr)
+        actor_grads = grad(self._actor_loss)(self.actor_params, self.critic_params, s)
+        adam_update(self.actor_params, actor_grads, self.actor_state, self.lr)
+
+        with torch.no_grad():
+            for name, target in self.critic_target_params.items():
+                target.lerp_(self.critic_params[name], self.tau)
+            for name, target in self.actor_target_params.items():
+                target.lerp_(self.actor_params[name], self.tau)
+
+    # The losses are sums of per-member means, so every member's gradient is that of its own DDPG loss
+    def _critic_loss(self, critic_params, s, a, target_Q):
+        current_Q = functional_call(self.critic, critic_params, (s, a))
+        return (current_Q - target_Q).pow(2).mean(dim=(1, 2)).sum()
+
+    def _actor_loss(self, actor_params, critic_params, s):
+        a = functional_call(self.actor, actor_params, (s,))
+        return -functional_call(self.critic, critic_params, (s, a)).mean(dim=(1, 2)).sum()
+
+    def copy_members(self, src, dst):
+        # Member dst[k] takes over the weights, targets and optimizer state of member src[k]
+        src = torch.as_tensor(np.asarray(src), dtype=torch.long, device=self.device)
+        dst = torch.as_tensor(np.asarray(dst), dtype=torch.long, device=self.device)
+        tensors = [*self.actor_params.values(), *self.critic_params.values(),
+                   *self.actor_target_params.values(), *self.critic_target_params.values()]
+        for state in (self.actor_state, self.critic_state):
+            for step, exp_avg, exp_avg_sq in state.values():
+                tensors += [step, exp_avg, exp_avg_sq]
+        with torch.no_grad():
+            for t in tensors:
+                t.index_copy_(0, dst, t.index_select(0, src))
+
+    def evaluate(self, evaluator):
+        # BatchEvaluator statistics of every member, single shots are scored with one forward pass
+        if evaluator.max_shots > 1:  # The members' episodes diverge after the first shot
+            return [evaluator(self.member_actor(i)) for i in range(self.population)]
+        states = torch.from_numpy(evaluator.states).to(self.device)
+        with torch.no_grad():
+            actions = self.actor(states.expand(self.population, -1, -1)).cpu().numpy()
+        return [evaluator.score(actions[i]) for i in range(self.population)]
+
+    def member_actor(self, i):
+        # Member i as a standalone Actor, e.g. to save it or export it with numpy_policy
+        actor = Actor(self.state_dim, self.action_dim, self.hidden_width, self.max_action)
+        actor.load_state_dict(member_state_dict(self.actor, i))
+        return actor
+
+
+def exploit_explore(scores, hyper, rng, frac=0.25, factors=(0.8, 1.2)):
+    """
+    PBT truncation selection. The bottom `frac` of the members by score each pick a
+    random member of the top `frac` and take its hyperparameters times 0.8 or 1.2.
+    gamma is perturbed through its horizon 1 / (1 - gamma).
+
+    hyper: name -> (P,) array, updated in place. Returns the (src, dst) member indices.
+    """
+    population = len(scores)
+    k = int(population * frac)
+    if k == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    order = np.argsort(scores)
+    dst, src = order[:k], rng.choice(order[-k:], size=k)
+    for name, values in hyper.items():
+        factor = rng.choice(factors, size=k)
+        if name == 'gamma':
+            values[dst] = 1 - (1 - values[src]) / factor
+        else:
+            values[dst] = values[src] * factor
+        values[dst] = np.clip(values[dst], *BOUNDS[name])
+    return src, dst
+
+
+def sample_hyperparameters(args, rng):
+    # Initial hyperparameters of every member, log-uniform over the ranges given on the command line
+    hyper = {}
+    for name in BOUNDS:
+        low, high = getattr(args, name)
+        hyper[name] = np.exp(rng.uniform(math.log(low), math.log(high), size=args.population))
+    return hyper
+
+
+def main(args):
+    population = args.population
+    rng_seed, env_seed = spawn_seeds(args.seed, 2)
+    rng = make_rng(rng_seed)
+    torch.manual_seed(args.seed)
+    torch.set_num_threads(args.threads)
+
+    env = CannonVecEnv(num_envs=population, max_shots=args.max_shots)  # One cannon per member
+    state_dim = env.single_observation_space.shape[0]
+    action_dim = env.single_action_space.shape[0]
+    max_action = float(env.single_action_space.high[0])
+    max_episode_steps = env._max_episode_steps
+
+    hyper = sample_hyperparameters(args, rng)
+    agent = EnsembleDDPG(population, state_dim, action_dim, max_action, hidden_width=args.hidden_width,
+                         batch_size=args.batch_size, device=args.device, compile=not args.no_compile,
+                         **{name: hyper[name] for name in ('lr', 'tau', 'gamma')})
+    replay_buffer = EnsembleReplayBuffer(population, state_dim, action_dim, max_size=args.buffer_size,
+                                         device=agent.device)
+    evaluator = BatchEvaluator.from_env(env, num_states=args.evaluate_states, seed=args.seed)
+    os.makedirs(args.out, exist_ok=True)
+    writer = MetricsWriter(log_dir=args.out)
+    events = open(os.path.join(args.out, 'pbt.jsonl'), 'a')
+    print('population={} \t hidden_width={} \t batch_size={} \t device={} \t out={}'.format(
+        population, args.hidden_width, args.batch_size, agent.device, args.out))
+
+    scores = np.full(population, -np.inf)
+    evaluate_num = 0
+    start = time.perf_counter()
+    s, _ = env.reset(seed=env_seed)
+    for total_steps in range(args.max_train_steps):
+        if total_steps < args.random_steps:
+            a = rng.uniform(0, max_action, size=(population, action_dim))
+        else:
+            a = agent.choose_action(s)
+            a = (a + rng.normal(size=a.shape) * hyper['noise_std'][:, None]).clip(-max_action, max_action)
+        shots = env.episode_length + 1
+        s_, r, done, info = env.step(a)
+        next_s = np.where(done[:, None], info['final_observation'], s_)
+        dw = done & (shots != max_episode_steps)
+        replay_buffer.store(s, a, reward_adapter(r, 0), next_s, dw)
+        s = s_
+
+        if total_steps >= args.random_steps and total_steps % args.update_freq == 0:
+            agent.learn_many(replay_buffer, args.update_freq)
+
+        if (total_steps + 1) % args.evaluate_freq == 0:
+            evaluate_num += 1
+            stats = agent.evaluate(evaluator)
+            scores = np.array([member['mean'] for member in stats])
+            for i, member in enumerate(stats):
+                writer.add_scalar('Member_{}/evaluate_reward'.format(i), member['mean'], global_step=total_steps)
+                for name, values in hyper.items():
+                    writer.add_scalar('Member_{}/{}'.format(i, name), values[i], global_step=total_steps)
+            writer.add_scalar('Population/best_reward', scores.max(), global_step=total_steps)
+            writer.add_scalar('Population/median_reward', np.median(scores), global_step=total_steps)
+            print('evaluate_num:{} \t steps:{} \t best:{:.1f} \t median:{:.1f} \t member_steps/s:{:.0f}'.format(
+                evaluate_num, total_steps + 1, scores.max(), np.median(scores),
+                population * (total_steps + 1) / (time.perf_counter() - start)))
+
+            if total_steps >= args.random_steps and evaluate_num % args.exploit_freq == 0:
+                src, dst = exploit_explore(scores, hyper, rng, frac=args.frac)
+                agent.copy_members(src, dst)
+                agent.set_hyperparameters(**{name: hyper[name] for name in ('lr', 'tau', 'gamma')})
+                for i, j in zip(src, dst):
+                    events.write(json.dumps({'step': total_steps + 1, 'src': int(i), 'dst': int(j),
+                                             'src_reward': float(scores[i]), 'dst_reward': float(scores[j]),
+                                             **{name: float(values[j]) for name, values in hyper.items()}}) + '\n')
+                events.flush()
+
+    events.close()
+    writer.close()
+    best = int(np.argmax(scores))
+    torch.save(agent.member_actor(best).state_dict(), os.path.join(args.out, 'actor'))
+    print('{:>6} {:>9} {:>10} {:>8} {:>7} {:>9}'.format('member', 'reward', 'lr', 'tau', 'gamma', 'noise_std'))
+    for i in np.argsort(-scores):
+        print('{:>6} {:>9.2f} {:>10.2e} {:>8.4f} {:>7.4f} {:>9.2f}'.format(
+            i, scores[i], hyper['lr'][i], hyper['tau'][i], hyper['gamma'][i], hyper['noise_std'][i]))
+    print('Best member {} saved to {}'.format(best, os.path.join(args.out, 'actor')))
+    return scores, hyper
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Population-based training of a batched DDPG ensemble')
+    parser.add_argument('--population', type=int, default=16)
+    parser.add_argument('--hidden_width', type=int, default=32)
+    parser.add_argument('--batch_size', type=int, default=32, help='Batch size of every member')
+    parser.add_argument('--lr', type=float, nargs=2, default=[1e-4, 1e-3], help='Initial range, log-uniform')
+    parser.add_argument('--tau', type=float, nargs=2, default=[1e-3, 1e-2])
+    parser.add_argument('--gamma', type=float, nargs=2, default=[0.9, 0.99])
+    parser.add_argument('--noise_std', type=float, nargs=2, default=[5.0, 20.0], help='Exploration noise, in speed')
+    parser.add_argument('--max_train_steps', type=int, default=int(2e5), help='Env steps of every member')
+    parser.add_argument('--random_steps', type=int, default=int(25e3))
+    parser.add_argument('--update_freq', type=int, default=50)
+    parser.add_argument('--evaluate_freq', type=int, default=int(5e3))
+    parser.add_argument('--evaluate_states', type=int, default=10000)
+    parser.add_argument('--exploit_freq', type=int, default=2, help='Evaluations between PBT exploit/explore rounds')
+    parser.add_argument('--frac', type=float, default=0.25, help='Fraction of the population replaced per round')
+    parser.add_argument('--buffer_size', type=int, default=int(2e5), help='Replay capacity of every member')
+    parser.add_argument('--max_shots', type=int, default=1)
+    parser.add_argument('--device', type=str, default=None)
+    parser.add_argument('--no_compile', action='store_true', help='Run the population update step eagerly')
+    parser.add_argument('--threads', type=int, default=1, help='torch intra-op threads')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', type=str, default='runs/population/{}'.format(time.strftime('%Y%m%d-%H%M%S')))
+    return parser
+
+
+if __name__ == '__main__':
+    main(get_parser().parse_args())
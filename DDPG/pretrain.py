@@ -0,0 +1,29 @@
+import numpy as np
+
+from gym_CannonBall.oracle import OracleGrid
+
+
+def behaviour_cloning(actor, n_steps=5000, batch_size=256, lr=3e-3, grid=None, seed=0):
+    """
+    Regress `actor` onto the oracle's optimal speeds before RL training starts.
+
+    States are drawn like CannonEnv.reset and labelled by an interpolated OracleGrid
+    lookup, so no environment is stepped. Returns the final MSE loss.
+    """
+    import torch
+    import torch.nn.functional as F
+
+    grid = grid if grid is not None else OracleGrid()
+    rng = np.random.default_rng(seed)
+    device = next(actor.parameters()).device
+    optimizer = torch.optim.Adam(actor.parameters(), lr=lr)
+    loss = torch.zeros(())
+    for _ in range(n_steps):
+        obs = np.stack([rng.uniform(0, np.pi/2, batch_size), rng.uniform(10, 1000, batch_size)], axis=1)
+        target = torch.from_numpy(grid(obs).astype(np.float32)).to(device)
+        obs = torch.from_numpy(obs.astype(np.float32)).to(device)
+        loss = F.mse_loss(actor(obs), target)
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+    return float(loss)
@@ -0,0 +1,179 @@
+"""
+Hot-path timing for the training loops.
+
+PhaseTimer measures named phases (env step, replay store, sampling, critic and
+actor updates, logging) with time.perf_counter, keeps the last `window` durations
+of every phase in a ring buffer and writes them to TensorBoard as histograms.
+A disabled timer hands out one shared no-op context manager, so the
+instrumentation can stay in the loop permanently.
+
+ProfileWindow wraps a window of training steps in torch.profiler or cProfile and
+dumps the trace when the window closes.
+"""
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import time
+
+import numpy as np
+
+_NULL = contextlib.nullcontext()
+
+
+class _Phase(object):
+    # Reusable context manager of one phase, nothing is allocated per measurement
+    __slots__ = ('timer', 'name', 'start')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        if self.timer.sync is not None:
+            self.timer.sync()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.timer.sync is not None:
+            self.timer.sync()
+        self.timer.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class PhaseTimer(object):
+    """
+    Per-phase wall time with rolling histograms.
+
+        timer = PhaseTimer(enabled=True)
+        with timer.phase('env_step'):
+            env.step(a)
+        timer.write(writer, total_steps)
+
+    sync: called before and after every phase, e.g. torch.cuda.synchronize, so
+    asynchronous GPU work is charged to the phase that launched it.
+    """
+
+    def __init__(self, enabled=True, window=10000, sync=None):
+        self.enabled = enabled
+        self.window = window
+        self.sync = sync
+        self._phases = {}
+        self._samples = {}  # name -> ring buffer of the last `window` durations in seconds
+        self._count = {}  # name -> measurements since the start
+        self._total = {}  # name -> seconds since the start
+        self._started = time.perf_counter()
+
+    def phase(self, name):
+        if not self.enabled:
+            return _NULL
+        phase = self._phases.get(name)
+        if phase is None:
+            phase = self._phases[name] = _Phase(self, name)
+        return phase
+
+    def add(self, name, seconds):
+        count = self._count.get(name, 0)
+        if count == 0:
+            self._samples[name] = np.zeros(self.window)
+            self._total[name] = 0.0
+        self._samples[name][count % self.window] = seconds
+        self._count[name] = count + 1
+        self._total[name] += seconds
+
+    def summary(self):
+        # name -> {'count', 'total_s', 'mean_ms', 'p50_ms', 'p99_ms', 'share'} over the recorded phases
+        elapsed = time.perf_counter() - self._started
+        stats = {}
+        for name, count in self._count.items():
+            recent = self._samples[name][:min(count, self.window)] * 1e3
+            p50, p99 = np.percentile(recent, [50, 99])
+            stats[name] = {
+                'count': count,
+                'total_s': self._total[name],
+                'mean_ms': self._total[name] / count * 1e3,
+                'p50_ms': float(p50),
+                'p99_ms': float(p99),
+                'share': self._total[name] / elapsed,  # Fraction of the wall time spent in this phase
+            }
+        return stats
+
+    def write(self, writer, step):
+        # Histograms of the recent durations (ms) and the scalar summary of every phase
+        if not self.enabled:
+            return
+        for name, stats in self.summary().items():
+            recent = self._samples[name][:min(self._count[name], self.window)] * 1e3
+            writer.add_histogram('Time/{}_ms'.format(name), recent, global_step=step)
+            writer.add_scalar('Time/{}_mean_ms'.format(name), stats['mean_ms'], global_step=step)
+            writer.add_scalar('Time/{}_share'.format(name), stats['share'], global_step=step)
+
+    def report(self):
+        lines = ['{:<20} {:>10} {:>10} {:>10} {:>10} {:>7}'.format('phase', 'count', 'mean_ms', 'p50_ms', 'p99_ms', 'share')]
+        for name, s in sorted(self.summary().items(), key=lambda item: -item[1]['total_s']):
+            lines.append('{:<20} {:>10} {:>10.4f} {:>10.4f} {:>10.4f} {:>6.1%}'.format(
+                name, s['count'], s['mean_ms'], s['p50_ms'], s['p99_ms'], s['share']))
+        return '\n'.join(lines)
+
+
+class ProfileWindow(object):
+    """
+    Profiles training steps [start_step, start_step + n_steps) and dumps the result to `out_dir`.
+
+    kind='torch': torch.profiler with CPU (and CUDA when available) activities,
+    writes trace.json for chrome://tracing or Perfetto and ops.txt with the op table.
+    kind='cprofile': cProfile, writes profile.prof for snakeviz/pstats and profile.txt.
+    Call step(total_steps) once per training step.
+    """
+
+    def __init__(self, kind, start_step, n_steps, out_dir):
+        if kind not in ('torch', 'cprofile'):
+            raise ValueError("Unknown profiler '{}', expected 'torch' or 'cprofile'".format(kind))
+        self.kind = kind
+        self.start_step = start_step
+        self.stop_step = start_step + n_steps
+        self.out_dir = out_dir
+        self._profiler = None
+        self.done = False
+
+    def step(self, total_steps):
+        if self.done:
+            return
+        if self._profiler is None and total_steps >= self.start_step:
+            self._start()
+        elif self._profiler is not None and total_steps >= self.stop_step:
+            self._stop()
+
+    def _start(self):
+        if self.kind == 'torch':
+            import torch
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self._profiler = torch.profiler.profile(activities=activities, record_shapes=True)
+            self._profiler.__enter__()
+        else:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def _stop(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        if self.kind == 'torch':
+            self._profiler.__exit__(None, None, None)
+            self._profiler.export_chrome_trace(os.path.join(self.out_dir, 'trace.json'))
+            table = self._profiler.key_averages().table(sort_by='self_cpu_time_total', row_limit=40)
+            with open(os.path.join(self.out_dir, 'ops.txt'), 'w') as f:
+                f.write(table)
+        else:
+            self._profiler.disable()
+            self._profiler.dump_stats(os.path.join(self.out_dir, 'profile.prof'))
+            text = io.StringIO()
+            pstats.Stats(self._profiler, stream=text).sort_stats('cumulative').print_stats(40)
+            with open(os.path.join(self.out_dir, 'profile.txt'), 'w') as f:
+                f.write(text.getvalue())
+        print('Profile of steps {}-{} written to {}'.format(self.start_step, self.stop_step, self.out_dir))
+        self._profiler = None
+        self.done = True
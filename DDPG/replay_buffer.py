@@ -0,0 +1,589 @@
+import os
+
+import numpy as np
+
+from DDPG.lazy import lazy_import
+
+torch = lazy_import('torch')  # Imported when the first buffer is built, ReplayBuffer only needs it to sample
+shared_memory = lazy_import('multiprocessing.shared_memory')  # Only SharedReplayBuffer needs these
+resource_tracker = lazy_import('multiprocessing.resource_tracker')
+
+
+class ReplayBuffer(object):
+    def __init__(self, state_dim, action_dim):
+        self.max_size = int(1e6)
+        self.count = 0
+        self.size = 0
+        self.total = 0  # Transitions ever stored, used for incremental checkpoints
+        self.s = np.zeros((self.max_size, state_dim))
+        self.a = np.zeros((self.max_size, action_dim))
+        self.r = np.zeros((self.max_size, 1))
+        self.s_ = np.zeros((self.max_size, state_dim))
+        self.dw = np.zeros((self.max_size, 1))
+
+    def store(self, s, a, r, s_, dw):
+        self.s[self.count] = s
+        self.a[self.count] = a
+        self.r[self.count] = r
+        self.s_[self.count] = s_
+        self.dw[self.count] = dw
+        self.count = (self.count + 1) % self.max_size  
+        self.size = min(self.size + 1, self.max_size)  
+        self.total += 1
+
+    def sample(self, batch_size):
+        index = np.random.choice(self.size, size=batch_size) 
+        batch_s = torch.tensor(self.s[index], dtype=torch.float)
+        batch_a = torch.tensor(self.a[index], dtype=torch.float)
+        batch_r = torch.tensor(self.r[index], dtype=torch.float)
+        batch_s_ = torch.tensor(self.s_[index], dtype=torch.float)
+        batch_dw = torch.tensor(self.dw[index], dtype=torch.float)
+
+        return batch_s, batch_a, batch_r, batch_s_, batch_dw
+
+
+class CompactReplayBuffer(object):
+    """
+    Drop-in replacement for ReplayBuffer that keeps every field in one contiguous
+    float32 torch block laid out as [s | a | r | s_ | dw] per row.
+
+    sample() gathers all fields with a single index_select into a preallocated
+    batch tensor and returns column views of it, so nothing is allocated or
+    converted per gradient step. The returned tensors are overwritten by the next
+    call to sample(). store() accepts a single transition or a batch of them.
+    """
+
+    def __init__(self, state_dim, action_dim, max_size=int(1e6), pin_memory=False, device=None):
+        self.max_size = int(max_size)
+        self.count = 0
+        self.size = 0
+        self.total = 0  # Transitions ever stored, used for incremental checkpoints
+        self.state_dim = state_dim
+        self.action_dim = action_dim
+        self.width = 2 * state_dim + action_dim + 2
+        self.storage = torch.zeros((self.max_size, self.width), dtype=torch.float, device=device)
+        if pin_memory and self.storage.device.type == 'cpu':
+            self.storage = self.storage.pin_memory()
+        # numpy view of host storage, single transitions are written straight into it
+        self._host = self.storage.numpy() if self.storage.device.type == 'cpu' else None
+
+        # Column slices of one row
+        a_start = state_dim
+        r_start = a_start + action_dim
+        s__start = r_start + 1
+        dw_start = s__start + state_dim
+        self._slices = (slice(0, a_start), slice(a_start, r_start), slice(r_start, s__start),
+                        slice(s__start, dw_start), slice(dw_start, self.width))
+
+        self._batch = None
+        self._index = None
+
+    def store(self, s, a, r, s_, dw):
+        if self._host is not None and np.ndim(s) == 1:  # One transition, no intermediate block
+            row = self._host[self.count]
+            sl = self._slices
+            row[sl[0]] = s
+            row[sl[1]] = a
+            row[sl[2]] = r
+            row[sl[3]] = s_
+            row[sl[4]] = dw
+            self.count = (self.count + 1) % self.max_size
+            self.size = min(self.size + 1, self.max_size)
+            self.total += 1
+            return
+        self._write(torch.from_numpy(self._rows(s, a, r, s_, dw)))
+
+    def _rows(self, s, a, r, s_, dw):
+        # One transition or a batch of them as float32 [s | a | r | s_ | dw] rows
+        s = np.asarray(s, dtype=np.float32).reshape(-1, self.state_dim)
+        n = s.shape[0]
+        rows = np.empty((n, self.width), dtype=np.float32)
+        rows[:, self._slices[0]] = s
+        rows[:, self._slices[1]] = np.asarray(a, dtype=np.float32).reshape(n, self.action_dim)
+        rows[:, self._slices[2]] = np.asarray(r, dtype=np.float32).reshape(n, 1)
+        rows[:, self._slices[3]] = np.asarray(s_, dtype=np.float32).reshape(n, self.state_dim)
+        rows[:, self._slices[4]] = np.asarray(dw, dtype=np.float32).reshape(n, 1)
+        return rows
+
+    def _write(self, rows, non_blocking=False):
+        n = rows.shape[0]
+        self.total += n
+        if n > self.max_size:  # Only the most recent max_size rows can survive
+            rows = rows[-self.max_size:]
+            self.count = (self.count + n - self.max_size) % self.max_size
+            n = self.max_size
+        end = self.count + n
+        if end <= self.max_size:
+            self.storage[self.count:end].copy_(rows, non_blocking=non_blocking)
+        else:  # Wrap around the end of the ring
+            split = self.max_size - self.count
+            self.storage[self.count:].copy_(rows[:split], non_blocking=non_blocking)
+            self.storage[:end - self.max_size].copy_(rows[split:], non_blocking=non_blocking)
+        self.count = end % self.max_size
+        self.size = min(self.size + n, self.max_size)
+
+    def sample(self, batch_size):
+        rows = self.sample_rows(batch_size)
+        return tuple(rows[:, sl] for sl in self._slices)
+
+    def sample_rows(self, batch_size):
+        # sample() without the column split: the whole (batch_size, width) batch tensor
+        self._reserve_batch(batch_size)
+        self._index.random_(0, self.size)
+        torch.index_select(self.storage, 0, self._index, out=self._batch)
+        return self._batch
+
+    def _reserve_batch(self, batch_size):
+        if self._batch is None or self._batch.shape[0] != batch_size:
+            self._batch = torch.empty((batch_size, self.width), dtype=torch.float, device=self.storage.device,
+                                      pin_memory=self.storage.is_pinned())
+            self._index = torch.empty(batch_size, dtype=torch.long, device=self.storage.device)
+
+    def _gather(self):
+        torch.index_select(self.storage, 0, self._index, out=self._batch)
+        return tuple(self._batch[:, sl] for sl in self._slices)
+
+
+class DeviceReplayBuffer(CompactReplayBuffer):
+    """
+    CompactReplayBuffer whose storage, sampling indices and batch tensor all live
+    on the training device, so a learner step never copies from the host.
+
+    store() writes into a pinned host staging block of `stage_size` rows, which is
+    copied to the device in one non-blocking transfer when it fills up or before
+    the next sample(). Staged rows are not counted in size/total until then;
+    flush() moves them over explicitly. On a CPU device the same code path runs
+    with plain host memory.
+    """
+
+    def __init__(self, state_dim, action_dim, max_size=int(1e6), device=None, stage_size=1024):
+        device = torch.device(device or ('cuda' if torch.cuda.is_available() else 'cpu'))
+        super(DeviceReplayBuffer, self).__init__(state_dim, action_dim, max_size, device=device)
+        self.device = device
+        self.stage_size = stage_size
+        self._stage = torch.empty((stage_size, self.width), dtype=torch.float, pin_memory=device.type == 'cuda')
+        self._stage_rows = self._stage.numpy()
+        self._staged = 0
+        self._copied = None  # CUDA event of the last staging copy, the block is reused once it completes
+
+    def store(self, s, a, r, s_, dw):
+        rows = self._rows(s, a, r, s_, dw)
+        n = rows.shape[0]
+        if self._staged + n > self.stage_size:
+            self.flush()
+        if n > self.stage_size:  # Too big to stage, copy it over directly
+            self._write(torch.from_numpy(rows).to(self.device))
+            return
+        if self._copied is not None:
+            self._copied.synchronize()
+            self._copied = None
+        self._stage_rows[self._staged:self._staged + n] = rows
+        self._staged += n
+
+    def flush(self):
+        if self._staged == 0:
+            return
+        self._write(self._stage[:self._staged], non_blocking=True)
+        if self.device.type == 'cuda':
+            self._copied = torch.cuda.Event()
+            self._copied.record()
+        self._staged = 0
+
+    def sample_rows(self, batch_size):
+        self.flush()
+        return super(DeviceReplayBuffer, self).sample_rows(batch_size)
+
+
+class EnsembleReplayBuffer(object):
+    """
+    One CompactReplayBuffer-style ring per member of an agent population, stacked
+    into a single (population, max_size, width) float32 tensor.
+
+    store() takes one transition per member (arrays with a leading population
+    axis) and writes them all at the same ring position. sample_rows() draws
+    independent indices for every member and gathers them with one index_select
+    into a preallocated (population, batch_size, width) tensor.
+    """
+
+    def __init__(self, population, state_dim, action_dim, max_size=int(2e5), device=None):
+        self.population = population
+        self.max_size = int(max_size)
+        self.count = 0
+        self.size = 0
+        self.total = 0
+        self.state_dim = state_dim
+        self.action_dim = action_dim
+        self.dims = [state_dim, action_dim, 1, state_dim, 1]
+        self.width = sum(self.dims)
+        self.storage = torch.zeros((population, self.max_size, self.width), dtype=torch.float, device=device)
+        self._offset = torch.arange(population, device=self.storage.device).reshape(-1, 1) * self.max_size
+        self._batch = None
+        self._index = None
+
+    def store(self, s, a, r, s_, dw):
+        n = self.population
+        rows = np.concatenate([np.asarray(x, dtype=np.float32).reshape(n, d)
+                               for x, d in zip((s, a, r, s_, dw), self.dims)], axis=1)
+        self.storage[:, self.count].copy_(torch.from_numpy(rows))
+        self.count = (self.count + 1) % self.max_size
+        self.size = min(self.size + 1, self.max_size)
+        self.total += 1
+
+    def sample_rows(self, batch_size):
+        if self._batch is None or self._batch.shape[1] != batch_size:
+            self._batch = torch.empty((self.population, batch_size, self.width), dtype=torch.float,
+                                      device=self.storage.device)
+            self._index = torch.empty((self.population, batch_size), dtype=torch.long, device=self.storage.device)
+        self._index.random_(0, self.size)
+        self._index += self._offset  # Row of member i is i * max_size + index in the flattened storage
+        torch.index_select(self.storage.view(-1, self.width), 0, self._index.view(-1),
+                           out=self._batch.view(-1, self.width))
+        return self._batch
+
+
+class SumTree(object):
+    """
+    Flat array sum-tree with a companion min-tree over `capacity` leaves.
+
+    Node i has children 2i and 2i+1, the root is node 1 and leaf j is stored at
+    node capacity + j. Updates and lookups are vectorized over a whole batch and
+    walk the tree level by level, so both cost O(batch * log(capacity)).
+    """
+
+    def __init__(self, capacity):
+        self.capacity = 1
+        while self.capacity < capacity:
+            self.capacity *= 2
+        self.depth = self.capacity.bit_length() - 1
+        self.sum_tree = np.zeros(2 * self.capacity)
+        self.min_tree = np.full(2 * self.capacity, np.inf)
+
+    @property
+    def total(self):
+        return self.sum_tree[1]
+
+    @property
+    def min(self):
+        return self.min_tree[1]
+
+    def update(self, index, priority):
+        node = np.asarray(index, dtype=np.int64) + self.capacity
+        self.sum_tree[node] = priority
+        self.min_tree[node] = priority
+        node = np.unique(node // 2)
+        for _ in range(self.depth):
+            left, right = 2 * node, 2 * node + 1
+            self.sum_tree[node] = self.sum_tree[left] + self.sum_tree[right]
+            self.min_tree[node] = np.minimum(self.min_tree[left], self.min_tree[right])
+            node = np.unique(node // 2)
+
+    def find(self, value):
+        # Descend from the root for every query at once, returns leaf indices
+        value = np.array(value, dtype=np.float64)
+        node = np.ones(value.shape[0], dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * node
+            left_sum = self.sum_tree[left]
+            go_right = value > left_sum
+            value -= np.where(go_right, left_sum, 0.0)
+            node = left + go_right
+        return node - self.capacity
+
+
+class PrioritizedReplayBuffer(CompactReplayBuffer):
+    """
+    Proportional prioritized replay (Schaul et al., 2016) on top of CompactReplayBuffer.
+
+    sample() draws one index from each of batch_size equal slices of the total
+    priority mass and additionally returns the importance weights and the sampled
+    indices. New transitions get the current maximum priority; DDPG.learn reports
+    TD errors back through update_priorities().
+    """
+
+    prioritized = True
+
+    def __init__(self, state_dim, action_dim, max_size=int(1e6), pin_memory=False,
+                 alpha=0.6, beta=0.4, beta_increment=0.0, eps=1e-6):
+        super(PrioritizedReplayBuffer, self).__init__(state_dim, action_dim, max_size, pin_memory)
+        self.alpha = alpha  # How much prioritization is used, 0 is uniform
+        self.beta = beta  # Importance sampling correction, annealed towards 1
+        self.beta_increment = beta_increment
+        self.eps = eps  # Keeps zero-error transitions sampleable
+        self.max_priority = 1.0
+        self.tree = SumTree(self.max_size)
+
+    def store(self, s, a, r, s_, dw):
+        n = min(np.asarray(s).reshape(-1, self.state_dim).shape[0], self.max_size)
+        super(PrioritizedReplayBuffer, self).store(s, a, r, s_, dw)
+        # The n rows just written end right before the new count
+        index = (self.count - np.arange(n, 0, -1)) % self.max_size
+        self.tree.update(index, self.max_priority ** self.alpha)
+
+    def sample(self, batch_size):
+        self._reserve_batch(batch_size)
+        total = self.tree.total
+        segment = total / batch_size
+        value = (np.arange(batch_size) + np.random.uniform(size=batch_size)) * segment
+        index = self.tree.find(np.minimum(value, np.nextafter(total, 0)))
+        index = np.minimum(index, self.size - 1)
+
+        # w_i = (N * P(i))^-beta normalized by the largest weight, i.e. (p_i / p_min)^-beta
+        priority = self.tree.sum_tree[index + self.tree.capacity]
+        weights = (priority / self.tree.min) ** -self.beta
+        self.beta = min(1.0, self.beta + self.beta_increment)
+
+        self._index.copy_(torch.from_numpy(index))
+        batch_w = torch.from_numpy(weights.astype(np.float32)).reshape(-1, 1)
+        return self._gather() + (batch_w, index)
+
+    def update_priorities(self, index, td_error):
+        priority = np.abs(np.asarray(td_error, dtype=np.float64)).reshape(-1) + self.eps
+        self.max_priority = max(self.max_priority, float(priority.max()))
+        self.tree.update(index, priority ** self.alpha)
+
+
+class MemmapReplayBuffer(object):
+    """
+    Disk-backed replay buffer with the same store()/sample() API as ReplayBuffer.
+
+    s, a, r, s_ and dw live in float32 .npy files opened with np.memmap under
+    `path`, next to a small int64 header holding the dimensions, count and size.
+    The most recent `hot_size` rows are mirrored in RAM, older rows are paged in
+    lazily by the OS when they are sampled. Re-opening an existing directory
+    resumes the buffer where it stopped, including after a crash, because the
+    header is only advanced once the rows have been written to the mapping.
+    """
+
+    HEADER_LEN = 5  # state_dim, action_dim, max_size, count, size
+
+    def __init__(self, state_dim, action_dim, path, max_size=int(1e7), hot_size=int(1e5), flush_every=int(1e4)):
+        self.state_dim = state_dim
+        self.action_dim = action_dim
+        self.path = path
+        self.flush_every = flush_every
+        self.fields = ('s', 'a', 'r', 's_', 'dw')
+        dims = (state_dim, action_dim, 1, state_dim, 1)
+
+        header_file = os.path.join(path, 'header.npy')
+        if os.path.exists(header_file):  # Resume an existing buffer
+            self.header = np.load(header_file, mmap_mode='r+')
+            if (self.header[0], self.header[1]) != (state_dim, action_dim):
+                raise ValueError('Replay buffer at {} was created with state_dim={}, action_dim={}'.format(
+                    path, self.header[0], self.header[1]))
+            self.max_size = int(self.header[2])
+            self.memmaps = [np.load(os.path.join(path, f + '.npy'), mmap_mode='r+') for f in self.fields]
+        else:
+            os.makedirs(path, exist_ok=True)
+            self.max_size = int(max_size)
+            self.memmaps = [np.lib.format.open_memmap(os.path.join(path, f + '.npy'), mode='w+',
+                                                      dtype=np.float32, shape=(self.max_size, d))
+                            for f, d in zip(self.fields, dims)]
+            self.header = np.lib.format.open_memmap(header_file, mode='w+', dtype=np.int64,
+                                                    shape=(self.HEADER_LEN,))
+            self.header[:] = (state_dim, action_dim, self.max_size, 0, 0)
+            self.header.flush()
+
+        # Hot window of the latest rows, filled sequentially as a ring of its own
+        self.hot_size = min(int(hot_size), self.max_size)
+        self.hot = [np.zeros((self.hot_size, d), dtype=np.float32) for d in dims]
+        self.hot_count = 0  # Rows written to the hot window since opening
+        self.unflushed = 0
+
+    @property
+    def count(self):
+        return int(self.header[3])
+
+    @property
+    def size(self):
+        return int(self.header[4])
+
+    def store(self, s, a, r, s_, dw):
+        rows = [np.asarray(x, dtype=np.float32).reshape(-1, m.shape[1])
+                for x, m in zip((s, a, r, s_, dw), self.memmaps)]
+        n = rows[0].shape[0]
+        start = self.count
+        if n > self.max_size:  # Only the most recent max_size rows can survive
+            rows = [x[-self.max_size:] for x in rows]
+            start = (start + n - self.max_size) % self.max_size
+            n = self.max_size
+        position = (start + np.arange(n)) % self.max_size
+        for x, m in zip(rows, self.memmaps):
+            m[position] = x
+        if n <= self.hot_size:
+            slot = (self.hot_count + np.arange(n)) % self.hot_size
+            for x, h in zip(rows, self.hot):
+                h[slot] = x
+            self.hot_count += n
+        else:  # Only the tail fits in the hot window
+            slot = (self.hot_count + np.arange(self.hot_size)) % self.hot_size
+            for x, h in zip(rows, self.hot):
+                h[slot] = x[-self.hot_size:]
+            self.hot_count += self.hot_size
+
+        # Advance the header only after the rows are in the mapping
+        self.header[3] = (start + n) % self.max_size
+        self.header[4] = min(self.size + n, self.max_size)
+        self.unflushed += n
+        if self.unflushed >= self.flush_every:
+            self.flush()
+
+    def sample(self, batch_size):
+        index = np.random.randint(0, self.size, size=batch_size)
+        # Age 0 is the newest row; rows younger than the hot window are served from RAM
+        age = (self.count - 1 - index) % self.max_size
+        hot = age < min(self.hot_count, self.hot_size)
+        cold = np.sort(index[~hot])  # Sorted reads keep page faults sequential
+        cold_order = np.argsort(index[~hot], kind='stable')
+        slot = (self.hot_count - 1 - age[hot]) % self.hot_size
+
+        batch = []
+        for m, h in zip(self.memmaps, self.hot):
+            out = np.empty((batch_size, m.shape[1]), dtype=np.float32)
+            out[hot] = h[slot]
+            cold_rows = np.empty((cold.shape[0], m.shape[1]), dtype=np.float32)
+            cold_rows[cold_order] = m[cold]
+            out[~hot] = cold_rows
+            batch.append(torch.from_numpy(out))
+        return tuple(batch)
+
+    def flush(self):
+        for m in self.memmaps:
+            m.flush()
+        self.header.flush()
+        self.unflushed = 0
+
+    def close(self):
+        self.flush()
+
+
+class SharedReplayBuffer(object):
+    """
+    Replay buffer in a multiprocessing.shared_memory block, with the same store()/sample()
+    API as ReplayBuffer, that any number of local processes sample from at the same time.
+
+    One process stores (the creator or one attached collector), every other process
+    attaches by name and samples the same rows in place, so N learners hold one copy
+    of the data and a collector appends without pickling anything. Pickling the buffer
+    itself, e.g. as an argument to a spawned worker, only sends the name.
+
+        buffer = SharedReplayBuffer(2, 1)                  # creator, owns the block
+        other = SharedReplayBuffer.attach(buffer.name)     # in any other process
+
+    Rows are float32 [s | a | r | s_ | dw] like CompactReplayBuffer. The header keeps
+    the dimensions and `total`, the number of rows ever stored; it is the only
+    value the writer changes besides the rows and is one aligned int64, so readers
+    see it move atomically. store() writes at most `guard` rows before advancing it,
+    which is why sample() never draws the oldest `guard` rows of a full ring and
+    redraws any row the writer passed while it was being copied.
+    """
+
+    HEADER_LEN = 8  # state_dim, action_dim, max_size, guard, total, padded to one cache line
+    TOTAL = 4
+
+    def __init__(self, state_dim, action_dim, max_size=int(1e6), guard=1024, name=None):
+        self.max_size = int(max_size)
+        self.guard = min(int(guard), self.max_size // 2)
+        width = 2 * state_dim + action_dim + 2
+        nbytes = 8 * self.HEADER_LEN + 4 * self.max_size * width
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=nbytes)
+        self.owner = True
+        self._map(state_dim, action_dim)
+        self._header[:self.TOTAL + 1] = (state_dim, action_dim, self.max_size, self.guard, 0)
+
+    @classmethod
+    def attach(cls, name):
+        # Open an existing buffer; this process does not own the block and never unlinks it
+        buffer = cls.__new__(cls)
+        buffer.shm = attach_shared_memory(name)
+        buffer.owner = False
+        header = np.ndarray((cls.HEADER_LEN,), dtype=np.int64, buffer=buffer.shm.buf)
+        state_dim, action_dim, buffer.max_size, buffer.guard = (int(x) for x in header[:4])
+        del header
+        buffer._map(state_dim, action_dim)
+        return buffer
+
+    def _map(self, state_dim, action_dim):
+        self.state_dim = state_dim
+        self.action_dim = action_dim
+        self.width = 2 * state_dim + action_dim + 2
+        self.dims = (state_dim, action_dim, 1, state_dim, 1)
+        self.name = self.shm.name
+        self._header = np.ndarray((self.HEADER_LEN,), dtype=np.int64, buffer=self.shm.buf)
+        self.rows = np.ndarray((self.max_size, self.width), dtype=np.float32, buffer=self.shm.buf,
+                               offset=8 * self.HEADER_LEN)
+
+    def __reduce__(self):
+        return SharedReplayBuffer.attach, (self.name,)
+
+    @property
+    def total(self):
+        return int(self._header[self.TOTAL])
+
+    @total.setter
+    def total(self, total):
+        self._header[self.TOTAL] = total
+
+    @property
+    def count(self):
+        return self.total % self.max_size
+
+    @property
+    def size(self):
+        return min(self.total, self.max_size)
+
+    def store(self, s, a, r, s_, dw):
+        # One transition or a batch of them; only one process may store at a time
+        fields = [np.asarray(x, dtype=np.float32).reshape(-1, d) for x, d in zip((s, a, r, s_, dw), self.dims)]
+        rows = np.concatenate(fields, axis=1)
+        total = self.total
+        if rows.shape[0] > self.max_size:  # Only the most recent max_size rows can survive
+            # The older rows count as stored and overwritten, moving total only relabels rows readers may draw
+            total += rows.shape[0] - self.max_size
+            rows = rows[-self.max_size:]
+            self._header[self.TOTAL] = total
+        for start in range(0, rows.shape[0], self.guard):
+            chunk = rows[start:start + self.guard]
+            self.rows[(total + np.arange(chunk.shape[0])) % self.max_size] = chunk
+            total += chunk.shape[0]
+            self._header[self.TOTAL] = total  # Publish only once the rows are written
+
+    def sample(self, batch_size):
+        batch = np.empty((batch_size, self.width), dtype=np.float32)
+        todo = np.arange(batch_size)
+        while todo.shape[0]:
+            total = self.total
+            # Age 0 is the newest row, ages from max_size - guard on may be under the writer
+            age = np.random.randint(0, min(total, self.max_size - self.guard), size=todo.shape[0])
+            batch[todo] = self.rows[(total - 1 - age) % self.max_size]
+            moved = self.total - total
+            todo = todo[age >= self.max_size - self.guard - moved]
+        batch = torch.from_numpy(batch)
+        return tuple(torch.split(batch, self.dims, dim=1))
+
+    def close(self):
+        # Drop this process's mapping, and the block itself if this process created it
+        self._header = self.rows = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach_shared_memory(name):
+    # Open a block without handing it to this process's resource tracker, which would
+    # unlink it when the process exits although its creator still uses it
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        pass
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
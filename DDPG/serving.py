@@ -0,0 +1,197 @@
+"""
+Local policy serving with request coalescing.
+
+Concurrent aim requests are queued and a single batcher task groups them into
+micro-batches of up to `max_batch_size`, waiting at most `max_wait_ms` for a batch
+to fill, then runs one Actor forward pass per batch. Clients talk line-delimited
+JSON over TCP:
+
+    {"angle": 0.7, "distance": 420.0}  ->  {"speed": 65.1}
+    {"stats": true}                     ->  {"requests": ..., "p50_ms": ..., "p99_ms": ...}
+    not JSON, or no angle/distance      ->  {"error": "..."}, the connection stays open
+
+    python -m DDPG.serving --model saved_models/actor --port 8765
+"""
+import argparse
+import asyncio
+import collections
+import json
+import time
+
+import numpy as np
+import torch
+
+from DDPG.DDPG import Actor
+
+
+def load_actor(path, max_action=100.0):
+    # Accepts both a pickled Actor and a bare Actor state_dict
+    actor = torch.load(path, map_location='cpu', weights_only=False)
+    if not isinstance(actor, torch.nn.Module):
+        state_dict = actor
+        actor = Actor(state_dict['l1.weight'].shape[1], state_dict['l3.weight'].shape[0],
+                      state_dict['l1.weight'].shape[0], max_action)
+        actor.load_state_dict(state_dict)
+    return actor.eval()
+
+
+class BatchedPolicy(object):
+    def __init__(self, actor, max_batch_size=256, max_wait_ms=2.0, latency_window=100000):
+        self.actor = actor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = None
+        self._task = None
+
+        # Counters
+        self.requests = 0
+        self.batches = 0
+        self.latencies = collections.deque(maxlen=latency_window)  # Seconds from predict() to result
+        self.started = time.perf_counter()
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self._task = asyncio.ensure_future(self._batcher())
+
+    async def stop(self):
+        # Stop the batcher and fail every request it has not answered, so no client waits forever
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        pending = []
+        while self.queue is not None and not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        self._fail(pending, RuntimeError('BatchedPolicy stopped'))
+
+    async def predict(self, obs):
+        # Action for one observation, computed together with whatever else is queued
+        if self._task is None:
+            raise RuntimeError('BatchedPolicy is not running')
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((np.asarray(obs, dtype=np.float32), future, time.perf_counter()))
+        return await future
+
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = []
+            try:
+                batch.append(await self.queue.get())
+                deadline = loop.time() + self.max_wait
+                while len(batch) < self.max_batch_size:
+                    if not self.queue.empty():
+                        batch.append(self.queue.get_nowait())
+                        continue
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:  # stop() while collecting, these requests are off the queue already
+                self._fail(batch, RuntimeError('BatchedPolicy stopped'))
+                raise
+
+            try:
+                obs = torch.from_numpy(np.stack([item[0] for item in batch]))
+                with torch.inference_mode():
+                    actions = self.actor(obs).numpy()
+            except Exception as error:  # Fail this batch, keep serving
+                self._fail(batch, error)
+                continue
+
+            now = time.perf_counter()
+            for (_, future, start), action in zip(batch, actions):
+                if not future.done():
+                    future.set_result(action)
+                self.latencies.append(now - start)
+            self.requests += len(batch)
+            self.batches += 1
+
+    @staticmethod
+    def _fail(batch, error):
+        for _, future, _ in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    def stats(self):
+        latencies = np.fromiter(self.latencies, dtype=np.float64)
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000 if latencies.size else (0.0, 0.0)
+        elapsed = time.perf_counter() - self.started
+        return {
+            'requests': self.requests,
+            'batches': self.batches,
+            'mean_batch_size': self.requests / max(self.batches, 1),
+            'requests_per_s': self.requests / elapsed,
+            'p50_ms': float(p50),
+            'p99_ms': float(p99),
+        }
+
+
+async def respond(policy, line):
+    # Response object for one request line, a bad request or failed prediction is reported, not raised
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError('expected a JSON object')
+        if request.get('stats'):
+            return policy.stats()
+        obs = [float(request['angle']), float(request['distance'])]
+    except KeyError as error:
+        return {'error': 'invalid request: missing {}'.format(error)}
+    except (ValueError, TypeError) as error:  # Includes json.JSONDecodeError
+        return {'error': 'invalid request: {}'.format(error)}
+    try:
+        action = await policy.predict(obs)
+    except Exception as error:  # Failed batch or stopped policy
+        return {'error': str(error)}
+    return {'speed': float(action[0])}
+
+
+async def handle_client(policy, reader, writer):
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            response = await respond(policy, line)
+            writer.write((json.dumps(response) + '\n').encode())
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(policy, host='127.0.0.1', port=8765):
+    # Start the batcher and a TCP server on host:port, returns the asyncio server
+    await policy.start()
+    return await asyncio.start_server(lambda r, w: handle_client(policy, r, w), host, port)
+
+
+async def main(args):
+    torch.set_num_threads(args.threads)
+    policy = BatchedPolicy(load_actor(args.model, args.max_action), args.max_batch_size, args.max_wait_ms)
+    server = await serve(policy, args.host, args.port)
+    print('Serving {} on {}:{}'.format(args.model, args.host, args.port))
+    async with server:
+        await server.serve_forever()
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Batched CannonEnv policy server')
+    parser.add_argument('--model', type=str, default='saved_models/actor')
+    parser.add_argument('--max_action', type=float, default=100.0, help='Used when the model is a bare state_dict')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max_batch_size', type=int, default=256)
+    parser.add_argument('--max_wait_ms', type=float, default=2.0)
+    parser.add_argument('--threads', type=int, default=1, help='torch intra-op threads')
+    return parser
+
+
+if __name__ == '__main__':
+    asyncio.run(main(get_parser().parse_args()))
@@ -0,0 +1,281 @@
+"""
+Hyperparameter sweeps and multi-seed runs of DDPG on CannonEnv.
+
+Trials run in a pool of spawned worker processes, each pinned to
+`--threads_per_trial` torch threads, with at most `--workers` trials at a time
+(default: as many as fit on the cores). The search space covers the DDPG
+hyperparameters and the seed:
+
+    python -m DDPG.sweep --space hidden_width=32,64 lr=1e-4,3e-4 --seeds 0 1 2
+    python -m DDPG.sweep --random 20 --space lr=log:1e-5:1e-3 tau=0.001:0.01 batch_size=32,64,256
+
+A value list is searched exhaustively (grid) or sampled from (--random),
+`lo:hi` and `log:lo:hi` ranges are sampled uniformly / log-uniformly and need
+--random. A trial stops early once its evaluation reward reaches
+--target_reward or has not improved by --min_delta for --patience evaluations.
+Every finished trial is appended to results.jsonl in --out, the full table is
+written to results.csv sorted by best evaluation reward. A trial that raises is
+recorded with stopped='error' and the exception, the other trials carry on.
+"""
+import argparse
+import concurrent.futures
+import csv
+import itertools
+import json
+import math
+import os
+import time
+
+import gym
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+import gym_CannonBall
+from gym_CannonBall.seeding import BlockSampler, make_rng, spawn_seeds
+from DDPG.DDPG import DDPG, reward_adapter
+from DDPG.evaluator import BatchEvaluator
+from DDPG.metrics import MetricsWriter
+from DDPG.normalization import Normalizer, NormalizedReplay
+from DDPG.replay_buffer import CompactReplayBuffer
+
+# Searchable fields and the defaults of DDPG/DDPG.py
+DEFAULTS = {'hidden_width': 32, 'batch_size': 32, 'gamma': 0.99, 'tau': 0.005, 'lr': 3e-4}
+INT_FIELDS = ('hidden_width', 'batch_size')
+
+
+def parse_space(specs):
+    # ['lr=1e-4,3e-4', 'tau=log:1e-3:1e-2'] -> {'lr': [0.0001, 0.0003], 'tau': ('log', 0.001, 0.01)}
+    space = {}
+    for spec in specs:
+        name, _, values = spec.partition('=')
+        if name not in DEFAULTS:
+            raise ValueError("Unknown hyperparameter '{}', expected one of {}".format(name, ', '.join(DEFAULTS)))
+        cast = int if name in INT_FIELDS else float
+        if ':' in values:
+            parts = values.split(':')
+            scale = parts.pop(0) if parts[0] in ('log', 'lin') else 'lin'
+            space[name] = (scale, float(parts[0]), float(parts[1]))
+        else:
+            space[name] = [cast(v) for v in values.split(',')]
+    return space
+
+
+def grid_configs(space, seeds):
+    ranges = [name for name, values in space.items() if isinstance(values, tuple)]
+    if ranges:
+        raise ValueError('Ranges ({}) can only be sampled, pass --random N'.format(', '.join(ranges)))
+    names = list(space)
+    for seed, values in itertools.product(seeds, itertools.product(*[space[name] for name in names])):
+        yield dict(DEFAULTS, **dict(zip(names, values)), seed=seed)
+
+
+def random_configs(space, seeds, n, rng):
+    for _ in range(n):
+        config = dict(DEFAULTS)
+        for name, values in space.items():
+            if isinstance(values, list):
+                value = values[rng.integers(len(values))]
+            elif values[0] == 'log':
+                value = math.exp(rng.uniform(math.log(values[1]), math.log(values[2])))
+            else:
+                value = rng.uniform(values[1], values[2])
+            config[name] = int(round(value)) if name in INT_FIELDS else float(value)
+        for seed in seeds:
+            yield dict(config, seed=seed)
+
+
+def _init_worker(threads):
+    # One pool process runs one trial at a time on `threads` intra-op threads
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:  # Already set in this process
+        pass
+
+
+def run_trial(trial_id, config, settings):
+    # Train one configuration with the DDPG/DDPG.py loop, returns the result row
+    start = time.perf_counter()
+    seed = config['seed']
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    env_seed, noise_seed = spawn_seeds(seed, 2)
+    env = gym.make(settings['env_name'])
+    env.reset(seed=env_seed)
+    env.action_space.seed(seed)
+    state_dim = env.observation_space.shape[0]
+    action_dim = env.action_space.shape[0]
+    max_action = float(env.action_space.high[0])
+    max_episode_steps = env.unwrapped._max_episode_steps
+    noise_std = 0.1 * max_action
+    noise = BlockSampler(make_rng(noise_seed), lambda rng, n: rng.normal(0, noise_std, size=(n, action_dim)))
+
+    agent = DDPG(state_dim, action_dim, max_action, load=False,
+                 **{name: config[name] for name in DEFAULTS})
+    replay_buffer = CompactReplayBuffer(state_dim, action_dim)
+    normalizer = Normalizer(state_dim, gamma=config['gamma']) if settings['normalize'] else None
+    learn_buffer = replay_buffer if normalizer is None else NormalizedReplay(replay_buffer, normalizer)
+    evaluator = BatchEvaluator.from_env(env, num_states=settings['evaluate_states'], seed=seed)
+    writer = None
+    if settings['tensorboard']:
+        writer = MetricsWriter(log_dir=os.path.join(settings['out'], 'trial_{}'.format(trial_id)))
+
+    random_steps = settings['random_steps']
+    update_freq = settings['update_freq']
+    evaluate_freq = settings['evaluate_freq']
+    best_reward = -math.inf
+    best_step = 0
+    evaluate_reward = -math.inf
+    stale = 0  # Evaluations since the last improvement of best_reward by min_delta
+    stopped = 'max_train_steps'
+    total_steps = 0
+    while total_steps < settings['max_train_steps'] and stopped == 'max_train_steps':
+        s, _ = env.reset()
+        episode_steps = 0
+        done = False
+        while not done:
+            episode_steps += 1
+            if total_steps < random_steps:
+                a = env.action_space.sample()
+            else:
+                a = agent.choose_action(s if normalizer is None else normalizer.normalize_obs(s))
+                a = (a + noise()).clip(-max_action, max_action)
+            s_, r, done, _ = env.step(a)
+            dw = done and episode_steps != max_episode_steps
+            if normalizer is not None:  # Running statistics instead of reward_adapter, the buffer keeps raw rewards
+                normalizer.update(s, r, done)
+            else:
+                r = reward_adapter(r, 0)
+            replay_buffer.store(s, a, r, s_, dw)
+            s = s_
+
+            if total_steps >= random_steps and total_steps % update_freq == 0:
+                agent.learn_many(learn_buffer, update_freq)
+
+            total_steps += 1
+            if total_steps % evaluate_freq == 0:
+                evaluate_reward = evaluator(agent if normalizer is None else normalizer.fold(agent.actor))['mean']
+                if writer is not None:
+                    writer.add_scalar('Evaluate/mean', evaluate_reward, global_step=total_steps)
+                improved = evaluate_reward > best_reward + settings['min_delta']
+                if evaluate_reward > best_reward:
+                    best_reward, best_step = evaluate_reward, total_steps
+                if improved:
+                    stale = 0
+                elif total_steps > random_steps:  # The random warm-up does not use up patience
+                    stale += 1
+                if settings['target_reward'] is not None and evaluate_reward >= settings['target_reward']:
+                    stopped = 'target_reward'
+                elif settings['patience'] and stale >= settings['patience']:
+                    stopped = 'patience'
+                if stopped != 'max_train_steps':
+                    break
+
+    if writer is not None:
+        writer.close()
+    elapsed = time.perf_counter() - start
+    return dict(config, trial=trial_id, best_reward=best_reward, best_step=best_step,
+                final_reward=evaluate_reward, steps=total_steps, stopped=stopped,
+                seconds=round(elapsed, 1), steps_per_s=round(total_steps / elapsed, 1))
+
+
+def failed_row(trial_id, config, error):
+    # Result row of a trial that raised, sorted last in the table
+    return dict(config, trial=trial_id, best_reward=-math.inf, best_step=0, final_reward=-math.inf, steps=0,
+                stopped='error', error='{}: {}'.format(type(error).__name__, error))
+
+
+COLUMNS = ['trial', 'seed'] + list(DEFAULTS) + ['best_reward', 'best_step', 'final_reward', 'steps', 'stopped',
+                                                  'seconds', 'steps_per_s', 'error']
+
+
+def write_table(rows, path):
+    rows = sorted(rows, key=lambda row: -row['best_reward'])
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+
+def format_table(rows, limit=20):
+    lines = ['{:>5} {:>4} {:>6} {:>6} {:>6} {:>8} {:>9} {:>9} {:>9} {:>8} {:>15}'.format(
+        'trial', 'seed', 'hidden', 'batch', 'gamma', 'tau', 'lr', 'best', 'final', 'steps', 'stopped')]
+    for row in rows[:limit]:
+        lines.append('{:>5} {:>4} {:>6} {:>6} {:>6.3f} {:>8.4f} {:>9.2e} {:>9.2f} {:>9.2f} {:>8} {:>15}'.format(
+            row['trial'], row['seed'], row['hidden_width'], row['batch_size'], row['gamma'], row['tau'], row['lr'],
+            row['best_reward'], row['final_reward'], row['steps'], row['stopped']))
+    return '\n'.join(lines)
+
+
+def main(args):
+    space = parse_space(args.space)
+    if args.random:
+        configs = list(random_configs(space, args.seeds, args.random, np.random.default_rng(args.sweep_seed)))
+    else:
+        configs = list(grid_configs(space, args.seeds))
+    workers = args.workers or max(1, (os.cpu_count() or 1) // args.threads_per_trial)
+    workers = min(workers, len(configs))
+    settings = {key: getattr(args, key) for key in ('env_name', 'max_train_steps', 'random_steps', 'update_freq',
+                                                    'evaluate_freq', 'evaluate_states', 'patience', 'min_delta',
+                                                    'target_reward', 'normalize', 'tensorboard', 'out')}
+    os.makedirs(args.out, exist_ok=True)
+    print('{} trials on {} workers x {} threads, results in {}'.format(
+        len(configs), workers, args.threads_per_trial, args.out))
+
+    rows = []
+    start = time.perf_counter()
+    try:
+        with open(os.path.join(args.out, 'results.jsonl'), 'a') as log, \
+                concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('spawn'),
+                                                       initializer=_init_worker,
+                                                       initargs=(args.threads_per_trial,)) as pool:
+            futures = {pool.submit(run_trial, trial_id, config, settings): (trial_id, config)
+                       for trial_id, config in enumerate(configs)}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    row = future.result()
+                except Exception as error:  # Includes a worker that died, the other trials still finish
+                    row = failed_row(*futures[future], error)
+                rows.append(row)
+                log.write(json.dumps(row) + '\n')
+                log.flush()
+                if row['stopped'] == 'error':
+                    print('[{}/{}] trial {} failed: {}'.format(len(rows), len(configs), row['trial'], row['error']))
+                else:
+                    print('[{}/{}] trial {} best_reward:{:.2f} steps:{} ({})'.format(
+                        len(rows), len(configs), row['trial'], row['best_reward'], row['steps'], row['stopped']))
+    finally:  # The table of the trials that did finish, even when the sweep is interrupted
+        rows = write_table(rows, os.path.join(args.out, 'results.csv'))
+    print(format_table(rows))
+    print('{} trials in {:.0f}s'.format(len(rows), time.perf_counter() - start))
+    return rows
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Parallel DDPG hyperparameter sweep on CannonEnv')
+    parser.add_argument('--space', type=str, nargs='*', default=[],
+                        help='name=v1,v2 | name=lo:hi | name=log:lo:hi over {}'.format(', '.join(DEFAULTS)))
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0])
+    parser.add_argument('--random', type=int, default=0, help='Sample this many configs instead of the full grid')
+    parser.add_argument('--sweep_seed', type=int, default=0, help='Seed of the random search')
+    parser.add_argument('--workers', type=int, default=None, help='Concurrent trials, default cores // threads')
+    parser.add_argument('--threads_per_trial', type=int, default=1, help='torch threads of every trial')
+    parser.add_argument('--env_name', type=str, default='gym_CannonBall/CannonEnv-v0')
+    parser.add_argument('--max_train_steps', type=int, default=int(2e5))
+    parser.add_argument('--random_steps', type=int, default=int(25e3))
+    parser.add_argument('--update_freq', type=int, default=50)
+    parser.add_argument('--evaluate_freq', type=int, default=int(5e3))
+    parser.add_argument('--evaluate_states', type=int, default=10000)
+    parser.add_argument('--patience', type=int, default=10, help='Evaluations without improvement, 0 disables')
+    parser.add_argument('--min_delta', type=float, default=0.5, help='Smallest reward gain that counts')
+    parser.add_argument('--target_reward', type=float, default=None, help='Stop a trial once it reaches this')
+    parser.add_argument('--normalize', action='store_true', help='Running observation/return normalization')
+    parser.add_argument('--tensorboard', action='store_true', help='Log every trial to --out/trial_<n>')
+    parser.add_argument('--out', type=str, default='runs/sweep/{}'.format(time.strftime('%Y%m%d-%H%M%S')))
+    return parser
+
+
+if __name__ == '__main__':
+    main(get_parser().parse_args())
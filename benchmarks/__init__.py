@@ -0,0 +1,12 @@
+"""
+Performance baselines for RL_CannonBall.
+
+    python -m benchmarks run --out baseline.json          # env, replay, learn and train suites
+    python -m benchmarks run --only env,replay --quick
+    python -m benchmarks compare baseline.json current.json --threshold 0.1
+
+`run` prints (or writes) a JSON document with machine info and one entry per
+metric, `compare` exits with status 1 when any metric of the second run is worse
+than the first by more than the threshold. The bench_*.py modules are standalone
+studies of a single component and are run directly with python -m.
+"""
@@ -0,0 +1,68 @@
+import argparse
+import json
+import sys
+import warnings
+
+import torch
+
+from benchmarks.suite import SUITES, run, compare
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='RL_CannonBall performance baselines')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Run the benchmarks and emit JSON')
+    run_parser.add_argument('--only', type=str, default=','.join(SUITES),
+                            help='Comma-separated suites out of {}'.format(', '.join(SUITES)))
+    run_parser.add_argument('--quick', action='store_true', help='Fewer configurations and shorter timings')
+    run_parser.add_argument('--threads', type=int, default=None, help='torch intra-op threads')
+    run_parser.add_argument('--out', type=str, default=None, help='Write the JSON here instead of stdout')
+
+    compare_parser = commands.add_parser('compare', help='Fail when a metric regressed against a baseline')
+    compare_parser.add_argument('baseline', type=str)
+    compare_parser.add_argument('current', type=str)
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='Largest tolerated relative slowdown, 0.1 is 10%%')
+    return parser
+
+
+def main(args):
+    if args.command == 'run':
+        if args.threads is not None:
+            torch.set_num_threads(args.threads)
+        suites = [name for name in args.only.split(',') if name]
+        unknown = set(suites) - set(SUITES)
+        if unknown:
+            raise SystemExit('Unknown suites: {}'.format(', '.join(sorted(unknown))))
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            report = run(suites, quick=args.quick)  # Progress goes to stderr, stdout stays valid JSON
+        text = json.dumps(report, indent=2)
+        if args.out is None:
+            print(text)
+        else:
+            with open(args.out, 'w') as f:
+                f.write(text + '\n')
+            print('Wrote {} metrics to {}'.format(len(report['results']), args.out), file=sys.stderr)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows, regressions = compare(baseline, current, args.threshold)
+    print('{:<40} {:>14} {:>14} {:>12} {:>9}'.format('metric', 'baseline', 'current', 'unit', 'change'))
+    for name, old, new, unit, change in rows:
+        flag = '  REGRESSION' if change < -args.threshold else ''
+        print('{:<40} {:>14.3f} {:>14.3f} {:>12} {:>+8.1%}{}'.format(name, old, new, unit, change, flag))
+    if baseline['machine'].get('processor') != current['machine'].get('processor'):
+        print('warning: runs come from different machines', file=sys.stderr)
+    if regressions:
+        print('{} of {} metrics regressed by more than {:.0%}'.format(len(regressions), len(rows), args.threshold))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(get_parser().parse_args()))
@@ -0,0 +1,82 @@
+"""
+Eager against compiled DDPG updates on the device-resident replay path.
+
+Times learn_many() of DDPG_GPU.DDPG (eager update without autograd) and of
+DeviceDDPG with the update run eagerly and through torch.compile, all sampling
+from the same DeviceReplayBuffer. The compiled learner is warmed up first,
+the compile time is reported separately. Any recompilation after the warm-up
+raises, so the reported speed is steady-state.
+
+    python -m benchmarks.bench_compile
+    python -m benchmarks.bench_compile --hidden_width 64 --batch_size 256 --device cuda
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+import torch._dynamo
+
+from DDPG.DDPG_GPU import DDPG
+from DDPG.device_learner import DeviceDDPG
+from DDPG.replay_buffer import DeviceReplayBuffer
+
+
+def fill(buffer, n, seed=0):
+    rng = np.random.default_rng(seed)
+    buffer.store(rng.uniform([0, 10], [np.pi/2, 1000], size=(n, 2)), rng.uniform(-100, 100, size=(n, 1)),
+                 rng.uniform(size=n), rng.uniform([0, 10], [np.pi/2, 1000], size=(n, 2)), np.zeros(n))
+
+
+def bench(agent, buffer, update_freq, rounds, device):
+    agent.learn_many(buffer, update_freq)  # Warm-up, compiles the compiled learner
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        agent.learn_many(buffer, update_freq)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / (rounds * update_freq)
+
+
+def main(args):
+    device = torch.device(args.device or ('cuda' if torch.cuda.is_available() else 'cpu'))
+    torch._dynamo.config.error_on_recompile = True
+    buffer = DeviceReplayBuffer(2, 1, max_size=args.buffer_size, device=device)
+    fill(buffer, args.buffer_size)
+    kwargs = {'hidden_width': args.hidden_width, 'batch_size': args.batch_size}
+
+    learners = [('DDPG_GPU eager', lambda: DDPG(2, 1, 100.0, **kwargs)),
+                ('DeviceDDPG eager', lambda: DeviceDDPG(2, 1, 100.0, device=device, compile=False, **kwargs)),
+                ('DeviceDDPG compiled', lambda: DeviceDDPG(2, 1, 100.0, device=device, **kwargs))]
+    print('device:{} \t hidden_width:{} \t batch_size:{} \t threads:{}'.format(
+        device, args.hidden_width, args.batch_size, torch.get_num_threads()))
+    print('{:<22} {:>12} {:>12} {:>10}'.format('learner', 'us/update', 'updates/s', 'warmup_s'))
+    results = {}
+    for name, make in learners:
+        torch.manual_seed(0)
+        agent = make()
+        start = time.perf_counter()
+        per_update = bench(agent, buffer, args.update_freq, args.rounds, device)
+        warmup = time.perf_counter() - start - per_update * args.rounds * args.update_freq
+        results[name] = per_update
+        print('{:<22} {:>12.1f} {:>12.0f} {:>10.1f}'.format(name, per_update * 1e6, 1 / per_update, warmup))
+    print('compiled speedup: {:.2f}x over DDPG_GPU eager, {:.2f}x over DeviceDDPG eager'.format(
+        results['DDPG_GPU eager'] / results['DeviceDDPG compiled'],
+        results['DeviceDDPG eager'] / results['DeviceDDPG compiled']))
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Eager vs torch.compile DDPG update throughput')
+    parser.add_argument('--device', type=str, default=None, help='Default: cuda when available, else cpu')
+    parser.add_argument('--hidden_width', type=int, default=32)
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--update_freq', type=int, default=50, help='Updates per learn_many() call')
+    parser.add_argument('--rounds', type=int, default=20, help='Timed learn_many() calls per learner')
+    parser.add_argument('--buffer_size', type=int, default=int(1e5))
+    return parser
+
+
+if __name__ == '__main__':
+    main(get_parser().parse_args())
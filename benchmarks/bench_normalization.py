@@ -0,0 +1,78 @@
+"""
+Environment steps DDPG needs to reach a target reward, with and without Normalizer.
+
+Trains the DDPG/DDPG.py agent through DDPG.sweep.run_trial once with
+reward_adapter and raw observations and once with running observation/return
+normalization, for every seed, and stops each run at the first evaluation that
+reaches --target_reward. A run that never gets there counts as
+--max_train_steps, so the reported reduction is a lower bound whenever the
+baseline misses the target. Runs go to a pool of spawned processes like a sweep.
+
+    python -m benchmarks.bench_normalization
+    python -m benchmarks.bench_normalization --seeds 0 1 2 3 4 --target_reward 10 --max_train_steps 200000
+"""
+import argparse
+import concurrent.futures
+import multiprocessing as mp
+import os
+import time
+
+import numpy as np
+
+from DDPG.sweep import DEFAULTS, _init_worker, run_trial
+
+
+def steps_to_target(row):
+    return row['steps'] if row['stopped'] == 'target_reward' else None
+
+
+def main(args):
+    settings = dict(env_name=args.env_name, max_train_steps=args.max_train_steps, random_steps=args.random_steps,
+                    update_freq=50, evaluate_freq=args.evaluate_freq, evaluate_states=args.evaluate_states,
+                    patience=0, min_delta=0.5, target_reward=args.target_reward, tensorboard=False, out=None)
+    runs = [(normalize, seed) for normalize in (False, True) for seed in args.seeds]
+    workers = min(args.workers or os.cpu_count() or 1, len(runs))
+    print('target_reward:{} \t max_train_steps:{} \t {} runs on {} workers'.format(
+        args.target_reward, args.max_train_steps, len(runs), workers))
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('spawn'),
+                                                initializer=_init_worker, initargs=(1,)) as pool:
+        futures = {(normalize, seed): pool.submit(run_trial, seed, dict(DEFAULTS, seed=seed),
+                                                  dict(settings, normalize=normalize))
+                   for normalize, seed in runs}
+        rows = {key: future.result() for key, future in futures.items()}
+
+    print('{:>5} {:>16} {:>10} {:>16} {:>10}'.format('seed', 'raw steps', 'raw best', 'normalized steps',
+                                                     'norm best'))
+    totals = {False: [], True: []}
+    for seed in args.seeds:
+        cells = []
+        for normalize in (False, True):
+            row = rows[normalize, seed]
+            steps = steps_to_target(row)
+            totals[normalize].append(args.max_train_steps if steps is None else steps)
+            cells += ['-' if steps is None else str(steps), '{:.1f}'.format(row['best_reward'])]
+        print('{:>5} {:>16} {:>10} {:>16} {:>10}'.format(seed, *cells))
+    raw, normalized = np.mean(totals[False]), np.mean(totals[True])
+    reached = {normalize: sum(steps_to_target(rows[normalize, seed]) is not None for seed in args.seeds)
+               for normalize in (False, True)}
+    print('mean steps to target: raw {:.0f} ({}/{} reached), normalized {:.0f} ({}/{} reached), {:.1f}x fewer'.format(
+        raw, reached[False], len(args.seeds), normalized, reached[True], len(args.seeds), raw / normalized))
+    print('{:.0f}s'.format(time.perf_counter() - start))
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Steps to a target reward with and without Normalizer')
+    parser.add_argument('--env_name', type=str, default='gym_CannonBall/CannonEnv-v0')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0, 1, 2])
+    parser.add_argument('--target_reward', type=float, default=0.0)
+    parser.add_argument('--max_train_steps', type=int, default=100000)
+    parser.add_argument('--random_steps', type=int, default=5000)
+    parser.add_argument('--evaluate_freq', type=int, default=2500)
+    parser.add_argument('--evaluate_states', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=None, help='Default: one run per core')
+    return parser
+
+
+if __name__ == '__main__':
+    main(get_parser().parse_args())
@@ -0,0 +1,50 @@
+"""
+Shot throughput of the physics backends.
+
+Times landing_distance() of the closed-form vacuum range against DragPhysics with
+RK4 and semi-implicit Euler integration, for a single cannon and for the batch
+sizes CannonVecEnv is used with. Also prints how far each integrator lands from
+the vacuum range when drag, wind and launch height are switched off.
+
+    python -m benchmarks.bench_physics
+"""
+import time
+
+import numpy as np
+
+from gym_CannonBall.envs.physics import AnalyticPhysics, DragPhysics
+
+
+def bench(physics, batch_size, min_time=0.5, n_batches=16):
+    # Every backend cycles through the same seeded batches, flight time depends on speed and angle
+    rng = np.random.default_rng(0)
+    speed = rng.uniform(0, 100, size=(n_batches, batch_size))
+    angle = rng.uniform(0, np.pi/2, size=(n_batches, batch_size))
+    shots = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < min_time:
+        i = (shots // batch_size) % n_batches
+        physics.landing_distance(speed[i], angle[i])
+        shots += batch_size
+    return shots / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    backends = {
+        'analytic': AnalyticPhysics(),
+        'drag_rk4': DragPhysics(method='rk4'),
+        'drag_semi_implicit': DragPhysics(method='semi_implicit'),
+    }
+
+    print('{:>20} {:>8} {:>14}'.format('backend', 'batch', 'shots/s'))
+    for name, physics in backends.items():
+        for batch_size in [1, 1024, 16384]:
+            print('{:>20} {:>8} {:>14.0f}'.format(name, batch_size, bench(physics, batch_size)))
+
+    speed = np.random.uniform(10, 100, size=10000)
+    angle = np.random.uniform(0.05, np.pi/2 - 0.05, size=10000)
+    exact = AnalyticPhysics().landing_distance(speed, angle)
+    print('\nmax |error| against the vacuum range with drag=0, launch_height=0:')
+    for method in ['rk4', 'semi_implicit']:
+        landing = DragPhysics(drag=0.0, launch_height=0.0, method=method).landing_distance(speed, angle)
+        print('{:>20} {:>10.3f} m'.format(method, np.abs(landing - exact).max()))
@@ -0,0 +1,88 @@
+"""
+Learner throughput of a DDPG population: P separate agents against one EnsembleDDPG.
+
+Counts member updates per second, i.e. P for every population step of the
+ensemble and one for every learn step of a separate DDPG. The separate agents
+are DDPG/DDPG.py learners with a CompactReplayBuffer each, stepped one after
+another in this process, like P single-threaded runs sharing a core. The
+ensemble is timed with its update step run eagerly and through torch.compile.
+
+    python -m benchmarks.bench_population
+    python -m benchmarks.bench_population --populations 8 32 --hidden_width 64
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from DDPG.DDPG import DDPG
+from DDPG.population import EnsembleDDPG
+from DDPG.replay_buffer import CompactReplayBuffer, EnsembleReplayBuffer
+
+
+def fill(buffer, n, population=None, seed=0):
+    # n rows in one batch store, or n stores of one row per member for an EnsembleReplayBuffer
+    rng = np.random.default_rng(seed)
+    shape = (n,) if population is None else (population,)
+    for _ in range(1 if population is None else n):
+        s = rng.uniform([0, 10], [np.pi/2, 1000], size=shape + (2,))
+        s_ = rng.uniform([0, 10], [np.pi/2, 1000], size=shape + (2,))
+        buffer.store(s, rng.uniform(-100, 100, size=shape + (1,)), rng.uniform(size=shape), s_, np.zeros(shape))
+
+
+def separate(population, args):
+    agents = [DDPG(2, 1, 100.0, load=False, hidden_width=args.hidden_width, batch_size=args.batch_size)
+              for _ in range(population)]
+    buffers = []
+    for i in range(population):
+        buffers.append(CompactReplayBuffer(2, 1, max_size=args.buffer_size))
+        fill(buffers[-1], args.buffer_size, seed=i)
+    for agent, buffer in zip(agents, buffers):  # Warm-up
+        agent.learn_many(buffer, args.update_freq)
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        for agent, buffer in zip(agents, buffers):
+            agent.learn_many(buffer, args.update_freq)
+    return population * args.rounds * args.update_freq / (time.perf_counter() - start)
+
+
+def ensemble(population, args, compile):
+    agent = EnsembleDDPG(population, 2, 1, 100.0, hidden_width=args.hidden_width, batch_size=args.batch_size,
+                         device='cpu', compile=compile)
+    buffer = EnsembleReplayBuffer(population, 2, 1, max_size=args.buffer_size)
+    fill(buffer, args.buffer_size, population=population)
+    agent.learn_many(buffer, args.update_freq)  # Warm-up, compiles the compiled step
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        agent.learn_many(buffer, args.update_freq)
+    return population * args.rounds * args.update_freq / (time.perf_counter() - start)
+
+
+def main(args):
+    torch.set_num_threads(args.threads)
+    print('hidden_width:{} \t batch_size:{} \t threads:{}'.format(args.hidden_width, args.batch_size, args.threads))
+    print('{:>10} {:>16} {:>16} {:>8} {:>16} {:>8}'.format(
+        'population', 'separate upd/s', 'eager upd/s', 'speedup', 'compiled upd/s', 'speedup'))
+    for population in args.populations:
+        base = separate(population, args)
+        eager = ensemble(population, args, compile=False)
+        compiled = ensemble(population, args, compile=True)
+        print('{:>10} {:>16.0f} {:>16.0f} {:>7.1f}x {:>16.0f} {:>7.1f}x'.format(
+            population, base, eager, eager / base, compiled, compiled / base))
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Separate DDPG agents vs a batched EnsembleDDPG')
+    parser.add_argument('--populations', type=int, nargs='+', default=[4, 16, 64])
+    parser.add_argument('--hidden_width', type=int, default=32)
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--update_freq', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=4, help='Timed learn_many() calls per learner')
+    parser.add_argument('--buffer_size', type=int, default=10000, help='Replay rows of every member')
+    parser.add_argument('--threads', type=int, default=1)
+    return parser
+
+
+if __name__ == '__main__':
+    main(get_parser().parse_args())
@@ -0,0 +1,40 @@
+"""
+Per-sample cost of PrioritizedReplayBuffer against its capacity.
+
+Fills buffers of growing capacity and times one stratified sample() followed by
+update_priorities() for the whole batch. The cost per sampled transition should
+grow with log2(capacity), not with capacity itself.
+
+    python -m benchmarks.bench_prioritized_replay
+"""
+import math
+import time
+
+import numpy as np
+
+from DDPG.replay_buffer import PrioritizedReplayBuffer
+
+
+def bench(capacity, batch_size=256, repeats=200, state_dim=2, action_dim=1):
+    buffer = PrioritizedReplayBuffer(state_dim, action_dim, max_size=capacity)
+    chunk = min(capacity, 100000)
+    for start in range(0, capacity, chunk):
+        n = min(chunk, capacity - start)
+        buffer.store(np.random.rand(n, state_dim), np.random.rand(n, action_dim), np.random.rand(n),
+                     np.random.rand(n, state_dim), np.zeros(n))
+    buffer.update_priorities(np.arange(capacity), np.random.exponential(size=capacity))
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        batch = buffer.sample(batch_size)
+        buffer.update_priorities(batch[-1], np.random.exponential(size=batch_size))
+    elapsed = time.perf_counter() - start
+    return elapsed / (repeats * batch_size)
+
+
+if __name__ == '__main__':
+    print('{:>10} {:>8} {:>14} {:>16}'.format('capacity', 'log2', 'us/sample', 'us/sample/log2'))
+    for capacity in [int(1e3), int(1e4), int(1e5), int(1e6)]:
+        per_sample = bench(capacity) * 1e6
+        depth = math.ceil(math.log2(capacity))
+        print('{:>10} {:>8} {:>14.3f} {:>16.4f}'.format(capacity, depth, per_sample, per_sample / depth))
@@ -0,0 +1,86 @@
+"""
+Load generator for DDPG.serving.
+
+Opens `--clients` concurrent connections that each send `--requests` aim requests
+back to back and reports client-side latency percentiles and throughput, followed
+by the server's own counters. Without --port it starts a localhost stand-in server
+in the same process, using --model or a freshly initialized Actor.
+
+    python -m benchmarks.bench_serving --clients 256 --requests 200
+    python -m benchmarks.bench_serving --port 8765   # against a running server
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import numpy as np
+
+from DDPG.DDPG import Actor
+from DDPG.serving import BatchedPolicy, load_actor, serve
+
+
+async def client(host, port, n_requests, seed, latencies):
+    rng = np.random.default_rng(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    for _ in range(n_requests):
+        request = {'angle': float(rng.uniform(0, np.pi/2)), 'distance': float(rng.uniform(10, 1000))}
+        start = time.perf_counter()
+        writer.write((json.dumps(request) + '\n').encode())
+        await writer.drain()
+        json.loads(await reader.readline())
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+
+
+async def query_stats(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b'{"stats": true}\n')
+    await writer.drain()
+    stats = json.loads(await reader.readline())
+    writer.close()
+    return stats
+
+
+async def main(args):
+    server = None
+    host, port = args.host, args.port
+    if port is None:  # Localhost stand-in
+        if args.model is not None and os.path.exists(args.model):
+            actor = load_actor(args.model)
+        else:
+            actor = Actor(2, 1, 32, 100.0).eval()
+        policy = BatchedPolicy(actor, args.max_batch_size, args.max_wait_ms)
+        server = await serve(policy, host, 0)
+        port = server.sockets[0].getsockname()[1]
+
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[client(host, port, args.requests, seed, latencies) for seed in range(args.clients)])
+    elapsed = time.perf_counter() - start
+
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    print('clients:{} \t requests:{} \t requests/s:{:.0f} \t p50:{:.2f}ms \t p99:{:.2f}ms'.format(
+        args.clients, len(latencies), len(latencies) / elapsed, p50, p99))
+    print('server:', await query_stats(host, port))
+    if server is not None:
+        server.close()
+        await server.wait_closed()
+        await policy.stop()
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Load generator for the batched policy server')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=None, help='Server port, omit to start a local stand-in')
+    parser.add_argument('--model', type=str, default=None, help='Actor for the stand-in server')
+    parser.add_argument('--clients', type=int, default=256)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per client')
+    parser.add_argument('--max_batch_size', type=int, default=256)
+    parser.add_argument('--max_wait_ms', type=float, default=2.0)
+    return parser
+
+
+if __name__ == '__main__':
+    asyncio.run(main(get_parser().parse_args()))
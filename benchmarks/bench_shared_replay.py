@@ -0,0 +1,134 @@
+"""
+N local learner processes on private ReplayBuffers against one SharedReplayBuffer.
+
+For every N, spawns N reader processes that each sample(batch_size) for
+--seconds, first from a private 1e6-row ReplayBuffer built in the process (what
+every learner does today) and then from one SharedReplayBuffer they all
+attach to, while this process keeps appending single transitions to it as the
+collector. Reports the replay memory of all N learners, the samples/s of one
+reader and the collector's append rate, next to the rate of sending the same
+transitions through a multiprocessing.Queue.
+
+    python -m benchmarks.bench_shared_replay
+    python -m benchmarks.bench_shared_replay --readers 1 4 8 --seconds 5
+"""
+import argparse
+import multiprocessing as mp
+import time
+
+import numpy as np
+
+from DDPG.replay_buffer import ReplayBuffer, SharedReplayBuffer
+
+STATE_DIM, ACTION_DIM = 2, 1
+
+
+def transitions(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.uniform([0, 10], [np.pi/2, 1000], size=(n, STATE_DIM)), rng.uniform(-100, 100, size=(n, ACTION_DIM)),
+            rng.uniform(size=n), rng.uniform([0, 10], [np.pi/2, 1000], size=(n, STATE_DIM)), np.zeros(n))
+
+
+def private_reader(fill, batch_size, ready, start, seconds, results):
+    buffer = ReplayBuffer(STATE_DIM, ACTION_DIM)
+    for s, a, r, s_, dw in zip(*transitions(fill)):
+        buffer.store(s, a, r, s_, dw)
+    results.put(sample_loop(buffer, batch_size, ready, start, seconds))
+
+
+def shared_reader(buffer, batch_size, ready, start, seconds, results):
+    results.put(sample_loop(buffer, batch_size, ready, start, seconds))
+    buffer.close()
+
+
+def sample_loop(buffer, batch_size, ready, start, seconds):
+    buffer.sample(batch_size)  # The first sample imports torch
+    ready.put(None)
+    start.wait()
+    n = 0
+    begin = time.perf_counter()
+    while time.perf_counter() - begin < seconds:
+        buffer.sample(batch_size)
+        n += 1
+    return n * batch_size / (time.perf_counter() - begin)
+
+
+def run_readers(ctx, target, args, readers, seconds, collect=None):
+    ready, start, results = ctx.Queue(), ctx.Event(), ctx.Queue()
+    processes = [ctx.Process(target=target, args=args + (ready, start, seconds, results)) for _ in range(readers)]
+    for process in processes:
+        process.start()
+    for _ in processes:  # Every reader has filled its buffer and sampled once before the clock starts
+        ready.get()
+    start.set()
+    appended = collect(seconds) if collect is not None else 0
+    rates = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return np.mean(rates), appended
+
+
+def queue_rate(ctx, seconds, s, a, r, s_, dw):
+    # Single transitions pickled through a Queue to one consumer, the alternative to a shared buffer
+    queue = ctx.Queue(maxsize=10000)
+    consumer = ctx.Process(target=drain, args=(queue,))
+    consumer.start()
+    n = 0
+    begin = time.perf_counter()
+    while time.perf_counter() - begin < seconds:
+        i = n % s.shape[0]
+        queue.put((s[i], a[i], r[i], s_[i], dw[i]))
+        n += 1
+    elapsed = time.perf_counter() - begin
+    queue.put(None)
+    consumer.join()
+    return n / elapsed
+
+
+def drain(queue):
+    while queue.get() is not None:
+        pass
+
+
+def main(args):
+    ctx = mp.get_context('spawn')
+    s, a, r, s_, dw = transitions(args.fill)
+    private_bytes = sum(f.nbytes for f in (np.zeros((int(1e6), d)) for d in (STATE_DIM, ACTION_DIM, 1, STATE_DIM, 1)))
+    print('fill:{} \t batch_size:{} \t {:.0f} MB per private ReplayBuffer'.format(
+        args.fill, args.batch_size, private_bytes / 2**20))
+    print('{:>7} {:>12} {:>12} {:>16} {:>16} {:>16}'.format(
+        'readers', 'private MB', 'shared MB', 'private smp/s', 'shared smp/s', 'appends/s'))
+    for readers in args.readers:
+        private, _ = run_readers(ctx, private_reader, (args.fill, args.batch_size), readers, args.seconds)
+        with SharedReplayBuffer(STATE_DIM, ACTION_DIM) as buffer:
+            buffer.store(s, a, r, s_, dw)
+
+            def collect(seconds):
+                n = 0
+                begin = time.perf_counter()
+                while time.perf_counter() - begin < seconds:
+                    i = n % args.fill
+                    buffer.store(s[i], a[i], r[i], s_[i], dw[i])
+                    n += 1
+                return n / (time.perf_counter() - begin)
+
+            shared, appended = run_readers(ctx, shared_reader, (buffer, args.batch_size), readers, args.seconds,
+                                           collect)
+            shared_bytes = buffer.shm.size
+        print('{:>7} {:>12.0f} {:>12.0f} {:>16.0f} {:>16.0f} {:>16.0f}'.format(
+            readers, readers * private_bytes / 2**20, shared_bytes / 2**20, private, shared, appended))
+    print('multiprocessing.Queue: {:.0f} transitions/s to one consumer'.format(
+        queue_rate(ctx, args.seconds, s, a, r, s_, dw)))
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Private ReplayBuffers vs one SharedReplayBuffer')
+    parser.add_argument('--readers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--fill', type=int, default=100000, help='Transitions in every buffer before sampling')
+    parser.add_argument('--batch_size', type=int, default=256)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    return parser
+
+
+if __name__ == '__main__':
+    main(get_parser().parse_args())
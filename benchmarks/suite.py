@@ -0,0 +1,245 @@
+"""
+Benchmarks behind python -m benchmarks.
+
+Every bench_* function returns a dict of metric name -> {'value', 'unit',
+'higher_is_better'}, so runs can be merged into one JSON document and compared
+metric by metric.
+"""
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import gym
+import numpy as np
+import torch
+
+import gym_CannonBall
+from gym_CannonBall.seeding import BlockSampler, make_rng, spawn_seeds
+from DDPG.DDPG import DDPG, reward_adapter
+from DDPG.replay_buffer import ReplayBuffer, CompactReplayBuffer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATE_DIM = 2
+ACTION_DIM = 1
+MAX_ACTION = 100.0
+
+
+def metric(value, unit, higher_is_better):
+    return {'value': float(value), 'unit': unit, 'higher_is_better': higher_is_better}
+
+
+def rate(fn, min_time=1.0, min_calls=10):
+    # Calls of fn() per second, measured for at least min_time seconds
+    fn()  # Warm up caches and lazy initialisation
+    calls = 0
+    start = time.perf_counter()
+    while calls < min_calls or time.perf_counter() - start < min_time:
+        fn()
+        calls += 1
+    return calls / (time.perf_counter() - start)
+
+
+def machine_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, timeout=10,
+                                cwd=REPO_ROOT).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'torch': torch.__version__,
+        'gym': gym.__version__,
+        'torch_threads': torch.get_num_threads(),
+        'cuda': torch.cuda.get_device_name(0) if torch.cuda.is_available() else None,
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def random_transitions(n):
+    return (np.random.uniform(0, 1000, (n, STATE_DIM)), np.random.uniform(0, MAX_ACTION, (n, ACTION_DIM)),
+            np.random.uniform(-100, 100, n), np.random.uniform(0, 1000, (n, STATE_DIM)), np.zeros(n))
+
+
+def fill(buffer, n, chunk=100000):
+    if isinstance(buffer, ReplayBuffer):  # Stores one transition at a time
+        s, a, r, s_, dw = random_transitions(n)
+        for i in range(n):
+            buffer.store(s[i], a[i], r[i], s_[i], dw[i])
+        return
+    for start in range(0, n, chunk):
+        buffer.store(*random_transitions(min(chunk, n - start)))
+
+
+def bench_env(min_time=1.0):
+    env = gym.make('gym_CannonBall/CannonEnv-v0').unwrapped
+    env.reset()
+    action = np.array([50.0], dtype=np.float32)
+    results = {
+        'env.step_per_s': metric(rate(lambda: env.step(action), min_time), 'steps/s', True),
+        'env.reset_per_s': metric(rate(env.reset, min_time), 'resets/s', True),
+    }
+
+    num_envs = 1024
+    vec_env = gym.make('gym_CannonBall/CannonVecEnv-v0', num_envs=num_envs).unwrapped
+    vec_env.reset()
+    actions = np.full((num_envs, 1), 50.0, dtype=np.float32)
+    results['vec_env.transitions_per_s'] = metric(rate(lambda: vec_env.step(actions), min_time) * num_envs,
+                                                  'transitions/s', True)
+    return results
+
+
+def bench_replay(fill_levels=(int(1e3), int(1e4), int(1e5), int(1e6)), batch_size=256, min_time=0.5):
+    transition = [x[0] for x in random_transitions(1)]
+    results = {}
+    buffers = {'list': lambda: ReplayBuffer(STATE_DIM, ACTION_DIM),
+               'compact': lambda: CompactReplayBuffer(STATE_DIM, ACTION_DIM)}
+    for name, make in buffers.items():
+        for level in fill_levels:
+            if name == 'list' and level > int(1e5):  # Python-loop fill, too slow to be worth waiting for
+                continue
+            buffer = make()
+            fill(buffer, level)
+            # store() overwrites the oldest rows once full, keep the fill level constant while timing it
+            store = rate(lambda: buffer.store(*transition), min_time)
+            buffer.count, buffer.size = level % buffer.max_size, level
+            sample = rate(lambda: buffer.sample(batch_size), min_time)
+            results['replay.{}.store_us@{}'.format(name, level)] = metric(1e6 / store, 'us', False)
+            results['replay.{}.sample{}_us@{}'.format(name, batch_size, level)] = metric(1e6 / sample, 'us', False)
+    return results
+
+
+def bench_learn(configs=((32, 32), (64, 256), (256, 256)), n_updates=50, min_time=1.0):
+    # (hidden_width, batch_size) pairs, learn() one batch at a time and learn_many() in blocks of n_updates
+    buffer = CompactReplayBuffer(STATE_DIM, ACTION_DIM)
+    fill(buffer, int(1e5))
+    results = {}
+    for hidden_width, batch_size in configs:
+        agent = DDPG(STATE_DIM, ACTION_DIM, MAX_ACTION, load=False, hidden_width=hidden_width, batch_size=batch_size)
+        key = 'h{}_b{}'.format(hidden_width, batch_size)
+        results['learn.{}.updates_per_s'.format(key)] = metric(rate(lambda: agent.learn(buffer), min_time),
+                                                               'updates/s', True)
+        results['learn_many.{}.updates_per_s'.format(key)] = metric(
+            rate(lambda: agent.learn_many(buffer, n_updates), min_time) * n_updates, 'updates/s', True)
+    return results
+
+
+def bench_train(n_steps=5000, random_steps=1000, update_freq=50, seed=0):
+    # The interaction loop of DDPG/DDPG.py without evaluation, logging and checkpoints
+    env_seed, noise_seed = spawn_seeds(seed, 2)
+    torch.manual_seed(seed)
+    env = gym.make('gym_CannonBall/CannonEnv-v0')
+    env.reset(seed=env_seed)
+    env.action_space.seed(seed)
+    max_action = float(env.action_space.high[0])
+    max_episode_steps = env.unwrapped._max_episode_steps
+    noise_std = 0.1 * max_action
+    noise = BlockSampler(make_rng(noise_seed), lambda rng, n: rng.normal(0, noise_std, size=(n, ACTION_DIM)))
+    agent = DDPG(STATE_DIM, ACTION_DIM, max_action, load=False)
+    replay_buffer = CompactReplayBuffer(STATE_DIM, ACTION_DIM)
+
+    total_steps = 0
+    start = None
+    while total_steps < random_steps + n_steps:
+        s, _ = env.reset()
+        episode_steps = 0
+        done = False
+        while not done:
+            if total_steps == random_steps:  # Only time the policy-driven part of the loop
+                start = time.perf_counter()
+            episode_steps += 1
+            if total_steps < random_steps:
+                a = env.action_space.sample()
+            else:
+                a = agent.choose_action(s)
+                a = (a + noise()).clip(-max_action, max_action)
+            s_, r, done, _ = env.step(a)
+            r = reward_adapter(r, 0)
+            dw = done and episode_steps != max_episode_steps
+            replay_buffer.store(s, a, r, s_, dw)
+            s = s_
+            if total_steps >= random_steps and total_steps % update_freq == 0:
+                agent.learn_many(replay_buffer, update_freq)
+            total_steps += 1
+    elapsed = time.perf_counter() - start
+    return {'train.env_steps_per_s': metric(n_steps / elapsed, 'steps/s', True)}
+
+
+# Modules that evaluation workers and tools import, none of them should pull in torch or tensorboard
+LIGHT_MODULES = ('gym_CannonBall', 'gym_CannonBall.oracle', 'DDPG.replay_buffer', 'DDPG.evaluator',
+                 'DDPG.metrics', 'DDPG.numpy_policy', 'DDPG.dataset')
+
+_IMPORT_PROBE = '''
+import sys, time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start, 'torch._C' in sys.modules)  # A lazily imported torch has no _C yet
+'''
+
+
+def bench_import(modules=LIGHT_MODULES + ('DDPG.DDPG',), repeats=3):
+    # Import time of every module in a fresh interpreter, best of `repeats`.
+    # A light module that ends up importing torch is reported as an error
+    results = {}
+    for module in modules:
+        best = float('inf')
+        for _ in range(repeats):
+            out = subprocess.run([sys.executable, '-W', 'ignore', '-c', _IMPORT_PROBE.format(module=module)],
+                                 capture_output=True, text=True, cwd=REPO_ROOT, check=True).stdout.split()
+            best = min(best, float(out[0]))
+            if module in LIGHT_MODULES and out[1] == 'True':
+                raise RuntimeError('Importing {} loads torch'.format(module))
+        results['import.{}_s'.format(module)] = metric(best, 's', False)
+    return results
+
+
+SUITES = {
+    'import': bench_import,
+    'env': bench_env,
+    'replay': bench_replay,
+    'learn': bench_learn,
+    'train': bench_train,
+}
+
+QUICK = {
+    'import': dict(repeats=1),
+    'env': dict(min_time=0.2),
+    'replay': dict(fill_levels=(int(1e3), int(1e5)), min_time=0.1),
+    'learn': dict(configs=((32, 32), (256, 256)), min_time=0.3),
+    'train': dict(n_steps=1000, random_steps=200),
+}
+
+
+def run(suites=tuple(SUITES), quick=False, verbose=True):
+    results = {}
+    for name in suites:
+        start = time.perf_counter()
+        results.update(SUITES[name](**(QUICK[name] if quick else {})))
+        if verbose:
+            print('{} done in {:.1f}s'.format(name, time.perf_counter() - start), file=sys.stderr, flush=True)
+    return {'machine': machine_info(), 'quick': quick, 'results': results}
+
+
+def compare(baseline, current, threshold=0.1):
+    # Relative change of every metric present in both runs, positive is better,
+    # returns (rows, regressions) where a regression is worse by more than threshold
+    rows = []
+    regressions = []
+    for name, old in sorted(baseline['results'].items()):
+        new = current['results'].get(name)
+        if new is None or old['value'] == 0:
+            continue
+        change = new['value'] / old['value'] - 1
+        if not old['higher_is_better']:
+            change = old['value'] / new['value'] - 1
+        row = (name, old['value'], new['value'], old['unit'], change)
+        rows.append(row)
+        if change < -threshold:
+            regressions.append(row)
+    return rows, regressions
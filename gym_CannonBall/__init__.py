@@ -4,3 +4,32 @@ register(
     id="gym_CannonBall/CannonEnv-v0",
     entry_point="gym_CannonBall.envs:CannonEnv",
 )
+
+register(
+    id="gym_CannonBall/CannonVecEnv-v0",
+    entry_point="gym_CannonBall.envs:CannonVecEnv",
+)
+
+register(
+    id="gym_CannonBall/CannonDragEnv-v0",
+    entry_point="gym_CannonBall.envs:CannonEnv",
+    kwargs={"physics": "drag"},
+)
+
+register(
+    id="gym_CannonBall/CannonDragVecEnv-v0",
+    entry_point="gym_CannonBall.envs:CannonVecEnv",
+    kwargs={"physics": "drag"},
+)
+
+register(
+    id="gym_CannonBall/CannonMultiShotEnv-v0",
+    entry_point="gym_CannonBall.envs:CannonEnv",
+    kwargs={"max_shots": 5},
+)
+
+register(
+    id="gym_CannonBall/CannonMultiShotVecEnv-v0",
+    entry_point="gym_CannonBall.envs:CannonVecEnv",
+    kwargs={"max_shots": 5},
+)
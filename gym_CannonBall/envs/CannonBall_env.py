@@ -3,13 +3,16 @@ from gym import spaces
 import numpy as np
 import math
 
-MIN_REWARD = -100
-MAX_REWARD = 100
+from gym_CannonBall.envs.physics import MIN_REWARD, MAX_REWARD, GRAVITY, draw_start_states, make_physics
+from gym_CannonBall.seeding import BlockSampler, make_rng, spawn_seeds
+
 
 class CannonEnv(gym.Env):
 
-    def __init__(self):
+    def __init__(self, physics=None, physics_kwargs=None, max_shots=1, hit_radius=1.0):
         super(CannonEnv, self).__init__()
+        # None keeps the vacuum range formula, see gym_CannonBall.envs.physics for the alternatives
+        self.physics = make_physics(physics, **(physics_kwargs or {}))
         
         # Define action and observation space
         # They must be gym.spaces objects
@@ -18,8 +21,11 @@ class CannonEnv(gym.Env):
         
         # Example for using continuous observations (angle in radians and distance):
         self.observation_space = spaces.Box(low=np.array([0, 0]), high=np.array([np.pi/2, 1000]), dtype=np.float32)
-        self._max_episode_steps = 1
-        self.info = {}
+        # With max_shots > 1 the agent fires correction shots from where the last one landed,
+        # the episode ends after max_shots or once a shot lands within hit_radius of the target
+        self._max_episode_steps = max_shots
+        self.hit_radius = hit_radius
+        self.info = {}  # Info of the last step, final_info only once an episode ends
         # Initialize state
         self.angle = None
         self.distance_to_target = None
@@ -27,6 +33,7 @@ class CannonEnv(gym.Env):
         self.target_distance = None  # Random target distance for each episode
         self.episode_reward = 0
         self.episode_length = 0
+        self.start_states = None  # Episode starts, drawn in blocks from np_random on the first reset
 
     def step(self, action: float):
         # Execute one time step within the environment
@@ -38,20 +45,15 @@ class CannonEnv(gym.Env):
             reward = MIN_REWARD
         else:
             reward = self._calculate_reward()
-        done = True  # In this case, we end the episode after one shot
-                
         self.episode_reward += reward
         self.episode_length += 1
+        done = self.episode_length >= self._max_episode_steps or abs(self.distance_to_target) <= self.hit_radius
 
+        # A fresh dict every step, so mid-episode steps never carry the last episode's statistics
+        self.info = {}
         if done:
             # Populate the info dictionary with episodic information
-            self.info['final_info'] = {
-                'episode': {
-                    'r': self.episode_reward,
-                    'l': self.episode_length,
-                }
-                # Include any other information you want to track
-            }
+            self.info['final_info'] = {'episode': {'r': self.episode_reward, 'l': self.episode_length}}
             # Reset episode information
             self.episode_reward = 0
             self.episode_length = 0
@@ -59,13 +61,26 @@ class CannonEnv(gym.Env):
         # Return the next observation, reward, done, and info
         return self._get_obs(), reward, done, self.info
 
-    def reset(self):
-        # Reset the state of the environment to an initial state
-        self.angle = np.random.uniform(low=0, high=np.pi/2)
-        self.distance_to_target = np.random.uniform(low=10, high=1000)  # Random target distance for each episode
+    def reset(self, seed=None, options=None):
+        # Reset the state of the environment to an initial state,
+        # a seed (int or SeedSequence) restarts the env's random streams from it
+        if seed is not None:
+            self._seed(seed)
+        if self.start_states is None:  # Never seeded, gym's np_random draws fresh entropy
+            self.start_states = BlockSampler(self.np_random, draw_start_states, block_size=1024)
+        self.angle, self.distance_to_target = self.start_states().tolist()  # Random target distance for each episode
         self.target_distance = self.distance_to_target
+        self.info = {}
         return self._get_obs(),self.info
 
+    def _seed(self, seed):
+        # Start states and physics noise get independent children of the seed
+        start_seed, physics_seed = spawn_seeds(seed, 2)
+        self.np_random = make_rng(start_seed)
+        self.start_states = BlockSampler(self.np_random, draw_start_states, block_size=1024)
+        if hasattr(self.physics, 'rng'):
+            self.physics.rng = make_rng(physics_seed)
+
     def render(self, mode='human', close=False):
         # Render the environment to the screen
         pass  # For simplicity, we are not implementing rendering here
@@ -79,15 +94,19 @@ class CannonEnv(gym.Env):
         # You would implement the physics of the cannon shot here
         # For now, we'll just set the distance to a random value
         # self.distance_to_target = np.random.uniform(low=0, high=self.target_distance)
-        self.current_distance = speed**2 * math.sin(2*self.angle)/(9.80665)
-        # make some noise
-        #self.current_distance += np.random.normal(0,1,1)[0]
+        if self.physics is None:
+            self.current_distance = speed**2 * math.sin(2*self.angle)/GRAVITY
+        else:
+            self.current_distance = float(np.ravel(self.physics.landing_distance(speed, self.angle))[0])
+        # make some noise: DragPhysics(noise_std=...) adds it
         # print(f'Current dist: {self.current_distance:.1f}')
-        self.distance_to_target = self.distance_to_target - self.current_distance
+        # The shot flies towards the target, from behind it after an overshoot
+        self.distance_to_target = self.distance_to_target - math.copysign(self.current_distance, self.distance_to_target)
 
     def _calculate_reward(self):
         # Helper method to calculate the reward
         # For now, we'll just return a reward based on how close the shot is to the target
-        reward = max(MIN_REWARD, MAX_REWARD - abs(self.target_distance - self.current_distance))
+        # distance_to_target is what is left after the shot, target - landing point for the first one
+        reward = max(MIN_REWARD, MAX_REWARD - abs(self.distance_to_target))
         #reward = 1/abs(self.target_distance - self.current_distance)
         return reward
\ No newline at end of file
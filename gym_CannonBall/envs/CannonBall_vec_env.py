@@ -0,0 +1,125 @@
+import gym
+from gym import spaces
+import numpy as np
+
+from gym_CannonBall.envs.physics import draw_start_states, shot_distance, shot_reward, make_physics
+from gym_CannonBall.seeding import make_rng, spawn_seeds
+
+
+class CannonVecEnv(gym.Env):
+    """
+    Batched CannonEnv: N independent cannons stepped with one NumPy call.
+
+    All per-cannon state (angle, target distance, episode statistics) lives in
+    arrays of shape (N,). Finished episodes are reset automatically inside step(),
+    the observation that ended them is reported in info['final_observation'].
+    max_shots and hit_radius give the multi-shot mode of CannonEnv, every cannon
+    keeps firing correction shots until it hits or runs out of shots. The start
+    states of all cannons reset in one step come from one draw of np_random.
+    """
+
+    def __init__(self, num_envs=1024, physics=None, physics_kwargs=None, max_shots=1, hit_radius=1.0):
+        super(CannonVecEnv, self).__init__()
+        self.num_envs = num_envs
+        # None keeps the vacuum range formula, other backends integrate the whole batch in lockstep
+        self.physics = make_physics(physics, **(physics_kwargs or {}))
+
+        # Spaces of a single cannon, same as CannonEnv
+        self.single_action_space = spaces.Box(low=0, high=100, shape=(1,), dtype=np.float32)
+        self.single_observation_space = spaces.Box(low=np.array([0, 0], dtype=np.float32),
+                                                   high=np.array([np.pi/2, 1000], dtype=np.float32),
+                                                   dtype=np.float32)
+        # Batched spaces, one row per cannon
+        self.action_space = spaces.Box(low=0, high=100, shape=(num_envs, 1), dtype=np.float32)
+        self.observation_space = spaces.Box(low=np.tile(self.single_observation_space.low, (num_envs, 1)),
+                                            high=np.tile(self.single_observation_space.high, (num_envs, 1)),
+                                            dtype=np.float32)
+        self._max_episode_steps = max_shots
+        self.hit_radius = hit_radius
+
+        # Initialize state
+        self.angle = np.zeros(num_envs)
+        self.distance_to_target = np.zeros(num_envs)
+        self.current_distance = np.zeros(num_envs)
+        self.target_distance = np.zeros(num_envs)
+        self.episode_reward = np.zeros(num_envs)
+        self.episode_length = np.zeros(num_envs, dtype=np.int64)
+        self._remaining = np.zeros(num_envs)  # Distance to the target before the current shot
+        self._done = np.zeros(num_envs, dtype=bool)
+
+        # The info arrays are allocated once and overwritten on every step
+        self.info = {
+            'final_observation': np.zeros((num_envs, 2), dtype=np.float32),
+            '_final_observation': np.zeros(num_envs, dtype=bool),
+            'final_info': {
+                'episode': {
+                    'r': np.zeros(num_envs),
+                    'l': np.zeros(num_envs, dtype=np.int64),
+                }
+            },
+        }
+
+    def step(self, actions):
+        # Execute one time step in every cannon at once
+        speed = np.asarray(actions, dtype=np.float64).reshape(self.num_envs)
+        np.abs(self.distance_to_target, out=self._remaining)
+        self._take_shot(speed)
+
+        reward = shot_reward(speed, self._remaining, self.current_distance)
+        self.episode_reward += reward
+        self.episode_length += 1
+        done = self._done
+        np.less_equal(np.abs(self.distance_to_target, out=self._remaining), self.hit_radius, out=done)
+        done |= self.episode_length >= self._max_episode_steps
+
+        # Record episodic information of the finished cannons, then auto-reset them
+        self.info['_final_observation'][:] = done
+        self.info['final_observation'][done] = self._get_obs()[done]
+        self.info['final_info']['episode']['r'][done] = self.episode_reward[done]
+        self.info['final_info']['episode']['l'][done] = self.episode_length[done]
+        self._reset_envs(done)
+
+        return self._get_obs(), reward, done.copy(), self.info
+
+    def reset(self, seed=None, options=None):
+        # Reset the state of every cannon to an initial state,
+        # a seed (int or SeedSequence) restarts the env's random streams from it
+        if seed is not None:
+            self._seed(seed)
+        self._reset_envs(np.ones(self.num_envs, dtype=bool))
+        return self._get_obs(), self.info
+
+    def _seed(self, seed):
+        # Start states and physics noise get independent children of the seed
+        start_seed, physics_seed = spawn_seeds(seed, 2)
+        self.np_random = make_rng(start_seed)
+        if hasattr(self.physics, 'rng'):
+            self.physics.rng = make_rng(physics_seed)
+
+    def render(self, mode='human', close=False):
+        pass
+
+    def _reset_envs(self, mask):
+        n = int(np.count_nonzero(mask))
+        if n == 0:
+            return
+        start = draw_start_states(self.np_random, n)
+        self.angle[mask] = start[:, 0]
+        self.distance_to_target[mask] = start[:, 1]
+        self.target_distance[mask] = self.distance_to_target[mask]
+        self.episode_reward[mask] = 0
+        self.episode_length[mask] = 0
+
+    def _get_obs(self):
+        obs = np.empty((self.num_envs, 2), dtype=np.float32)
+        obs[:, 0] = self.angle
+        obs[:, 1] = np.abs(self.distance_to_target)
+        return obs
+
+    def _take_shot(self, speed):
+        if self.physics is None:
+            self.current_distance[:] = shot_distance(speed, self.angle)
+        else:
+            self.current_distance[:] = self.physics.landing_distance(speed, self.angle)
+        # The shot flies towards the target, from behind it after an overshoot
+        self.distance_to_target -= np.copysign(self.current_distance, self.distance_to_target)
@@ -1 +1,2 @@
 from gym_CannonBall.envs.CannonBall_env import CannonEnv
+from gym_CannonBall.envs.CannonBall_vec_env import CannonVecEnv
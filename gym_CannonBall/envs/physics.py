@@ -0,0 +1,156 @@
+import math
+
+import numpy as np
+
+from gym_CannonBall.seeding import make_rng
+
+MIN_REWARD = -100
+MAX_REWARD = 100
+GRAVITY = 9.80665
+
+
+def draw_start_states(rng, n):
+    # n episode starts as (angle, target distance) rows: angle in [0, pi/2), target in [10, 1000)
+    return rng.uniform(low=(0, 10), high=(np.pi/2, 1000), size=(n, 2))
+
+
+def shot_distance(speed, angle):
+    # Vacuum range of a shot, works on scalars and NumPy arrays alike
+    return speed**2 * np.sin(2*angle)/GRAVITY
+
+
+def shot_reward(speed, target_distance, current_distance):
+    # Vectorized version of CannonEnv._calculate_reward, non-positive speeds get MIN_REWARD
+    reward = np.maximum(MIN_REWARD, MAX_REWARD - np.abs(target_distance - current_distance))
+    return np.where(speed <= 0.0, MIN_REWARD, reward)
+
+
+class AnalyticPhysics(object):
+    # Vacuum range formula as a physics object, same result as the envs' built-in path
+
+    def landing_distance(self, speed, angle):
+        return shot_distance(np.asarray(speed, dtype=np.float64), np.asarray(angle, dtype=np.float64))
+
+
+class DragPhysics(object):
+    """
+    Projectile with quadratic air drag, horizontal wind and a raised launch point.
+
+    acceleration = -drag * |v - wind| * (v - wind) - g * y_hat
+
+    Every shot of a batch is integrated in lockstep with a fixed step `dt`, either
+    with classic RK4 or with semi-implicit Euler. Shots that hit the ground are
+    masked out of the following steps, their landing point is interpolated linearly
+    inside the step that crossed y = 0.
+
+    drag: drag coefficient over mass (1/m), 0.5 * rho * Cd * A / m.
+    wind: mean horizontal wind (m/s), positive blows towards the target.
+    wind_std: std of a per-shot wind gust added to `wind`.
+    launch_height: height of the muzzle above the ground (m).
+    noise_std: std of white noise added to the landing distance (m).
+    rng: seed or Generator of the gusts and the noise, the envs replace it with a stream of their own seed.
+    """
+
+    def __init__(self, drag=2e-4, wind=0.0, wind_std=0.0, launch_height=1.0, noise_std=0.0,
+                 dt=0.02, method='rk4', max_steps=10000, rng=None):
+        if method not in ('rk4', 'semi_implicit'):
+            raise ValueError("Unknown method '{}', expected 'rk4' or 'semi_implicit'".format(method))
+        self.drag = drag
+        self.wind = wind
+        self.wind_std = wind_std
+        self.launch_height = launch_height
+        self.noise_std = noise_std
+        self.dt = dt
+        self.method = method
+        self.max_steps = max_steps
+        self.rng = make_rng(rng)
+
+    def _acceleration(self, vx, vy, wind):
+        rx = vx - wind
+        speed = (rx * rx + vy * vy) ** 0.5  # Works on Python floats and arrays alike
+        return -self.drag * speed * rx, -self.drag * speed * vy - GRAVITY
+
+    def _step(self, x, y, vx, vy, wind):
+        dt = self.dt
+        if self.method == 'semi_implicit':
+            ax, ay = self._acceleration(vx, vy, wind)
+            vx = vx + dt * ax
+            vy = vy + dt * ay
+            return x + dt * vx, y + dt * vy, vx, vy
+
+        # Position does not enter the acceleration, so RK4 only needs the velocity stages
+        ax1, ay1 = self._acceleration(vx, vy, wind)
+        vx2, vy2 = vx + 0.5 * dt * ax1, vy + 0.5 * dt * ay1
+        ax2, ay2 = self._acceleration(vx2, vy2, wind)
+        vx3, vy3 = vx + 0.5 * dt * ax2, vy + 0.5 * dt * ay2
+        ax3, ay3 = self._acceleration(vx3, vy3, wind)
+        vx4, vy4 = vx + dt * ax3, vy + dt * ay3
+        ax4, ay4 = self._acceleration(vx4, vy4, wind)
+        x = x + dt / 6 * (vx + 2 * vx2 + 2 * vx3 + vx4)
+        y = y + dt / 6 * (vy + 2 * vy2 + 2 * vy3 + vy4)
+        vx = vx + dt / 6 * (ax1 + 2 * ax2 + 2 * ax3 + ax4)
+        vy = vy + dt / 6 * (ay1 + 2 * ay2 + 2 * ay3 + ay4)
+        return x, y, vx, vy
+
+    def landing_distance(self, speed, angle):
+        speed = np.atleast_1d(np.asarray(speed, dtype=np.float64))
+        angle = np.broadcast_to(np.asarray(angle, dtype=np.float64), speed.shape)
+        n = speed.shape[0]
+        landing = np.zeros(n)
+
+        wind = np.full(n, float(self.wind))
+        if self.wind_std > 0:
+            wind += self.rng.normal(0, self.wind_std, size=n)
+
+        if n == 1:
+            # A single shot (CannonEnv) is integrated on Python floats, NumPy per-call overhead dominates there
+            landing[0] = self._landing_scalar(float(speed[0]), float(angle[0]), float(wind[0]))
+            if self.noise_std > 0:
+                landing += self.rng.normal(0, self.noise_std, size=n)
+            return landing
+
+        # State of the shots still in the air, `active` maps them back to the batch
+        active = np.arange(n)
+        x = np.zeros(n)
+        y = np.full(n, float(self.launch_height))
+        vx = speed * np.cos(angle)
+        vy = speed * np.sin(angle)
+        for _ in range(self.max_steps):
+            if active.size == 0:
+                break
+            x_new, y_new, vx, vy = self._step(x, y, vx, vy, wind)
+            hit = y_new <= 0
+            if hit.any():
+                # Linear interpolation of the ground crossing inside this step
+                frac = y[hit] / np.maximum(y[hit] - y_new[hit], 1e-12)
+                landing[active[hit]] = x[hit] + frac * (x_new[hit] - x[hit])
+                keep = ~hit
+                active, x_new, y_new, vx, vy, wind = active[keep], x_new[keep], y_new[keep], vx[keep], vy[keep], wind[keep]
+            x, y = x_new, y_new
+        landing[active] = x  # Still flying after max_steps, report the last position
+
+        if self.noise_std > 0:
+            landing += self.rng.normal(0, self.noise_std, size=n)
+        return landing
+
+    def _landing_scalar(self, speed, angle, wind):
+        x, y = 0.0, float(self.launch_height)
+        vx, vy = speed * math.cos(angle), speed * math.sin(angle)
+        for _ in range(self.max_steps):
+            x_new, y_new, vx, vy = self._step(x, y, vx, vy, wind)
+            if y_new <= 0:
+                return x + y / max(y - y_new, 1e-12) * (x_new - x)
+            x, y = x_new, y_new
+        return x
+
+
+def make_physics(physics=None, **kwargs):
+    # None or 'analytic' give None, the env's built-in closed-form path,
+    # 'drag' builds DragPhysics(**kwargs) and physics objects pass through
+    if physics is None or physics == 'analytic':
+        return None
+    if physics == 'drag':
+        return DragPhysics(**kwargs)
+    if isinstance(physics, str):
+        raise ValueError("Unknown physics '{}', expected 'analytic' or 'drag'".format(physics))
+    return physics
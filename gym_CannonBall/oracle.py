@@ -0,0 +1,87 @@
+"""
+Analytic oracle for CannonEnv.
+
+The vacuum range is v^2 * sin(2 * angle) / g, so the speed that lands exactly on
+the target is known in closed form. optimal_speed() solves it for whole arrays of
+observations within the action bounds, regret() measures how far an action is from
+the best achievable reward, and OracleGrid caches optimal speeds on a 2-D grid over
+the observation space in a memory-mapped .npy file shared by every process.
+"""
+import os
+
+import numpy as np
+
+from gym_CannonBall.envs.physics import GRAVITY, shot_distance, shot_reward
+
+MIN_SPEED = 0.0
+MAX_SPEED = 100.0
+MAX_ANGLE = np.pi / 2
+MAX_DISTANCE = 1000.0
+
+
+def optimal_speed(angle, distance, low=MIN_SPEED, high=MAX_SPEED):
+    # Speed landing on `distance` at `angle`, clipped to [low, high] when the target is out of reach
+    sin2 = np.sin(2 * np.asarray(angle, dtype=np.float64))
+    distance = np.asarray(distance, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = np.sqrt(np.where(sin2 > 0, distance * GRAVITY / sin2, np.inf))
+    return np.clip(speed, low, high)
+
+
+def optimal_reward(angle, distance):
+    # Best reward CannonEnv can give for this observation
+    speed = optimal_speed(angle, distance)
+    return shot_reward(speed, distance, shot_distance(speed, angle))
+
+
+def regret(angle, distance, speed):
+    # Reward lost against the oracle, no simulation needed
+    speed = np.asarray(speed, dtype=np.float64)
+    return optimal_reward(angle, distance) - shot_reward(speed, distance, shot_distance(speed, angle))
+
+
+class OracleGrid(object):
+    """
+    Bilinearly interpolated lookup table of optimal speeds over [0, pi/2] x [0, 1000].
+
+    The table is computed once and stored as an .npy file in `cache_dir`; later
+    instances, in this or any other process, memory-map the same file read-only.
+    """
+
+    def __init__(self, n_angle=512, n_distance=512, cache_dir=None):
+        self.n_angle = n_angle
+        self.n_distance = n_distance
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'gym_CannonBall')
+        self.path = os.path.join(cache_dir, 'oracle_{}x{}.npy'.format(n_angle, n_distance))
+        if not os.path.exists(self.path):
+            self._build(cache_dir)
+        self.table = np.load(self.path, mmap_mode='r')
+
+    def _build(self, cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+        angle = np.linspace(0, MAX_ANGLE, self.n_angle)
+        distance = np.linspace(0, MAX_DISTANCE, self.n_distance)
+        table = optimal_speed(angle[:, None], distance[None, :]).astype(np.float32)
+        # Write under a per-process name first so concurrent builders never see a partial file
+        tmp = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(tmp, 'wb') as f:
+            np.save(f, table)
+        os.replace(tmp, self.path)
+
+    def lookup(self, angle, distance):
+        # Interpolated optimal speed for arrays of observations
+        x = np.clip(np.asarray(angle, dtype=np.float64) / MAX_ANGLE, 0, 1) * (self.n_angle - 1)
+        y = np.clip(np.asarray(distance, dtype=np.float64) / MAX_DISTANCE, 0, 1) * (self.n_distance - 1)
+        x0 = np.minimum(x.astype(np.int64), self.n_angle - 2)
+        y0 = np.minimum(y.astype(np.int64), self.n_distance - 2)
+        fx = x - x0
+        fy = y - y0
+        t = self.table
+        return ((1 - fx) * (1 - fy) * t[x0, y0] + fx * (1 - fy) * t[x0 + 1, y0]
+                + (1 - fx) * fy * t[x0, y0 + 1] + fx * fy * t[x0 + 1, y0 + 1])
+
+    def __call__(self, obs):
+        # Same as lookup() for an (N, 2) array of [angle, distance] observations, returns (N, 1)
+        obs = np.asarray(obs)
+        return self.lookup(obs[..., 0], obs[..., 1])[..., None]
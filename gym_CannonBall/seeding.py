@@ -0,0 +1,85 @@
+"""
+Random streams of the envs and the training scripts.
+
+Every stream is a np.random.Generator built from a SeedSequence. A run has one
+root seed and spawns independent children from it for its envs, workers and
+exploration noise, so parallel collectors never share a stream and a run with N
+workers is reproduced exactly by its root seed alone:
+
+    env_seed, noise_seed = spawn_seeds(seed, 2)
+    env.reset(seed=env_seed)
+    noise = BlockSampler(make_rng(noise_seed), lambda rng, n: rng.normal(0, noise_std, size=(n, action_dim)))
+
+BlockSampler serves values drawn one per env step from blocks drawn with a
+single Generator call, which removes the per-call overhead from the hot path.
+"""
+import numpy as np
+
+
+def make_rng(seed=None):
+    # Generator from an int or a SeedSequence, None draws fresh entropy and a Generator is returned as is.
+    # An int gives the same stream as gym's seeding.np_random(int)
+    if isinstance(seed, np.random.Generator):
+        return seed
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return np.random.Generator(np.random.PCG64(seed))
+
+
+def spawn_seeds(seed, n):
+    # n independent child SeedSequences of an int or SeedSequence root, the same n for the same root
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return [np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key + (i,), pool_size=seed.pool_size)
+            for i in range(n)]
+
+
+def int_seed(seed):
+    # 32-bit int of an int or SeedSequence, for APIs that only take ints (torch.manual_seed, Box.seed)
+    if isinstance(seed, np.random.SeedSequence):
+        return int(seed.generate_state(1)[0])
+    return int(seed)
+
+
+class BlockSampler(object):
+    """
+    Values used one at a time, drawn `block_size` at once.
+
+    draw(rng, n) returns an array whose first axis has length n, every call of the
+    sampler returns the next entry along that axis. The sequence only depends on the
+    Generator's state and the block size. state_dict() keeps the Generator state the
+    current block was drawn from and the position in it, so a restored sampler
+    continues with exactly the values the saved one would have returned.
+    """
+
+    def __init__(self, rng, draw, block_size=4096):
+        self.rng = rng
+        self.draw = draw
+        self.block_size = block_size
+        self._block = None
+        self._block_state = None
+        self._next = 0
+
+    def __call__(self):
+        if self._block is None or self._next == self.block_size:
+            self._refill()
+        value = self._block[self._next]
+        self._next += 1
+        return value
+
+    def _refill(self):
+        self._block_state = self.rng.bit_generator.state
+        self._block = self.draw(self.rng, self.block_size)
+        self._next = 0
+
+    def state_dict(self):
+        if self._block is None:
+            return {'rng': self.rng.bit_generator.state, 'next': None}
+        return {'rng': self._block_state, 'next': self._next}
+
+    def load_state_dict(self, state):
+        self.rng.bit_generator.state = state['rng']
+        self._block = None
+        if state['next'] is not None:
+            self._refill()
+            self._next = state['next']
@@ -4,6 +4,6 @@ setup(
     name="gym_CannonBall",
     version="0.0.1",
     keywords='gym_CannonBall',
-    packages=['gym_CannonBall'],
+    packages=['gym_CannonBall', 'DDPG'],
     install_requires=["gym"],
 )
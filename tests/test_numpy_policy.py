@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+import torch
+
+from DDPG.DDPG import Actor
+from DDPG.normalization import Normalizer
+from DDPG.numpy_policy import ActorPolicy, export_actor
+
+MAX_ACTION = 100.0
+
+
+def random_states(n, seed=0):
+    # [angle, distance] rows over the CannonEnv observation range
+    rng = np.random.default_rng(seed)
+    return np.stack([rng.uniform(0, np.pi/2, n), rng.uniform(10, 1000, n)], axis=1).astype(np.float32)
+
+
+@pytest.fixture
+def actor():
+    torch.manual_seed(0)
+    return Actor(2, 1, 32, MAX_ACTION)
+
+
+def assert_matches(policy, expected, s):
+    np.testing.assert_allclose(policy(s), expected, rtol=1e-5, atol=1e-5 * MAX_ACTION)
+
+
+def test_export_matches_torch_actor(actor, tmp_path):
+    policy = export_actor(actor, str(tmp_path / 'actor.npz'))
+    s = random_states(1000)
+    with torch.no_grad():
+        expected = actor(torch.tensor(s)).numpy()
+    assert_matches(policy, expected, s)
+    assert_matches(ActorPolicy.load(str(tmp_path / 'actor.npz')), expected, s)
+    assert policy(s[0]).shape == (1,)
+
+
+def test_export_state_dict_needs_max_action(actor, tmp_path):
+    with pytest.raises(ValueError):
+        export_actor(actor.state_dict(), str(tmp_path / 'actor.npz'))
+    policy = export_actor(actor.state_dict(), str(tmp_path / 'actor.npz'), max_action=MAX_ACTION)
+    s = random_states(100)
+    with torch.no_grad():
+        assert_matches(policy, actor(torch.tensor(s)).numpy(), s)
+
+
+def test_export_folds_normalizer(actor, tmp_path):
+    normalizer = Normalizer(2)
+    normalizer.update(random_states(5000, seed=1), np.zeros(5000), np.zeros(5000))
+    policy = export_actor(actor, str(tmp_path / 'actor.npz'), normalizer=normalizer)
+    s = random_states(1000)
+    with torch.no_grad():
+        expected = actor(torch.from_numpy(normalizer.normalize_obs(s))).numpy()
+    assert_matches(policy, expected, s)